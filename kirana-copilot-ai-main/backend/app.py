@@ -4,61 +4,1015 @@ Uses local models - 100% FREE, no API keys!
 Supports both image and PDF invoice analysis
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-import base64
-import io
+import atexit
+import contextlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FuturesTimeoutError
 from datetime import datetime
 from PIL import Image
-from pdf2image import convert_from_bytes
+from werkzeug.exceptions import RequestEntityTooLarge
 
 # Import OCR engine
 from invoice_analyzer import InvoiceAnalyzer
+from invoice_store import InvoiceStore, confidence_band
+from layout_templates import LayoutTemplates
+from cpu_scheduler import CPUScheduler
+from dedup import HashIndex, phash
+from gstr1 import FLAT_CSV_HEADER, GSTR1Return, flat_csv_row
+from ocr_batch import PageBatcher, split_result
+from ocr_cache import OCRCache, cache_version, completed_future, file_digest, page_key
+from ocr_pool import OCRWorkerPool
+from jobs import JobStore, format_ndjson, format_sse
+from pdf_text import extract_text_layer
+from pdf_pages import PDFPageSource, parse_page_range, select_pages
+from preprocess import ImagePreprocessor
+from telemetry import (
+    ANALYZE_SECONDS,
+    DUPLICATES,
+    ERRORS,
+    INVOICE_CONFIDENCE,
+    LAYOUT_TEMPLATE_EVENTS,
+    OCR_LINE_CONFIDENCE,
+    OCR_PROFILE_PAGES,
+    PAGES,
+    STAGE_SECONDS,
+    CallbackMetric,
+    log,
+    observe_stages,
+    render_metrics,
+)
+from uploads import upload_from_stream, uploads_from_json, uploads_from_multipart
+
+STARTED_AT = time.time()  # startup timings in /ready are measured from here
+
+# OCR result cache (identical uploads skip OCR)
+OCR_CACHE_DIR = os.environ.get(
+    "OCR_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".ocr_cache"),
+)
+OCR_CACHE_MAX_MB = int(os.environ.get("OCR_CACHE_MAX_MB", "512"))
+
+# OCR worker processes (0 = run OCR inside the request thread)
+CPU_COUNT = os.cpu_count() or 1
+OCR_WORKERS = int(os.environ.get("OCR_WORKERS", str(max(1, CPU_COUNT // 2))))
+OCR_TORCH_THREADS = int(
+    os.environ.get("OCR_TORCH_THREADS", str(max(1, CPU_COUNT // max(1, OCR_WORKERS))))
+)
+# Longest wait for one page's OCR result; the page is then answered as an error (0 = no limit)
+OCR_TIMEOUT_SECONDS = int(os.environ.get("OCR_TIMEOUT_SECONDS", "300"))
+
+# CPU threads shared by all OCR jobs; each job gets a share sized by the queue
+# and jobs beyond OCR_MAX_RUNNING (or with no threads left) wait their turn
+OCR_CPU_BUDGET = int(os.environ.get("OCR_CPU_BUDGET", str(CPU_COUNT)))
+OCR_MAX_RUNNING = int(os.environ.get("OCR_MAX_RUNNING", str(OCR_WORKERS or 2)))
+
+# Pages per OCR batch: similar-sized pages of one request are detected together
+# and each worker gets a whole batch (1 = page by page)
+OCR_BATCH_SIZE = int(os.environ.get("OCR_BATCH_SIZE", "4"))
+
+# Recognize only the header and totals of each page (full page as fallback); off by default
+OCR_ROI = os.environ.get("OCR_ROI", "0").lower() not in ("0", "false", "no")
+# How the OCR networks run: "easyocr" (PyTorch), "onnx" or "onnx-int8" (ONNX Runtime)
+OCR_BACKEND = os.environ.get("OCR_BACKEND", "easyocr").lower()
+# Hindi model: "auto" (only for Devanagari / low-confidence lines), "always" or "never"
+OCR_HINDI = os.environ.get("OCR_HINDI", "auto").lower()
+# OCR profile: "accurate" (the default) or "fast" always; "cascade" reads every
+# page with "fast" (downscaled, English only) and again with "accurate" only when
+# the total or GSTIN is missing or the confidence is below OCR_CASCADE_MIN_CONFIDENCE
+OCR_PROFILE = os.environ.get("OCR_PROFILE", "accurate").lower()
+OCR_CASCADE_MIN_CONFIDENCE = float(os.environ.get("OCR_CASCADE_MIN_CONFIDENCE", "0.7"))
+# Read the line-item table of every page too (invoice "items", HSN-wise GSTR-1):
+# pages are OCR'd in full, without the header/totals-only or template shortcuts
+OCR_LINE_ITEMS = os.environ.get("OCR_LINE_ITEMS", "0").lower() not in ("0", "false", "no")
+# Per-supplier layout templates (SQLite, shared by the OCR workers): pages from a
+# known GSTIN only have that supplier's field regions read; empty = off
+LAYOUT_TEMPLATES = os.environ.get(
+    "LAYOUT_TEMPLATES",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "layout_templates.db"),
+)
+
+# Models load in the background after startup; /ready reports when they are up
+# OCR_MODEL_DIR: pre-seeded EasyOCR weights (see fetch_models.py) - no downloads at runtime
+OCR_MODEL_DIR = os.environ.get("OCR_MODEL_DIR") or None
+OCR_WARMUP = os.environ.get("OCR_WARMUP", "1").lower() not in ("0", "false", "no")
+
+# Image preprocessing before OCR (shrink, grayscale, straighten, trim); off by default
+PREPROCESS = os.environ.get("PREPROCESS", "0").lower() not in ("0", "false", "no")
+PREPROCESS_MAX_SIDE = int(os.environ.get("PREPROCESS_MAX_SIDE", "2000"))
+PREPROCESS_MAX_DPI = int(os.environ.get("PREPROCESS_MAX_DPI", "300"))
+PREPROCESS_DESKEW = os.environ.get("PREPROCESS_DESKEW", "1").lower() not in ("0", "false", "no")
+
+# PDF rendering: pages are rasterized lazily, a few at a time
+PDF_DPI = int(os.environ.get("PDF_DPI", "200"))  # 200 DPI for better OCR
+PDF_RENDER_WINDOW = int(os.environ.get("PDF_RENDER_WINDOW", "2"))
+PDF_MAX_INFLIGHT_PAGES = int(
+    os.environ.get("PDF_MAX_INFLIGHT_PAGES", str(max(2, OCR_WORKERS * 2)))
+)
+
+# Async /analyze jobs (threads only decode and queue pages - OCR runs in the pool)
+JOB_THREADS = int(os.environ.get("JOB_THREADS", "2"))
+JOB_TTL_SECONDS = int(os.environ.get("JOB_TTL_SECONDS", "3600"))
+# SQLite file the jobs are also kept in, so any process can answer /jobs/<id>
+# (serve.py sets one for its workers); empty = in memory, this process only
+JOB_DB = os.environ.get("JOB_DB", "")
+
+# Request bodies over this size get 413 (0 = no limit)
+MAX_UPLOAD_MB = int(os.environ.get("MAX_UPLOAD_MB", "100"))
+
+# The shop's own GSTIN: GSTR-1 return header and place of supply of B2C sales;
+# layout templates never take it for a supplier's
+SHOP_GSTIN = os.environ.get("SHOP_GSTIN", "")
+
+# Analyzed invoices are saved here (SQLite); empty = don't keep them
+INVOICE_DB = os.environ.get(
+    "INVOICE_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "invoices.db"),
+)
+
+# Duplicate uploads (one invoice photographed twice, or as photo and PDF) are
+# matched against stored invoices by page hash and by (GSTIN, invoice no, total):
+# "flag" them but still OCR (the default), "reuse" the earlier extraction (no OCR),
+# or "off". Duplicates are never stored twice. Needs the invoice store.
+DEDUP = os.environ.get("DEDUP", "flag").lower()
+DEDUP_MAX_DISTANCE = int(os.environ.get("DEDUP_MAX_DISTANCE", "16"))  # differing bits of 256
 
 app = Flask(__name__)
 CORS(app)  # Allow requests from React frontend
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_MB * 1024 * 1024 or None
+
+# InvoiceAnalyzer settings, shared by the in-process analyzer and the OCR workers
+ANALYZER_OPTIONS = {
+    "roi": OCR_ROI,
+    "model_dir": OCR_MODEL_DIR,
+    "hindi": OCR_HINDI,
+    "batch_size": OCR_BATCH_SIZE,
+    "backend": OCR_BACKEND,
+    "profile": OCR_PROFILE,
+    "min_confidence": OCR_CASCADE_MIN_CONFIDENCE,
+    "templates": LAYOUT_TEMPLATES or None,
+    "line_items": OCR_LINE_ITEMS,
+    "shop_gstin": SHOP_GSTIN,
+}
+
+# Set up by init_app(): the analyzer (with OCR_WORKERS=0 it runs OCR too; its
+# model is loaded by start_warmup() or the first OCR call, never at import),
+# the OCR cache, invoice store, CPU scheduler, executors and job store
+analyzer = None
+preprocessor = None
+ocr_cache = None
+OCR_CACHE_VERSION = None
+invoice_store = None
+dedup_enabled = False
+cpu_scheduler = None
+ocr_executor = None
+job_store = None
+job_executor = None
+
+
+def init_app():
+    """
+    Open the stores and start the executors the server uses. Runs when this
+    module is imported (by serve.py, ingest.py or a WSGI server) - except in
+    spawned OCR workers, which re-import the started script as __mp_main__
+    and only need ocr_pool's worker entry point
+    """
+    global analyzer, preprocessor, ocr_cache, OCR_CACHE_VERSION, invoice_store, dedup_enabled
+    global cpu_scheduler, ocr_executor, job_store, job_executor
+    analyzer = InvoiceAnalyzer(load_model=False, **ANALYZER_OPTIONS)
+
+    preprocessor = ImagePreprocessor(
+        max_side=PREPROCESS_MAX_SIDE,
+        max_dpi=PREPROCESS_MAX_DPI,
+        orient=PREPROCESS_DESKEW,
+        deskew=PREPROCESS_DESKEW,
+    )
+
+    ocr_cache = OCRCache(OCR_CACHE_DIR, max_bytes=OCR_CACHE_MAX_MB * 1024 * 1024)
+    # Cached pages are only reused with the same settings and page-reading code
+    # (where the models live and how pages are batched don't change the result)
+    OCR_CACHE_VERSION = cache_version(
+        {
+            **{key: value for key, value in ANALYZER_OPTIONS.items() if key not in ("model_dir", "batch_size")},
+            "preprocess": [PREPROCESS, PREPROCESS_MAX_SIDE, PREPROCESS_MAX_DPI, PREPROCESS_DESKEW],
+            "pdfDpi": PDF_DPI,
+        },
+        [
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), f"{module}.py")
+            for module in (
+                "invoice_analyzer", "text_layout", "line_items", "layout_templates", "gstin", "ocr_backends",
+                "preprocess",
+            )
+        ],
+    )
+
+    invoice_store = InvoiceStore(INVOICE_DB) if INVOICE_DB else None
+    dedup_enabled = DEDUP in ("reuse", "flag") and invoice_store is not None
+
+    cpu_scheduler = CPUScheduler(OCR_CPU_BUDGET, max_running=OCR_MAX_RUNNING)
+    # In-process OCR (OCR_WORKERS=0) runs here, at most OCR_MAX_RUNNING at a time
+    ocr_executor = ThreadPoolExecutor(max_workers=max(1, OCR_MAX_RUNNING), thread_name_prefix="ocr")
+
+    job_store = JobStore(ttl=JOB_TTL_SECONDS, path=JOB_DB or None)
+    job_executor = ThreadPoolExecutor(max_workers=JOB_THREADS, thread_name_prefix="analyze-job")
+
+
+if __name__ != "__mp_main__":
+    init_app()
+
+_ocr_pool = None
+_ocr_pool_lock = threading.Lock()
+
+# Set by serve.py in its worker processes: () -> dict for /health "server"
+server_stats = None
+
+
+def init_serving_worker(cpu_budget):
+    """
+    Set up a serve.py worker right after the fork: fresh SQLite connections
+    (a connection must not be used across a fork) and the worker's share of
+    the CPU thread budget
+    """
+    global invoice_store, cpu_scheduler, job_store
+    if invoice_store is not None:
+        invoice_store = InvoiceStore(INVOICE_DB)
+    job_store = JobStore(ttl=JOB_TTL_SECONDS, path=JOB_DB or None)
+    if analyzer.templates is not None:
+        analyzer.templates = LayoutTemplates(analyzer.templates.path, analyzer.templates.max_templates)
+    cpu_scheduler = CPUScheduler(cpu_budget, max_running=OCR_MAX_RUNNING)
+
+
+def get_ocr_pool():
+    """
+    Start the worker pool on first use
+    (not at import, so the debug reloader's parent process never spawns one)
+    """
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is None:
+            log.info(f"🚀 Starting {OCR_WORKERS} OCR worker(s), {OCR_TORCH_THREADS} torch thread(s) each...")
+            _ocr_pool = OCRWorkerPool(
+                OCR_WORKERS,
+                torch_threads=OCR_TORCH_THREADS,
+                analyzer_options=ANALYZER_OPTIONS,
+                warm_up=OCR_WARMUP,
+            )
+            atexit.register(_ocr_pool.shutdown)
+        return _ocr_pool
+
+
+startup = {
+    "status": "starting",  # starting -> loading -> ready | failed
+    "error": None,
+    "readySeconds": None,  # process start -> models loaded (and warmed up)
+    "firstAnalyzeSeconds": None,  # process start -> first successful /analyze
+}
+_warmup_thread = None
+_startup_lock = threading.Lock()
+
+
+def _warm_up():
+    """Load the OCR models (in-process reader or worker pool) and mark the server ready"""
+    get_page_hashes()
+    try:
+        if OCR_WORKERS == 0:
+            analyzer.load_model()
+            if OCR_WARMUP:
+                log.info(f"🔥 Warm-up OCR pass took {analyzer.warm_up():.1f}s")
+        else:
+            pool = get_ocr_pool()
+            while pool.ready_workers == 0:
+                stats = pool.get_stats()
+                if stats["broken"]:
+                    raise RuntimeError(stats["broken"])
+                time.sleep(0.2)
+        with _startup_lock:
+            startup["status"] = "ready"
+            startup["readySeconds"] = round(time.time() - STARTED_AT, 2)
+        log.info(f"✅ Models ready after {startup['readySeconds']}s")
+    except Exception as e:
+        log.error(f"❌ Model loading failed: {e}")
+        with _startup_lock:
+            startup["status"] = "failed"
+            startup["error"] = str(e)
+
+
+def start_warmup():
+    """Start loading models in the background (once; later calls do nothing)"""
+    global _warmup_thread
+    with _startup_lock:
+        if _warmup_thread is not None:
+            return
+        startup["status"] = "loading"
+        _warmup_thread = threading.Thread(target=_warm_up, name="model-warmup", daemon=True)
+    _warmup_thread.start()
+
+
+def is_ready():
+    if startup["status"] != "ready":
+        return False
+    return not (_ocr_pool and _ocr_pool.get_stats()["broken"])
+
+
+class PageRef:
+    """
+    A hashed page in the duplicate index: the invoice it became (once
+    resolved) or, while its OCR is still running, the Future of its record
+    and a `resolved` Future set once resolve_invoice has given it an invoice id
+    """
+
+    __slots__ = ("invoice_id", "future", "resolved")
+
+    def __init__(self, invoice_id=None, future=None, resolved=None):
+        self.invoice_id = invoice_id
+        self.future = future
+        self.resolved = resolved
+
+
+_page_hashes = None
+_page_hashes_rowid = 0  # last invoice store row read into _page_hashes
+_page_hashes_lock = threading.Lock()
+# Duplicate check + save must not interleave (async jobs resolve concurrently)
+_dedup_lock = threading.Lock()
+
 
-# Initialize analyzer (loads model on startup)
-print("🚀 Loading AI models... (this may take 1-2 minutes first time)")
-analyzer = InvoiceAnalyzer()
-print("✅ Models loaded successfully!")
+def get_page_hashes():
+    """
+    The page hash index, filled from the invoice store on first use and then
+    topped up with the pages other processes (serve.py workers, ingest) saved
+    """
+    global _page_hashes, _page_hashes_rowid
+    if not dedup_enabled:
+        return None
+    with _page_hashes_lock:
+        loading = _page_hashes is None
+        if loading:
+            start = time.perf_counter()
+            _page_hashes = HashIndex(DEDUP_MAX_DISTANCE)
+        for rowid, invoice_id, page_hash in invoice_store.iter_page_hashes(after=_page_hashes_rowid):
+            page_hash = int(page_hash, 16)
+            # Pages saved by this process (or re-saved by a correction) are indexed already
+            if loading or not any(ref.invoice_id == invoice_id for _, ref in _page_hashes.search(page_hash, 0)):
+                _page_hashes.add(page_hash, PageRef(invoice_id))
+            _page_hashes_rowid = rowid
+        if loading:
+            log.info(f"🔎 Loaded {len(_page_hashes)} page hash(es) in {time.perf_counter() - start:.1f}s")
+        return _page_hashes
+
+
+def record_first_analyze():
+    with _startup_lock:
+        if startup["firstAnalyzeSeconds"] is None:
+            startup["firstAnalyzeSeconds"] = round(time.time() - STARTED_AT, 2)
+            log.info(f"⏱️  First analysis finished {startup['firstAnalyzeSeconds']}s after startup")
+
+
+def prepare_page(image, timings=None):
+    """Preprocess a page for OCR (or just make it RGB when PREPROCESS is off)"""
+    if not PREPROCESS:
+        return image if image.mode == "RGB" else image.convert("RGB")
+
+    image, timings = preprocessor.process(image, timings)
+    steps = ", ".join(f"{step} {ms}ms" for step, ms in timings.items())
+    log.debug(f"      Preprocessed to {image.size[0]}x{image.size[1]} {image.mode} ({steps})")
+    return image
+
+
+def open_image(upload, timings=None):
+    """Decode an uploaded image, at reduced scale for big JPEGs when preprocessing"""
+    if PREPROCESS:
+        return preprocessor.open(upload.open(), timings)
+    start = time.perf_counter()
+    image = Image.open(upload.open())
+    image.load()
+    if timings is not None:
+        timings["decode"] = round((time.perf_counter() - start) * 1000, 1)
+    return image
+
+
+# OCR runs per model: pages that needed it and lines it read
+language_usage = {"en": {"pages": 0, "lines": 0}, "hi": {"pages": 0, "lines": 0}}
+_language_usage_lock = threading.Lock()
+
+
+def record_language_usage(future):
+    """Done-callback for a page's OCR Future: count lines read per model"""
+    if future.cancelled() or future.exception() is not None:
+        return
+    languages = future.result()["ocr"].get("languages") or {}
+    with _language_usage_lock:
+        for language, lines in languages.items():
+            if lines:
+                usage = language_usage.setdefault(language, {"pages": 0, "lines": 0})
+                usage["pages"] += 1
+                usage["lines"] += lines
+
+
+def record_page_metrics(future, timings):
+    """
+    Done-callback for a page's OCR Future: stage latencies and line confidences
+    timings holds the decode / preprocessing milliseconds measured here; the
+    OCR stages (seconds) come back in the record from wherever OCR ran
+    """
+    if future.cancelled() or future.exception() is not None:
+        return
+    record = future.result()
+    stages = {"decode": timings.pop("decode", 0) / 1000} if "decode" in timings else {}
+    if timings:
+        stages["preprocess"] = sum(timings.values()) / 1000
+    stages.update(record.get("timings") or {})
+    observe_stages(stages)
+    OCR_PROFILE_PAGES.inc(
+        profile=record["invoice"].get("ocrProfile", OCR_PROFILE),
+        escalated="true" if record.get("escalated") else "false",
+    )
+    if record.get("template"):
+        LAYOUT_TEMPLATE_EVENTS.inc(event=record["template"])
+    for _, confidence in record["ocr"]["lines"]:
+        OCR_LINE_CONFIDENCE.observe(confidence)
+
+
+def get_profile_stats():
+    """OCR profile settings and how many OCR'd pages the cascade escalated"""
+    pages = escalated = 0
+    for _, labels, count in OCR_PROFILE_PAGES.samples():
+        pages += count
+        if dict(labels)["escalated"] == "true":
+            escalated += count
+    return {
+        "profile": OCR_PROFILE,
+        "minConfidence": OCR_CASCADE_MIN_CONFIDENCE if OCR_PROFILE == "cascade" else None,
+        "pages": pages,
+        "escalated": escalated,
+        "escalationRate": round(escalated / pages, 3) if pages else None,
+    }
+
+
+def run_ocr_batch(images):
+    """
+    PageBatcher backend: OCR prepared pages together once the CPU scheduler
+    admits the batch; returns one Future per page
+    """
+    return cpu_scheduler.schedule(lambda threads: start_ocr_batch(images, threads), len(images))
+
+
+def start_ocr_batch(images, threads):
+    """Start an admitted batch with its thread allotment (must not block)"""
+    if OCR_WORKERS == 0:
+        return split_result(ocr_executor.submit(analyzer.analyze_images, images, threads), len(images))
+    return get_ocr_pool().submit_batch(images, threads=threads)
+
+
+def submit_page(load_image, digest, page_index=0, timings=None, batcher=None):
+    """
+    Queue one page for OCR through the cache
+    load_image() returns the page as a PIL Image; it is only called on a cache miss
+    Cache key is the hash of the decoded file bytes, the page index and OCR_CACHE_VERSION
+    With a PageBatcher the page joins its next batch instead of running alone
+    Returns a Future resolving to { "ocr": ..., "invoice": ..., "timings": ... }
+    """
+    timings = {} if timings is None else timings
+    key = page_key(digest, page_index, OCR_CACHE_VERSION)
+    prepared = []
+
+    def load_prepared():
+        return prepared.pop() if prepared else prepare_page(load_image(), timings)
+
+    def submit():
+        if batcher is not None:
+            future = batcher.add(load_prepared)
+        else:
+            future = run_ocr_batch([load_prepared()])[0]
+        future.add_done_callback(record_language_usage)
+        future.add_done_callback(lambda future: record_page_metrics(future, timings))
+        return future
+
+    page_hashes = get_page_hashes()
+    if page_hashes is None or key in ocr_cache:
+        return ocr_cache.get_or_submit(key, submit)
+
+    # Hash the prepared page - trimming and deskewing line up two photos of one invoice
+    image = load_prepared()
+    prepared.append(image)
+    start = time.perf_counter()
+    page_hash = phash(image)
+    STAGE_SECONDS.observe(time.perf_counter() - start, stage="hash")
+
+    if page_hash is None:
+        return ocr_cache.get_or_submit(key, submit)
+
+    duplicate = find_image_duplicate(page_hashes, page_hash)
+    if duplicate is not None:
+        distance, source = duplicate
+        if DEDUP == "reuse":
+            DUPLICATES.inc(match="image", action="reused")
+            return reuse_invoice(source, distance)
+        future = after_resolved(ocr_cache.get_or_submit(key, submit), source)
+        return annotate_record(future, pageHash=page_hash, duplicate=(distance, source, False))
+
+    future = ocr_cache.get_or_submit(key, submit)
+    ref = PageRef(future=future, resolved=Future())
+    page_hashes.add(page_hash, ref)
+    annotated = annotate_record(future, pageHash=page_hash)
+    annotated.page_ref = ref  # released by resolve_invoice, also if the OCR fails
+    return annotated
+
+
+def find_image_duplicate(page_hashes, page_hash):
+    """(distance, PageRef) of the nearest earlier page that still resolves to an invoice"""
+    for distance, ref in page_hashes.search(page_hash):
+        future = ref.future
+        if future is not None:
+            if not future.done() or future.exception() is None:
+                return distance, ref
+        elif ref.invoice_id and invoice_store.get(ref.invoice_id):
+            return distance, ref
+    return None
+
+
+def after_resolved(future, source):
+    """
+    future, but done only once the earlier copy (PageRef) of a duplicate has
+    its invoice id - pages finish OCR in any order, the copy must not be
+    resolved against a still pending original
+    """
+    resolved = source.resolved
+    if resolved is None:
+        return future
+    chained = Future()
+
+    def done(_):
+        if future.exception() is not None:
+            chained.set_exception(future.exception())
+        else:
+            chained.set_result(future.result())
+
+    resolved.add_done_callback(lambda _: future.add_done_callback(done))
+    return chained
+
+
+def annotate_record(future, **extra):
+    """A Future for future's record with extra keys (the shared cached record is not changed)"""
+    annotated = Future()
+
+    def done(source):
+        if source.exception() is not None:
+            annotated.set_exception(source.exception())
+        else:
+            annotated.set_result({**source.result(), **extra})
+
+    future.add_done_callback(done)
+    return annotated
+
+
+def reuse_invoice(source, distance):
+    """Answer a near-duplicate page with the invoice its earlier copy produced"""
+    future = source.future
+    if future is None:
+        invoice = invoice_store.get(source.invoice_id) or {}
+        for field in ("id", "pageHash", "duplicateOf"):
+            invoice.pop(field, None)
+        future = completed_future(lambda: {"invoice": invoice})
+    return annotate_record(after_resolved(future, source), duplicate=(distance, source, True))
+
+
+def error_invoice(vendor, invoice_no, confidence):
+    """Placeholder row for a file or page that could not be analyzed"""
+    # "PDF conversion error" -> errors_total{kind="pdf_conversion"}
+    kind = vendor.lower()
+    if kind.endswith(" error"):
+        kind = kind[: -len(" error")]
+    ERRORS.inc(kind=kind.replace(" ", "_"))
+    return {
+        "vendor": vendor,
+        "gstin": "N/A",
+        "invoiceNo": invoice_no,
+        "date": datetime.now().strftime("%d-%m-%Y"),
+        "taxableAmount": 0,
+        "cgst": 0,
+        "sgst": 0,
+        "igst": 0,
+        "total": 0,
+        "confidence": confidence,
+    }
 
 
 @app.route("/health", methods=["GET"])
 def health_check():
-    """Health check endpoint"""
+    """Liveness: the server is up (models may still be loading - see /ready)"""
     return jsonify(
         {
             "status": "ok",
             "message": "Invoice OCR Backend Running",
+            "ready": is_ready(),
             "model": "EasyOCR + Transformers",
-            "formats": "Images (JPG, PNG) and PDFs"
+            "ocrBackend": OCR_BACKEND,
+            "ocrProfile": get_profile_stats(),
+            "layoutTemplates": analyzer.templates.get_stats() if analyzer.templates else None,
+            "formats": "Images (JPG, PNG) and PDFs",
+            "cache": ocr_cache.get_stats(),
+            "workers": _ocr_pool.get_stats() if _ocr_pool else None,
+            "scheduler": cpu_scheduler.get_stats(),
+            "jobs": job_store.get_stats(),
+            "invoiceStore": invoice_store.get_stats() if invoice_store else None,
+            "dedup": {
+                "mode": DEDUP if dedup_enabled else "off",
+                "pageHashes": len(_page_hashes) if _page_hashes is not None else None,
+            },
+            "ocrLanguages": language_usage,
+            "server": server_stats() if server_stats else None,
         }
     )
 
 
-def convert_pdf_to_images(pdf_base64):
+# Counters kept by the cache, worker pool and scheduler, read at scrape time
+CallbackMetric(
+    "invoice_ocr_cache_events_total",
+    "OCR cache lookups by outcome",
+    "counter",
+    lambda: {
+        (event,): ocr_cache.get_stats()[event] for event in ("hits", "misses", "dedup_waits", "evictions")
+    },
+    labels=("event",),
+)
+CallbackMetric(
+    "invoice_ocr_lines_total",
+    "Text lines read per OCR model",
+    "counter",
+    lambda: {(language,): usage["lines"] for language, usage in language_usage.items()},
+    labels=("language",),
+)
+CallbackMetric(
+    "invoice_scheduler_jobs",
+    "OCR jobs running or waiting for CPU threads",
+    "gauge",
+    lambda: {(state,): cpu_scheduler.get_stats()[state] for state in ("running", "waiting")},
+    labels=("state",),
+)
+CallbackMetric(
+    "invoice_scheduler_threads_in_use",
+    "CPU threads allotted to running OCR jobs",
+    "gauge",
+    lambda: {(): cpu_scheduler.get_stats()["threadsInUse"]},
+)
+CallbackMetric(
+    "invoice_scheduler_admissions_total",
+    "OCR jobs started, by the thread count they were given",
+    "counter",
+    lambda: {(threads,): jobs for threads, jobs in cpu_scheduler.get_stats()["allocations"].items()},
+    labels=("threads",),
+)
+CallbackMetric(
+    "invoice_ocr_workers_ready",
+    "OCR worker processes with models loaded",
+    "gauge",
+    lambda: {(): _ocr_pool.get_stats()["readyWorkers"] if _ocr_pool else None},
+)
+
+
+@app.errorhandler(RequestEntityTooLarge)
+def upload_too_large(e):
+    return jsonify({"error": f"Request body over the {MAX_UPLOAD_MB} MB limit (MAX_UPLOAD_MB)"}), 413
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus scrape endpoint: stage latencies, pages, errors, confidences"""
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/ready", methods=["GET"])
+def readiness_check():
     """
-    Convert PDF base64 to list of PIL Images
-    Handles multi-page PDFs by converting each page to an image
+    Readiness: 200 once the OCR models are loaded, 503 while loading or if
+    they failed. Also reports startup timings.
     """
+    start_warmup()
+    ready = is_ready()
+    body = {"ready": ready, **startup}
+    if startup["status"] == "ready" and not ready:
+        body["status"] = "failed"
+        body["error"] = _ocr_pool.get_stats()["broken"]
+    return jsonify(body), 200 if ready else 503
+
+
+def analyze_text_page(text_page):
+    """Parse a PDF page's text layer (no OCR) and record its parse timings"""
+    record = analyzer.analyze_text_layer(text_page)
+    observe_stages(record["timings"])
+    return record
+
+
+def wait_for_capacity(inflight, limit):
+    """Block until fewer than limit Futures are pending; returns the pending ones"""
+    inflight = [f for f in inflight if not f.done()]
+    if len(inflight) >= limit:
+        wait(inflight, return_when=FIRST_COMPLETED)
+        inflight = [f for f in inflight if not f.done()]
+    return inflight
+
+
+def queue_uploads(files, page_ranges=None):
+    """
+    Decode uploaded files (UploadedFile list) and queue every page for OCR
+    page_ranges (from parse_page_range) limits which PDF pages are analyzed
+    Yields (index, item, label) per output invoice, in upload order:
+    item is a Future for queued pages (label names the page for error rows)
+    or a ready error dict (label is None)
+    Pages that need OCR are batched (OCR_BATCH_SIZE) across all files
+    """
+    batcher = PageBatcher(run_ocr_batch, OCR_BATCH_SIZE)
+
     try:
-        # Remove data URL prefix if present
-        if "," in pdf_base64:
-            pdf_base64 = pdf_base64.split(",")[1]
+        yield from _queue_files(files, page_ranges, batcher)
+    finally:
+        # Start the last partial batch (also when the caller stops early -
+        # the cache's in-flight entries must still resolve)
+        batcher.flush()
 
-        # Decode base64 PDF
-        pdf_data = base64.b64decode(pdf_base64)
-        
-        # Convert PDF pages to images
-        images = convert_from_bytes(pdf_data, dpi=200)  # 200 DPI for better OCR
-        
-        print(f"   Converted PDF to {len(images)} page(s)")
+
+def _queue_files(files, page_ranges, batcher):
+    """queue_uploads body; OCR pages go through batcher"""
+    index = 0
+    total_files = len(files)
+
+    for file_idx, upload in enumerate(files):
+        log.debug(f"\n📄 Processing file {file_idx + 1}/{total_files}...")
         
-        return images
+        try:
+            # Single buffer reused for sniffing, hashing and decoding
+            file_data = upload.load()
+            digest = file_digest(file_data)
+            
+            if upload.is_pdf:
+                log.debug(f"   📄 Type: PDF - Reading pages...")
+
+                # Pages from billing software carry real text - no OCR needed
+                page_count, text_pages = extract_text_layer(upload.open(), page_ranges)
+                if text_pages:
+                    log.debug(f"   📝 Text layer found on {len(text_pages)} page(s) - skipping OCR for those")
+                
+                try:
+                    source = None
+                    if page_count is None or len(text_pages) < len(select_pages(page_ranges, page_count)):
+                        # Some pages are scanned images - they need rasterizing
+                        source = PDFPageSource(file_data, dpi=PDF_DPI)
+                        page_count = source.page_count
+                    page_indices = select_pages(page_ranges, page_count)
+                    log.debug(f"   PDF has {page_count} page(s), analyzing {len(page_indices)}")
+                except Exception as e:
+                    log.warning(f"   ❌ PDF conversion error: {e}")
+                    index += 1
+                    yield index, error_invoice("PDF conversion error", f"PDF_{file_idx + 1}", 0.1), None
+                    continue
+
+                with source or contextlib.nullcontext():
+                    if source is None:
+                        pages = ((i, None) for i in page_indices)
+                    else:
+                        # Render lazily, a few pages ahead of OCR; cached and text pages are not rendered
+                        pages = source.iter_pages(
+                            page_indices,
+                            window=PDF_RENDER_WINDOW,
+                            skip=lambda i: i in text_pages or page_key(digest, i, OCR_CACHE_VERSION) in ocr_cache,
+                        )
+                    inflight = []
+                    try:
+                        # Process each page as a separate invoice
+                        for page_num, page_image in pages:
+                            if page_num in text_pages:
+                                index += 1
+                                yield index, completed_future(
+                                    lambda page_num=page_num: analyze_text_page(text_pages[page_num])
+                                ), f"Page_{page_num + 1}"
+                                continue
+
+                            # Bound the rendered pages waiting for OCR (start
+                            # the queued batch first - it may be what we wait on)
+                            if len(inflight) >= PDF_MAX_INFLIGHT_PAGES:
+                                batcher.flush()
+                            inflight = wait_for_capacity(inflight, PDF_MAX_INFLIGHT_PAGES)
+                            log.debug(f"      Queueing page {page_num + 1}/{page_count}...")
+
+                            load_page = (
+                                (lambda image=page_image: image)
+                                if page_image is not None
+                                else (lambda page_num=page_num: source.render(page_num)[0])
+                            )
+                            # A page skipped as cached but since evicted renders from
+                            # the PDF file - run it now, before the file is removed
+                            future = submit_page(
+                                load_page,
+                                digest,
+                                page_num,
+                                batcher=batcher if page_image is not None else None,
+                            )
+                            inflight.append(future)
+                            index += 1
+                            yield index, future, f"Page_{page_num + 1}"
+                    except Exception as e:
+                        log.warning(f"   ❌ PDF conversion error: {e}")
+                        index += 1
+                        yield index, error_invoice("PDF conversion error", f"PDF_{file_idx + 1}", 0.1), None
+            
+            else:
+                # Process as image
+                log.debug(f"   🖼️  Type: Image - Processing...")
+                
+                try:
+                    # Decode now so bad files fail here, not in OCR
+                    timings = {}
+                    image = open_image(upload, timings)
+                    log.debug(f"      Image size: {image.size}")
+                except Exception as e:
+                    log.warning(f"   ❌ Error decoding image: {e}")
+                    index += 1
+                    yield index, error_invoice("Image decode error", f"Image_{file_idx + 1}", 0.1), None
+                    continue
+
+                index += 1
+                yield index, submit_page(
+                    lambda image=image: image, digest, timings=timings, batcher=batcher
+                ), f"Image_{file_idx + 1}"
+                    
+        except Exception as e:
+            log.warning(f"   ❌ Error processing file: {e}")
+            index += 1
+            yield index, error_invoice("File processing error", f"File_{file_idx + 1}", 0.1), None
+        finally:
+            upload.close()  # pages are decoded - release the buffer / mmap
+
+
+def resolve_invoice(index, item, label):
+    """
+    Wait for one queued page and turn it into the invoice dict for the response
+    Analyzed invoices are saved to the invoice store unless they duplicate one
+    """
+    record = {}
+    if label is None:
+        invoice_data = item
+    else:
+        try:
+            record = item.result(timeout=OCR_TIMEOUT_SECONDS or None)
+            # Copy - concurrent callers for the same page share one record
+            invoice_data = dict(record["invoice"])
+            if "ocr" in record:
+                # Not from the cached record: a date or number the page did not show
+                analyzer.refresh_fallbacks(invoice_data, record["ocr"]["full_text"])
+            log.debug(f"      ✅ Extracted: {invoice_data['vendor']}")
+            log.debug(f"         Confidence: {invoice_data['confidence']:.2f}")
+        except FuturesTimeoutError:
+            log.warning(f"      ❌ No OCR result for {label} after {OCR_TIMEOUT_SECONDS}s")
+            invoice_data = error_invoice("OCR timeout error", label, 0.2)
+        except Exception as e:
+            log.warning(f"      ❌ Analysis error: {e}")
+            invoice_data = error_invoice("Analysis error", label, 0.2)
+
+    PAGES.inc(source=invoice_data.get("source", "error"))
+    INVOICE_CONFIDENCE.observe(invoice_data["confidence"])
+    invoice = {"id": f"inv_{datetime.now().timestamp()}_{index}", **invoice_data}
+    if "pageHash" in record:
+        invoice["pageHash"] = f"{record['pageHash']:064x}"
+
+    with _dedup_lock:
+        duplicate = record.get("duplicate")
+        # An earlier copy that could not be analyzed (never stored) is no original
+        if duplicate is not None and duplicate[1].invoice_id:
+            distance, source, reused = duplicate
+            invoice["duplicateOf"] = {
+                "invoiceId": source.invoice_id,
+                "match": "image",
+                "distance": distance,
+                "reused": reused,
+            }
+            if not reused:
+                DUPLICATES.inc(match="image", action="flagged")
+        elif dedup_enabled and invoice_data.get("source"):
+            same = find_field_duplicate(invoice)
+            if same:
+                invoice["duplicateOf"] = {"invoiceId": same, "match": "fields"}
+                DUPLICATES.inc(match="fields", action="flagged")
+
+        if "duplicateOf" not in invoice:
+            save_invoice(invoice)
+        ref = getattr(item, "page_ref", None)
+        if ref is not None:
+            # Later copies of this page point at the stored invoice (or at the one it duplicates)
+            if "duplicateOf" in invoice:
+                ref.invoice_id = invoice["duplicateOf"]["invoiceId"]
+            elif invoice_data.get("source"):
+                ref.invoice_id = invoice["id"]
+            ref.future = None
+            resolved, ref.resolved = ref.resolved, None
+            resolved.set_result(ref.invoice_id)  # copies waiting in after_resolved go on
+    return invoice
+
+
+def find_field_duplicate(invoice):
+    """Id of a stored invoice with this invoice's GSTIN, number and total"""
+    if "N/A" in (invoice.get("gstin"), invoice.get("invoiceNo")) or not invoice.get("total"):
+        return None
+    return invoice_store.find_same(invoice["gstin"], invoice["invoiceNo"], invoice["total"])
+
+
+def save_invoice(invoice):
+    """Keep an analyzed invoice in the invoice store (not the placeholders of failed files)"""
+    if invoice_store is None or not invoice.get("source"):
+        return
+    try:
+        invoice_store.add_many([invoice])
     except Exception as e:
-        print(f"   ❌ Error converting PDF: {e}")
-        raise
+        # The response still has the invoice - storage problems must not fail /analyze
+        log.warning(f"   ⚠️  Could not save invoice: {e}")
+
+
+def summarize_invoices(all_invoices):
+    """One-line explanation of confidence bands for the response"""
+    bands = [confidence_band(inv["confidence"]) for inv in all_invoices]
+    high_conf = bands.count("high")
+    med_conf = bands.count("medium")
+    low_conf = bands.count("low")
+
+    return (
+        f"Processed {len(all_invoices)} invoice(s) with local AI models. "
+        f"{high_conf} high confidence, {med_conf} medium confidence, "
+        f"{low_conf} need review."
+    )
+
+
+def run_analysis_job(job, files, page_ranges=None):
+    """
+    Background body of an async /analyze job
+    Each page is recorded on the job the moment its OCR finishes
+    """
+    job.start()
+    started = time.perf_counter()
+
+    def finish():
+        job.finish(summarize_invoices(job.snapshot()["invoices"]))
+        ANALYZE_SECONDS.observe(time.perf_counter() - started, mode="async")
+        record_first_analyze()
+
+    def record(index, item, label):
+        try:
+            invoice = resolve_invoice(index, item, label)
+        except Exception as e:
+            # Every page must be recorded, or the job never finishes
+            log.error(f"❌ Job {job.id}: could not record {label}: {e}")
+            invoice = {
+                "id": f"inv_{datetime.now().timestamp()}_{index}",
+                **error_invoice("Analysis error", label or f"File_{index}", 0.2),
+            }
+        if job.add_result(index, invoice):
+            finish()
+
+    try:
+        count = 0
+        for index, item, label in queue_uploads(files, page_ranges):
+            count += 1
+            if label is None:
+                record(index, item, label)
+            else:
+                # Done-callbacks run on whichever thread finished the OCR (the
+                # pool's result collector) - save and dedup on a job thread instead
+                item.add_done_callback(
+                    lambda future, index=index, label=label: job_executor.submit(record, index, future, label)
+                )
+
+        if job.set_total(count):
+            finish()
+    except Exception as e:
+        log.error(f"❌ Job {job.id} failed: {e}")
+        job.fail(e)
+
+
+def read_uploads():
+    """
+    Collect uploaded files and request options from any supported format:
+    - multipart/form-data: file parts, options as form fields
+    - application/octet-stream: the body is one file, options as query args
+    - JSON: { "images": ["base64...", ...], ...options }
+    Returns (files, options)
+    """
+    if request.mimetype == "multipart/form-data":
+        return uploads_from_multipart(request.files), request.form
+
+    if request.mimetype == "application/octet-stream":
+        upload = upload_from_stream(request.stream, request.headers.get("X-Filename"))
+        return ([upload] if upload else []), request.args
+
+    data = request.json
+    return uploads_from_json(data.get("images", [])), data
+
+
+def is_flag_set(value):
+    """Options arrive as JSON booleans or as form/query strings"""
+    return value is True or str(value).lower() in ("1", "true", "yes")
 
 
 @app.route("/analyze", methods=["POST"])
@@ -66,233 +1020,257 @@ def analyze_invoices():
     """
     Analyze invoice images and PDFs and extract GST data
     Expects: { "images": ["base64_string1", "base64_string2", ...] }
+    or multipart/form-data file parts, or a raw application/octet-stream body
     Returns: { "invoices": [...], "explanation": "..." }
-    Supports both images and PDFs
+    Supports both images and PDFs; "pages": "1-3,5" limits which PDF pages are read
+
+    With { "async": true } (or ?async=1) returns 202 { "jobId": ... } at once;
+    poll GET /jobs/<id> or stream GET /jobs/<id>/stream for results
     """
+    started = time.perf_counter()
     try:
-        data = request.json
-        files = data.get("images", [])
+        start_warmup()  # no-op once models are loading
+        files, options = read_uploads()
 
         if not files:
             return jsonify({"error": "No files provided"}), 400
 
-        all_invoices = []
-        total_files = len(files)
-        current_invoice_idx = 0
+        try:
+            page_ranges = parse_page_range(options.get("pages") or request.args.get("pages"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-        for file_idx, base64_file in enumerate(files):
-            print(f"\n📄 Processing file {file_idx + 1}/{total_files}...")
-            
-            try:
-                # Prepare base64 data
-                file_base64 = base64_file
-                if "," in file_base64:
-                    file_base64 = file_base64.split(",")[1]
-
-                # Decode to check file type
-                file_data = base64.b64decode(file_base64)
-                
-                # Check if it's a PDF by looking for PDF signature
-                is_pdf = file_data[:4] == b'%PDF'
-                
-                if is_pdf:
-                    print(f"   📄 Type: PDF - Converting to images...")
-                    
-                    try:
-                        # Convert PDF pages to images
-                        pdf_images = convert_pdf_to_images(file_base64)
-                        
-                        # Process each page as a separate invoice
-                        for page_num, page_image in enumerate(pdf_images):
-                            current_invoice_idx += 1
-                            print(f"      Processing page {page_num + 1}/{len(pdf_images)}...")
-                            
-                            # Convert to RGB if needed
-                            if page_image.mode != "RGB":
-                                page_image = page_image.convert("RGB")
-                            
-                            # Analyze invoice
-                            try:
-                                invoice_data = analyzer.extract_invoice_data(page_image)
-                                invoice_data["id"] = f"inv_{datetime.now().timestamp()}_{current_invoice_idx}"
-                                all_invoices.append(invoice_data)
-                                
-                                print(f"      ✅ Extracted: {invoice_data['vendor']}")
-                                print(f"         Confidence: {invoice_data['confidence']:.2f}")
-                            except Exception as e:
-                                print(f"      ❌ Analysis error: {e}")
-                                all_invoices.append({
-                                    "id": f"inv_{datetime.now().timestamp()}_{current_invoice_idx}",
-                                    "vendor": "Analysis error",
-                                    "gstin": "N/A",
-                                    "invoiceNo": f"Page_{page_num + 1}",
-                                    "date": datetime.now().strftime("%d-%m-%Y"),
-                                    "taxableAmount": 0,
-                                    "cgst": 0,
-                                    "sgst": 0,
-                                    "igst": 0,
-                                    "total": 0,
-                                    "confidence": 0.2,
-                                })
-                    except Exception as e:
-                        print(f"   ❌ PDF conversion error: {e}")
-                        current_invoice_idx += 1
-                        all_invoices.append({
-                            "id": f"inv_{datetime.now().timestamp()}_{current_invoice_idx}",
-                            "vendor": "PDF conversion error",
-                            "gstin": "N/A",
-                            "invoiceNo": f"PDF_{file_idx + 1}",
-                            "date": datetime.now().strftime("%d-%m-%Y"),
-                            "taxableAmount": 0,
-                            "cgst": 0,
-                            "sgst": 0,
-                            "igst": 0,
-                            "total": 0,
-                            "confidence": 0.1,
-                        })
-                
-                else:
-                    # Process as image
-                    print(f"   🖼️  Type: Image - Processing...")
-                    current_invoice_idx += 1
-                    
-                    try:
-                        image_data = base64.b64decode(file_base64)
-                        image = Image.open(io.BytesIO(image_data))
-
-                        # Convert to RGB if needed
-                        if image.mode != "RGB":
-                            image = image.convert("RGB")
-
-                        print(f"      Image size: {image.size}")
-                        
-                        # Analyze invoice
-                        try:
-                            invoice_data = analyzer.extract_invoice_data(image)
-                            invoice_data["id"] = f"inv_{datetime.now().timestamp()}_{current_invoice_idx}"
-                            all_invoices.append(invoice_data)
-
-                            print(f"      ✅ Extracted: {invoice_data['vendor']}")
-                            print(f"         Confidence: {invoice_data['confidence']:.2f}")
-
-                        except Exception as e:
-                            print(f"      ❌ Analysis error: {e}")
-                            all_invoices.append({
-                                "id": f"inv_{datetime.now().timestamp()}_{current_invoice_idx}",
-                                "vendor": "Analysis error",
-                                "gstin": "N/A",
-                                "invoiceNo": f"Image_{file_idx + 1}",
-                                "date": datetime.now().strftime("%d-%m-%Y"),
-                                "taxableAmount": 0,
-                                "cgst": 0,
-                                "sgst": 0,
-                                "igst": 0,
-                                "total": 0,
-                                "confidence": 0.2,
-                            })
-                    
-                    except Exception as e:
-                        print(f"   ❌ Error decoding image: {e}")
-                        all_invoices.append({
-                            "id": f"inv_{datetime.now().timestamp()}_{current_invoice_idx}",
-                            "vendor": "Image decode error",
-                            "gstin": "N/A",
-                            "invoiceNo": f"Image_{file_idx + 1}",
-                            "date": datetime.now().strftime("%d-%m-%Y"),
-                            "taxableAmount": 0,
-                            "cgst": 0,
-                            "sgst": 0,
-                            "igst": 0,
-                            "total": 0,
-                            "confidence": 0.1,
-                        })
-                        
-            except Exception as e:
-                print(f"   ❌ Error processing file: {e}")
-                current_invoice_idx += 1
-                all_invoices.append({
-                    "id": f"inv_{datetime.now().timestamp()}_{current_invoice_idx}",
-                    "vendor": "File processing error",
-                    "gstin": "N/A",
-                    "invoiceNo": f"File_{file_idx + 1}",
-                    "date": datetime.now().strftime("%d-%m-%Y"),
-                    "taxableAmount": 0,
-                    "cgst": 0,
-                    "sgst": 0,
-                    "igst": 0,
-                    "total": 0,
-                    "confidence": 0.1,
-                })
-
-        # Generate summary
-        high_conf = len([inv for inv in all_invoices if inv["confidence"] >= 0.9])
-        med_conf = len([inv for inv in all_invoices if 0.7 <= inv["confidence"] < 0.9])
-        low_conf = len([inv for inv in all_invoices if inv["confidence"] < 0.7])
-
-        explanation = (
-            f"Processed {len(all_invoices)} invoice(s) with local AI models. "
-            f"{high_conf} high confidence, {med_conf} medium confidence, "
-            f"{low_conf} need review."
-        )
+        if is_flag_set(options.get("async")) or is_flag_set(request.args.get("async")):
+            job = job_store.create()
+            job_executor.submit(run_analysis_job, job, files, page_ranges)
+            return jsonify(
+                {
+                    "jobId": job.id,
+                    "status": job.status,
+                    "statusUrl": f"/jobs/{job.id}",
+                    "streamUrl": f"/jobs/{job.id}/stream",
+                }
+            ), 202
+
+        # Queue every page of every file first so the OCR workers run them in
+        # parallel, then collect the results back in upload order
+        pending = list(queue_uploads(files, page_ranges))
+        all_invoices = [resolve_invoice(*entry) for entry in pending]
+
+        explanation = summarize_invoices(all_invoices)
+        ANALYZE_SECONDS.observe(time.perf_counter() - started, mode="sync")
+        record_first_analyze()
 
         return jsonify({"invoices": all_invoices, "explanation": explanation})
 
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
-        print(f"❌ Server error: {e}")
+        log.error(f"❌ Server error: {e}")
         import traceback
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/generate-gstr1", methods=["POST"])
-def generate_gstr1():
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
     """
-    Generate GSTR-1 report from invoice data
-    Expects: { "invoices": [...] }
-    Returns: { "summary": {...}, "csvData": "..." }
+    Status and partial results of an async /analyze job
+    Returns: { "status", "total", "completed", "invoices": [...], "explanation" }
+    """
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.snapshot())
+
+
+@app.route("/jobs/<job_id>/stream", methods=["GET"])
+def stream_job(job_id):
+    """
+    Stream invoices of an async job as each page finishes
+    NDJSON by default; Server-Sent Events with ?format=sse
+    or an "Accept: text/event-stream" header
+    """
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    use_sse = (
+        request.args.get("format") == "sse"
+        or "text/event-stream" in request.headers.get("Accept", "")
+    )
+    fmt = format_sse if use_sse else format_ndjson
+    mimetype = "text/event-stream" if use_sse else "application/x-ndjson"
+
+    return Response(
+        (fmt(event) for event in job.events()),
+        mimetype=mimetype,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def store_unavailable():
+    return jsonify({"error": "Invoice store is disabled (INVOICE_DB is empty)"}), 404
+
+
+@app.route("/invoices", methods=["GET"])
+def list_invoices():
     """
+    Stored invoices, filtered by ?gstin= ?invoiceNo= ?period=MMYYYY
+    ?confidence=high|medium|low ?from= ?to= (YYYY-MM-DD); ?limit= ?offset=
+    """
+    if invoice_store is None:
+        return store_unavailable()
+    args = request.args
     try:
-        data = request.json
-        invoices = data.get("invoices", [])
-
-        if not invoices:
-            return jsonify({"error": "No invoices provided"}), 400
-
-        # Calculate summary
-        summary = {
-            "totalInvoices": len(invoices),
-            "totalTaxableAmount": sum(inv["taxableAmount"] for inv in invoices),
-            "totalCGST": sum(inv["cgst"] for inv in invoices),
-            "totalSGST": sum(inv["sgst"] for inv in invoices),
-            "totalIGST": sum(inv["igst"] for inv in invoices),
-            "totalTax": 0,
-            "totalAmount": 0,
-        }
+        limit = min(int(args.get("limit", 100)), 1000)
+        offset = int(args.get("offset", 0))
+    except ValueError:
+        return jsonify({"error": "limit and offset must be numbers"}), 400
+    invoices = invoice_store.find(
+        gstin=args.get("gstin"),
+        invoice_no=args.get("invoiceNo"),
+        period=args.get("period"),
+        band=args.get("confidence"),
+        date_from=args.get("from"),
+        date_to=args.get("to"),
+        limit=limit,
+        offset=offset,
+    )
+    return jsonify({"invoices": invoices, "limit": limit, "offset": offset})
 
-        summary["totalTax"] = (
-            summary["totalCGST"] + summary["totalSGST"] + summary["totalIGST"]
-        )
-        summary["totalAmount"] = summary["totalTaxableAmount"] + summary["totalTax"]
 
-        # Generate CSV
-        csv_header = "GSTIN,Invoice No,Date,Taxable Amount,CGST,SGST,IGST,Total\n"
-        csv_rows = []
-        for inv in invoices:
-            row = (
-                f"{inv['gstin']},{inv['invoiceNo']},{inv['date']},"
-                f"{inv['taxableAmount']},{inv['cgst']},{inv['sgst']},"
-                f"{inv['igst']},{inv['total']}"
-            )
-            csv_rows.append(row)
+@app.route("/invoices/<invoice_id>", methods=["GET", "PATCH", "DELETE"])
+def stored_invoice(invoice_id):
+    """
+    One stored invoice. PATCH { "total": 1180, "gstin": "..." } corrects
+    fields (the period totals follow); DELETE removes it.
+    """
+    if invoice_store is None:
+        return store_unavailable()
+    if request.method == "GET":
+        invoice = invoice_store.get(invoice_id)
+    elif request.method == "PATCH":
+        changes = request.get_json(silent=True)
+        if not isinstance(changes, dict):
+            return jsonify({"error": "Expected a JSON object of corrected fields"}), 400
+        try:
+            invoice = invoice_store.update(invoice_id, changes)
+        except ValueError as e:
+            return jsonify({"error": f"Invalid correction: {e}"}), 400
+    else:
+        if not invoice_store.delete(invoice_id):
+            return jsonify({"error": "Invoice not found"}), 404
+        return jsonify({"deleted": invoice_id})
+    if invoice is None:
+        return jsonify({"error": "Invoice not found"}), 404
+    return jsonify(invoice)
+
+
+@app.route("/periods", methods=["GET"])
+def list_periods():
+    """Running totals of every return period with stored invoices"""
+    if invoice_store is None:
+        return store_unavailable()
+    return jsonify({"periods": invoice_store.periods()})
+
+
+@app.route("/periods/<period>", methods=["GET"])
+def period_summary(period):
+    """Running totals of one return period (MMYYYY) - no re-summing of invoices"""
+    if invoice_store is None:
+        return store_unavailable()
+    summary = invoice_store.period_summary(period)
+    if summary is None:
+        return jsonify({"error": f"No invoices stored for period {period}"}), 404
+    return jsonify({"summary": summary})
+
+
+def iter_gstr1_invoices():
+    """
+    Invoices of a /generate-gstr1 request, one at a time: a JSON body
+    { "invoices": [...] } or NDJSON (one invoice per line, read as it arrives).
+    With ?period= and no body they come from the invoice store.
+    """
+    period = request.args.get("period")
+    has_body = request.content_length or "chunked" in request.headers.get("Transfer-Encoding", "")
+    if invoice_store is not None and period and not has_body:
+        yield from invoice_store.iter_period(period)
+        return
+    if request.mimetype == "application/x-ndjson":
+        for line in request.stream:
+            if line.strip():
+                yield json.loads(line)
+        return
+    data = request.get_json(silent=True) or {}
+    yield from data.get("invoices", [])
 
-        csv_data = csv_header + "\n".join(csv_rows)
 
-        return jsonify({"summary": summary, "csvData": csv_data})
+@app.route("/generate-gstr1", methods=["GET", "POST"])
+def generate_gstr1():
+    """
+    Generate GSTR-1 report from invoice data
+    Expects: { "invoices": [...] } (or NDJSON, one invoice per line), or no
+    body and ?period=MMYYYY for the invoices stored for that period
+    ?gstin=  the shop's GSTIN (default SHOP_GSTIN), ?period=MMYYYY
+    ?format= (none)  { "summary": {...}, "csvData": "..." } - one CSV row per invoice
+             summary  { "summary": {...} } from the stored period's running totals
+             csv     the B2B / B2CS / HSN / DOCS sections as a streamed CSV file
+             json    the return in the GSTN portal JSON layout, streamed
+    """
+    fmt = request.args.get("format", "")
+    if fmt not in ("", "summary", "csv", "json"):
+        return jsonify({"error": f"Unknown format: {fmt}"}), 400
+    if fmt == "summary":
+        if invoice_store is None:
+            return store_unavailable()
+        if not request.args.get("period"):
+            return jsonify({"error": "format=summary needs ?period=MMYYYY"}), 400
+        return period_summary(request.args["period"])
 
+    try:
+        gstr1 = GSTR1Return(
+            gstin=request.args.get("gstin") or SHOP_GSTIN,
+            period=request.args.get("period"),
+        )
+        csv_rows = []
+        for invoice in iter_gstr1_invoices():
+            gstr1.add(invoice)
+            if not fmt:
+                csv_rows.append(flat_csv_row(invoice))
+        gstr1.settle()
+    except (ValueError, TypeError, AttributeError, ArithmeticError) as e:
+        return jsonify({"error": f"Invalid invoice data: {e}"}), 400
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
-        print(f"❌ GSTR-1 generation error: {e}")
+        log.error(f"❌ GSTR-1 generation error: {e}")
         return jsonify({"error": str(e)}), 500
 
+    if gstr1.received == 0:
+        return jsonify({"error": "No invoices provided"}), 400
+    log.info(
+        f"🧾 GSTR-1: {gstr1.totals.count} invoice(s), {len(gstr1.b2b)} B2B recipient(s), "
+        f"{len(gstr1.b2cs)} B2CS row(s), {len(gstr1.hsn)} HSN row(s)"
+    )
+    if gstr1.duplicate_warnings:
+        log.warning(f"   ⚠️  {len(gstr1.duplicate_warnings)} invoice(s) match one of an earlier upload - filed, please check")
+
+    filename = f"GSTR1_{gstr1.return_period or 'export'}"
+    if fmt == "csv":
+        return Response(
+            gstr1.iter_csv(),
+            mimetype="text/csv",
+            headers={"Content-Disposition": f'attachment; filename="{filename}.csv"'},
+        )
+    if fmt == "json":
+        return Response(
+            gstr1.iter_portal_json(),
+            mimetype="application/json",
+            headers={"Content-Disposition": f'attachment; filename="{filename}.json"'},
+        )
+    return jsonify({"summary": gstr1.summary(), "csvData": FLAT_CSV_HEADER + "\n".join(csv_rows)})
+
 
 if __name__ == "__main__":
     print("\n" + "=" * 50)
@@ -302,7 +1280,13 @@ if __name__ == "__main__":
     print("✅ 100% FREE - no billing ever")
     print("✅ Models: EasyOCR + Transformers")
     print("✅ Supports: Images (JPG, PNG) and PDFs")
+    print("ℹ️  Development server - for production run: python serve.py")
     print("=" * 50 + "\n")
 
+    # The debug reloader runs this file twice; only the serving child
+    # loads models (otherwise they load on the first /ready or /analyze)
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_warmup()
+
     # Run server
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,121 @@
+"""
+Batched OCR benchmark - per-page loop vs InvoiceAnalyzer.analyze_images
+Runs the same pages through analyze_image one at a time (what /analyze did
+before batching) and through analyze_images at several batch sizes, checks
+that the invoices match and reports pages/second. Needs the EasyOCR models.
+
+    python -m benchmarks.bench_batch [--images DIR] [--pages 16] [--batch-sizes 2,4,8]
+"""
+
+import argparse
+import glob
+import os
+import random
+import time
+
+from PIL import Image, ImageDraw
+
+from invoice_analyzer import InvoiceAnalyzer
+from preprocess import ImagePreprocessor
+
+IMAGE_PATTERNS = ("*.jpg", "*.jpeg", "*.png")
+
+
+def load_images(folder, preprocessor):
+    """Invoice photos / scans from a folder, preprocessed like /analyze does"""
+    paths = sorted(p for pattern in IMAGE_PATTERNS for p in glob.glob(os.path.join(folder, pattern)))
+    return [preprocessor.process(preprocessor.open(path))[0] for path in paths]
+
+
+def synthetic_page(rng, size=(1240, 1754)):
+    """A rendered A4 invoice page at 150 DPI: header, item table, totals"""
+    page = Image.new("L", size, 255)
+    draw = ImageDraw.Draw(page)
+    y = 60
+    for line in [
+        f"SHREE {rng.choice(['GANESH', 'BALAJI', 'LAXMI'])} TRADERS",
+        f"GSTIN: 27ABCDE{rng.randint(1000, 9999)}F1Z5",
+        f"Invoice No: INV/{rng.randint(1, 9999)}",
+        f"Date: {rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2024",
+    ]:
+        draw.text((80, y), line, fill=0)
+        y += 30
+
+    taxable = 0.0
+    y += 30
+    for i in range(rng.randint(10, 40)):
+        amount = rng.randint(10, 5000) + rng.randint(0, 99) / 100
+        taxable += amount
+        for x, cell in zip(
+            (80, 160, 520, 640, 820, 1000),
+            (i + 1, f"ITEM {rng.randint(100, 999)}", 1, f"{amount:.2f}", "18%", f"{amount:.2f}"),
+        ):
+            draw.text((x, y), str(cell), fill=0)
+        y += 26
+
+    tax = round(taxable * 0.09, 2)
+    y += 30
+    for line in [
+        f"Taxable Value: Rs. {taxable:,.2f}",
+        f"CGST @9%: {tax:,.2f}",
+        f"SGST @9%: {tax:,.2f}",
+        f"Grand Total Rs. {taxable + 2 * tax:,.2f}",
+    ]:
+        draw.text((700, y), line, fill=0)
+        y += 30
+    return page
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", help="folder of invoice images (default: synthetic pages)")
+    parser.add_argument("--pages", type=int, default=16, help="synthetic pages to render")
+    parser.add_argument("--batch-sizes", default="2,4,8", help="comma-separated batch sizes")
+    parser.add_argument("--roi", type=int, default=0, help="header/totals OCR like OCR_ROI")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.images:
+        images = load_images(args.images, ImagePreprocessor())
+        source = args.images
+    else:
+        rng = random.Random(args.seed)
+        images = [synthetic_page(rng) for _ in range(args.pages)]
+        source = "synthetic"
+    if not images:
+        raise SystemExit(f"No images found in {args.images}")
+    print(f"📦 {len(images)} page(s) ({source})")
+
+    analyzer = InvoiceAnalyzer(roi=bool(args.roi), hindi="never")
+    print(f"🔥 Warm-up took {analyzer.warm_up():.1f}s")
+
+    reference, loop_time = timed(lambda: [analyzer.analyze_image(image) for image in images])
+    print(f"   per-page loop:  {loop_time:.2f}s ({len(images) / loop_time:.2f} pages/s)")
+
+    mismatches = 0
+    for batch_size in [int(size) for size in args.batch_sizes.split(",")]:
+        analyzer.batch_size = batch_size
+        records, batch_time = timed(lambda: analyzer.analyze_images(images))
+        mismatches += sum(
+            1 for a, b in zip(reference, records) if a["invoice"] != b["invoice"]
+        )
+        print(
+            f"   batch_size={batch_size:<3} {batch_time:.2f}s ({len(images) / batch_time:.2f} pages/s,"
+            f" {loop_time / batch_time:.2f}x)"
+        )
+
+    if mismatches:
+        # Padding can shift a detection box by a pixel; a few differences are expected
+        print(f"⚠️  {mismatches} invoice(s) differ from the per-page loop")
+    else:
+        print("✅ Batched results identical to the per-page loop")
+
+
+if __name__ == "__main__":
+    main()
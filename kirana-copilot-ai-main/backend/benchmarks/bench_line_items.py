@@ -0,0 +1,105 @@
+"""
+Line-item table benchmark - extraction time and accuracy by table size
+Lays out synthetic invoices (benchmarks.corpus) with 10 to 1000 items as
+OCR-like lines: one box per table cell, positions jittered like a photo.
+Times line_items.extract_line_items and the whole parse_invoice on them and
+checks the items and the line-sum check against the ground truth.
+
+    python -m benchmarks.bench_line_items [--sizes 10,100,500,1000] [--repeat 20]
+"""
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+from benchmarks.corpus import LAYOUTS, layout_invoice, random_invoice
+from invoice_analyzer import InvoiceAnalyzer
+from line_items import extract_line_items
+
+SCALE = 200 / 72  # PDF points -> pixels of a 200 DPI scan
+
+
+def ocr_lines(ops, rng, jitter):
+    """extract_text-shaped result from layout_invoice draw operations"""
+    lines, boxes = [], []
+    for op in ops:
+        if op[0] != "text":
+            continue
+        _, x, y, text, size, _ = op
+        shift = [rng.gauss(0, jitter) for _ in range(2)]
+        x0, y0 = (x + shift[0]) * SCALE, (y + shift[1]) * SCALE
+        lines.append((text, round(rng.uniform(0.75, 0.99), 3)))
+        boxes.append([x0, y0, x0 + 0.5 * size * len(text) * SCALE, y0 + size * SCALE])
+    return {
+        "full_text": " ".join(text for text, _ in lines),
+        "lines": lines,
+        "boxes": np.asarray(boxes, dtype=np.float32),
+    }
+
+
+def items_match(expected, found):
+    """Same number of items, each with the right HSN, quantity, GST rate and amount"""
+    if len(expected) != len(found):
+        return False
+    return all(
+        item.get("hsn") == truth["hsn"]
+        and item.get("qty") == truth["qty"]
+        and item.get("gstRate") == truth["gstRate"]
+        and abs(item.get("amount", 0) - truth["amount"]) <= 0.01
+        for truth, item in zip(expected, found)
+    )
+
+
+def run(analyzer, size, count, repeat, rng, jitter):
+    extract_ms, parse_ms = [], []
+    correct = checked = 0
+    for _ in range(count):
+        invoice = random_invoice(rng, item_count=size)
+        ocr = ocr_lines(layout_invoice(invoice, rng.choice(LAYOUTS), rng), rng, jitter)
+        texts = [text for text, _ in ocr["lines"]]
+
+        for _ in range(repeat):
+            start = time.perf_counter()
+            items, _ = extract_line_items(texts, ocr["boxes"])
+            extract_ms.append((time.perf_counter() - start) * 1000)
+        correct += items_match(invoice["items"], items)
+
+        start = time.perf_counter()
+        parsed = analyzer.parse_invoice(ocr)
+        parse_ms.append((time.perf_counter() - start) * 1000)
+        checked += bool(parsed.get("itemsCheck", {}).get("matchesTotals"))
+
+    return {
+        "boxes": len(texts),
+        "extractP50": round(float(np.percentile(extract_ms, 50)), 3),
+        "extractP95": round(float(np.percentile(extract_ms, 95)), 3),
+        "parseP50": round(float(np.percentile(parse_ms, 50)), 3),
+        "itemsCorrect": round(100 * correct / count, 1),
+        "totalsMatch": round(100 * checked / count, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="10,100,500,1000", help="comma-separated item counts")
+    parser.add_argument("--invoices", type=int, default=5, help="invoices per size")
+    parser.add_argument("--repeat", type=int, default=20, help="timed extractions per invoice")
+    parser.add_argument("--jitter", type=float, default=0.8, help="box position noise in points")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    analyzer = InvoiceAnalyzer(load_model=False, line_items=True)
+    print(f"{'items':>6}{'boxes':>8}{'extract p50':>13}{'p95 ms':>9}{'parse p50':>11}{'items ok':>10}{'sums ok':>9}")
+    for size in (int(size) for size in args.sizes.split(",")):
+        report = run(analyzer, size, args.invoices, args.repeat, rng, args.jitter)
+        print(
+            f"{size:>6}{report['boxes']:>8}{report['extractP50']:>13}{report['extractP95']:>9}"
+            f"{report['parseP50']:>11}{report['itemsCorrect']:>9}%{report['totalsMatch']:>8}%"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,391 @@
+"""
+Load test - /analyze and /generate-gstr1 latency under concurrent traffic
+Starts the production server (serve.py) on a free port, or uses --url, and
+replays a mix of requests at a fixed arrival rate (Poisson arrivals) with at
+most --concurrency in flight, like many phones uploading at once:
+
+    image   one invoice photo (PNG/JPEG) as base64 JSON -> POST /analyze
+    pdf     a multi-page scanned PDF as base64 JSON     -> POST /analyze
+    gstr1   a month of invoices as JSON                 -> POST /generate-gstr1
+
+Every upload gets a unique byte suffix, so the server's OCR cache and
+duplicate check never short-cut it. Latency counts from the moment a request
+was due, including time waiting for a free connection. Reports p50/p95/p99
+per kind, throughput, error and 429 rates and the RSS of all the server's
+processes over time.
+
+    python -m benchmarks.bench_load --rate 2 --duration 60 --save load.json
+    SERVE_WORKERS=4 python -m benchmarks.bench_load --rate 2 --duration 60 --compare load.json
+
+--compare exits with status 1 when p95 latency, throughput, error rate or
+peak memory got worse than the thresholds allow.
+"""
+
+import argparse
+import base64
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from benchmarks.corpus import generate, random_invoice
+from ingest import list_sources
+from telemetry import child_pids, process_memory
+
+KINDS = ("image", "pdf", "gstr1")
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Payloads:
+    """Request bodies per kind, each upload made unique on every use"""
+
+    def __init__(self, images, pdfs, gstr1_bodies):
+        self.files = {"image": images, "pdf": pdfs}
+        self.gstr1_bodies = gstr1_bodies
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def request(self, kind, rng):
+        """(path, JSON body bytes) for one request of a kind"""
+        if kind == "gstr1":
+            return "/generate-gstr1", rng.choice(self.gstr1_bodies)
+        with self._lock:
+            self._count += 1
+            suffix = f"\n%load-{os.getpid()}-{self._count}\n".encode()
+        # Readers ignore bytes after a PNG/JPEG end marker or the PDF %%EOF
+        data = rng.choice(self.files[kind]) + suffix
+        return "/analyze", json.dumps({"images": [base64.b64encode(data).decode()]}).encode()
+
+
+def multipage_pdf(pages):
+    """Scanned PDF with one page per image file (PNG/JPEG bytes)"""
+    images = [Image.open(io.BytesIO(data)).convert("RGB") for data in pages]
+    buffer = io.BytesIO()
+    images[0].save(buffer, "PDF", resolution=150, save_all=True, append_images=images[1:])
+    return buffer.getvalue()
+
+
+def gstr1_body(rng, count):
+    invoices = []
+    for _ in range(count):
+        invoice = random_invoice(rng, item_count=rng.choice([1, 3, 5]))
+        invoices.append({key: value for key, value in invoice.items() if key not in ("issued", "interState")})
+    return json.dumps({"invoices": invoices}).encode()
+
+
+def build_payloads(args, rng):
+    if args.corpus:
+        files = [(source.name, bytes(source.load().data)) for source in list_sources(args.corpus)]
+        images = [data for name, data in files if not name.lower().endswith(".pdf")]
+        pdfs = [data for name, data in files if name.lower().endswith(".pdf")]
+    else:
+        images = [data for _, data, _ in generate(args.images, args.seed, ["png", "jpg"])]
+        pdfs = []
+    if not pdfs and images:
+        pdfs = [multipage_pdf(rng.sample(images, min(args.pdf_pages, len(images)))) for _ in range(4)]
+    bodies = [gstr1_body(rng, args.gstr1_invoices) for _ in range(4)]
+    return Payloads(images, pdfs, bodies)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, startup_timeout):
+    """serve.py on a port, with its own OCR cache and no invoice store; (process, log path)"""
+    log_file = tempfile.NamedTemporaryFile(prefix="bench_load_server_", suffix=".log", delete=False)
+    env = dict(
+        os.environ,
+        SERVE_HOST="127.0.0.1",
+        SERVE_PORT=str(port),
+        OCR_CACHE_DIR=tempfile.mkdtemp(prefix="bench_load_cache_"),
+        INVOICE_DB="",
+        PYTHONUNBUFFERED="1",
+    )
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(BACKEND_DIR, "serve.py")],
+        env=env,
+        stdout=log_file,
+        stderr=subprocess.STDOUT,
+    )
+    deadline = time.monotonic() + startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"❌ Server exited (code {process.returncode}) - see {log_file.name}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/ready", timeout=5):
+                return process, log_file.name
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.5)
+    process.terminate()
+    raise SystemExit(f"❌ Server not ready after {startup_timeout}s - see {log_file.name}")
+
+
+def tree_memory(pid):
+    """RSS and PSS (MB) of a process and all its descendants"""
+    rss = pss = 0.0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        memory = process_memory(current)
+        if memory:
+            rss += memory["rssMb"]
+            pss += memory["pssMb"]
+        pending.extend(child_pids(current))
+    return round(rss, 1), round(pss, 1)
+
+
+class MemorySampler(threading.Thread):
+    """Samples the server's memory every `interval` seconds: [(seconds, rss MB, pss MB)]"""
+
+    def __init__(self, pid, interval):
+        super().__init__(name="memory-sampler", daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self.started = time.perf_counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.is_set():
+            rss, pss = tree_memory(self.pid)
+            self.samples.append((round(time.perf_counter() - self.started, 1), rss, pss))
+            self._stopped.wait(self.interval)
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+def send(url, path, body, due, timeout):
+    """POST one request: (seconds since it was due, HTTP status or 0, invoices returned)"""
+    request = urllib.request.Request(url + path, data=body, headers={"Content-Type": "application/json"})
+    pages = 0
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            status = response.status
+            data = json.loads(response.read())
+            pages = len(data.get("invoices", []))
+    except urllib.error.HTTPError as e:
+        status = e.code
+        e.close()
+    except (urllib.error.URLError, OSError, ValueError):
+        status = 0  # connection error, timeout or a broken response
+    return time.perf_counter() - due, status, pages
+
+
+def run(url, payloads, mix, rate, duration, concurrency, timeout, rng):
+    """
+    Send Poisson arrivals at `rate` per second for `duration` seconds
+    Returns [(kind, latency seconds, status, pages)] and the wall time
+    """
+    kinds = [kind for kind in KINDS if mix.get(kind)]
+    weights = [mix[kind] for kind in kinds]
+    results = []
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="load") as executor:
+        futures = []
+        due = started
+        while True:
+            due += rng.expovariate(rate)
+            if due - started > duration:
+                break
+            time.sleep(max(0.0, due - time.perf_counter()))
+            kind = rng.choices(kinds, weights)[0]
+            path, body = payloads.request(kind, rng)
+            futures.append((kind, executor.submit(send, url, path, body, due, timeout)))
+        for kind, future in futures:
+            results.append((kind, *future.result()))
+    return results, time.perf_counter() - started
+
+
+def percentile_ms(values, q):
+    return round(float(np.percentile(values, q)) * 1000, 1) if values else None
+
+
+def summarize(results, wall_seconds, samples):
+    report = {"kinds": {}, "seconds": round(wall_seconds, 2)}
+    for kind in (*KINDS, "all"):
+        rows = [row for row in results if kind in ("all", row[0])]
+        if not rows:
+            continue
+        ok = [latency for _, latency, status, _ in rows if 200 <= status < 300]
+        rejected = sum(1 for row in rows if row[2] == 429)
+        errors = len(rows) - len(ok) - rejected
+        report["kinds"][kind] = {
+            "requests": len(rows),
+            "ok": len(ok),
+            "rejected": rejected,
+            "errorRate": round(100 * errors / len(rows), 2),
+            "p50": percentile_ms(ok, 50),
+            "p95": percentile_ms(ok, 95),
+            "p99": percentile_ms(ok, 99),
+        }
+    report["requestsPerSecond"] = round(sum(1 for row in results if 200 <= row[2] < 300) / wall_seconds, 3)
+    report["pagesPerSecond"] = round(sum(row[3] for row in results) / wall_seconds, 3)
+    if samples:
+        report["memory"] = {
+            "startRssMb": samples[0][1],
+            "peakRssMb": max(rss for _, rss, _ in samples),
+            "endRssMb": samples[-1][1],
+            "peakPssMb": max(pss for _, _, pss in samples),
+            "samples": samples,
+        }
+    return report
+
+
+def print_report(report, rate):
+    print(
+        f"\n📊 {report['kinds'].get('all', {}).get('requests', 0)} request(s) in {report['seconds']}s"
+        f" (offered {rate}/s): {report['requestsPerSecond']} ok/s, {report['pagesPerSecond']} pages/s"
+    )
+    print(f"   {'kind':<7}{'sent':>6}{'ok':>6}{'429':>6}{'err %':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for kind, stats in report["kinds"].items():
+        print(
+            f"   {kind:<7}{stats['requests']:>6}{stats['ok']:>6}{stats['rejected']:>6}{stats['errorRate']:>7}"
+            f"{stats['p50'] or '-':>10}{stats['p95'] or '-':>10}{stats['p99'] or '-':>10}"
+        )
+    memory = report.get("memory")
+    if memory:
+        print(
+            f"   server RSS {memory['startRssMb']} -> peak {memory['peakRssMb']} -> {memory['endRssMb']} MB"
+            f" (peak PSS {memory['peakPssMb']} MB)"
+        )
+        step = max(1, len(memory["samples"]) // 10)
+        print("   RSS over time: " + ", ".join(f"{t:.0f}s {rss:.0f}" for t, rss, _ in memory["samples"][::step]))
+
+
+def compare(baseline, report, latency_tolerance, error_tolerance, memory_tolerance):
+    """Regressions of a run against a saved baseline, as readable lines"""
+    regressions = []
+    before = baseline["results"]
+    for kind, stats in report["kinds"].items():
+        old = before["kinds"].get(kind)
+        if not old:
+            continue
+        if old["p95"] and stats["p95"] and stats["p95"] > old["p95"] * (1 + latency_tolerance):
+            regressions.append(f"{kind}: p95 {old['p95']} -> {stats['p95']} ms")
+        if stats["errorRate"] > old["errorRate"] + error_tolerance:
+            regressions.append(f"{kind}: error rate {old['errorRate']}% -> {stats['errorRate']}%")
+        old_rejected = 100 * old["rejected"] / old["requests"]
+        rejected = 100 * stats["rejected"] / stats["requests"]
+        if rejected > old_rejected + error_tolerance:
+            regressions.append(f"{kind}: 429 rate {old_rejected:.1f}% -> {rejected:.1f}%")
+    if before["requestsPerSecond"] and report["requestsPerSecond"] < before["requestsPerSecond"] * (1 - latency_tolerance):
+        regressions.append(f"throughput {before['requestsPerSecond']} -> {report['requestsPerSecond']} ok/s")
+    old_memory, memory = before.get("memory"), report.get("memory")
+    if old_memory and memory and memory["peakPssMb"] > old_memory["peakPssMb"] * (1 + memory_tolerance):
+        regressions.append(f"peak PSS {old_memory['peakPssMb']} -> {memory['peakPssMb']} MB")
+    return regressions
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        if kind not in KINDS:
+            raise SystemExit(f"❌ Unknown request kind {kind!r} (use {', '.join(KINDS)})")
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", help="server to test (default: start serve.py on a free port)")
+    parser.add_argument("--rate", type=float, default=1.0, help="requests per second (Poisson arrivals)")
+    parser.add_argument("--duration", type=float, default=60, help="seconds of arrivals")
+    parser.add_argument("--concurrency", type=int, default=16, help="most requests in flight")
+    parser.add_argument("--mix", default="image=6,pdf=2,gstr1=2", help="request kinds and their weights")
+    parser.add_argument("--corpus", help="folder or zip of invoice files (default: synthetic invoices)")
+    parser.add_argument("--images", type=int, default=12, help="synthetic invoice photos to cycle through")
+    parser.add_argument("--pdf-pages", type=int, default=3, help="pages per synthetic PDF")
+    parser.add_argument("--gstr1-invoices", type=int, default=200, help="invoices per GSTR-1 request")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds before a request counts as failed")
+    parser.add_argument("--startup-timeout", type=float, default=600)
+    parser.add_argument("--sample-every", type=float, default=1.0, help="seconds between server RSS samples")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="write the results as a JSON baseline")
+    parser.add_argument("--compare", help="baseline JSON to check for regressions")
+    parser.add_argument("--latency-tolerance", type=float, default=0.2, help="allowed slowdown (0.2 = 20%%)")
+    parser.add_argument("--error-tolerance", type=float, default=1.0, help="allowed error / 429 rate rise in points")
+    parser.add_argument("--memory-tolerance", type=float, default=0.2, help="allowed peak PSS growth")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+    payloads = build_payloads(args, rng)
+    print(
+        f"📦 {len(payloads.files['image'])} image(s), {len(payloads.files['pdf'])} PDF(s),"
+        f" GSTR-1 bodies of {args.gstr1_invoices} invoice(s)"
+    )
+
+    server = sampler = None
+    url = args.url.rstrip("/") if args.url else None
+    if url is None:
+        port = free_port()
+        print(f"🚀 Starting serve.py on port {port} (workers: SERVE_WORKERS={os.environ.get('SERVE_WORKERS', 'default')})")
+        started = time.perf_counter()
+        server, server_log = start_server(port, args.startup_timeout)
+        print(f"✅ Ready after {time.perf_counter() - started:.1f}s (server log: {server_log})")
+        url = f"http://127.0.0.1:{port}"
+        sampler = MemorySampler(server.pid, args.sample_every)
+        sampler.start()
+
+    try:
+        print(f"🔥 Load: {args.rate}/s for {args.duration:.0f}s, up to {args.concurrency} in flight, mix {args.mix}")
+        results, wall_seconds = run(
+            url, payloads, mix, args.rate, args.duration, args.concurrency, args.timeout, rng
+        )
+    finally:
+        if sampler:
+            sampler.stop()
+        if server:
+            server.terminate()  # graceful drain
+            server.wait(timeout=60)
+
+    report = summarize(results, wall_seconds, sampler.samples if sampler else None)
+    print_report(report, args.rate)
+
+    if args.save:
+        baseline = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "url": args.url or "serve.py",
+            "rate": args.rate,
+            "duration": args.duration,
+            "concurrency": args.concurrency,
+            "mix": mix,
+            "corpus": args.corpus or f"synthetic, seed {args.seed}",
+            "results": report,
+        }
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=1)
+        print(f"\n💾 Baseline saved to {args.save}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.latency_tolerance, args.error_tolerance, args.memory_tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) against {args.compare}:")
+            for line in regressions:
+                print(f"   {line}")
+            sys.exit(1)
+        print(f"\n✅ No regressions against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Parser micro-benchmark - field extraction on stored OCR outputs
+Compares the per-field amount extraction with the single-pass engine,
+checks that both give identical results, and reports invoices/second.
+
+    python -m benchmarks.bench_parser [--count 5000] [--cache-dir .ocr_cache]
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import time
+
+from invoice_analyzer import InvoiceAnalyzer
+
+AMOUNT_FIELDS = ["taxable", "cgst", "sgst", "igst", "total"]
+
+
+def load_cached_ocr(cache_dir):
+    """OCR results stored by the OCR cache (one JSON entry per page)"""
+    results = []
+    for path in sorted(glob.glob(os.path.join(cache_dir, "*.json"))):
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+            results.append(entry["ocr"])
+        except (OSError, ValueError, KeyError, TypeError):
+            continue
+    return results
+
+
+def synthetic_ocr(rng):
+    """An OCR-like invoice: header, a few hundred item lines, tax summary"""
+    lines = [
+        f"SHREE {rng.choice(['GANESH', 'BALAJI', 'LAXMI'])} TRADERS",
+        f"GSTIN: 27ABCDE{rng.randint(1000, 9999)}F1Z5",
+        f"Invoice No: INV/{rng.randint(1, 9999)}",
+        f"Date: {rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2024",
+    ]
+    taxable = 0.0
+    for i in range(rng.randint(5, 300)):
+        amount = rng.randint(10, 5000) + rng.randint(0, 99) / 100
+        taxable += amount
+        lines.append(f"{i + 1} ITEM {rng.randint(100, 999)} 1 {amount:.2f} 18% {amount:.2f}")
+    tax = round(taxable * 0.09, 2)
+    lines += [
+        f"Taxable Value: Rs. {taxable:,.2f}",
+        f"CGST @9%: {tax:,.2f}",
+        f"SGST @9%: {tax:,.2f}",
+        f"TOTAL {0:.2f} {2 * tax:,.2f} {taxable + 2 * tax:,.2f}",
+        f"Grand Total ₹ {taxable + 2 * tax:,.2f}",
+    ]
+    return {"full_text": " ".join(lines), "lines": [(line, 0.9) for line in lines]}
+
+
+def per_field(analyzer, text):
+    return {field: analyzer._extract_amount(text, field) for field in AMOUNT_FIELDS}
+
+
+def timed(fn, items):
+    start = time.perf_counter()
+    results = [fn(item) for item in items]
+    return results, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=5000, help="OCR outputs to parse")
+    parser.add_argument(
+        "--cache-dir",
+        default=os.environ.get("OCR_CACHE_DIR", ".ocr_cache"),
+        help="OCR cache to read stored outputs from",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    stored = load_cached_ocr(args.cache_dir)
+    ocr_results = [stored[i % len(stored)] for i in range(args.count)] if stored else []
+    ocr_results += [synthetic_ocr(rng) for _ in range(args.count - len(ocr_results))]
+    texts = [result["full_text"] for result in ocr_results]
+    print(f"📦 {len(ocr_results)} OCR outputs ({len(stored)} from {args.cache_dir}, rest synthetic)")
+
+    analyzer = InvoiceAnalyzer(load_model=False)
+
+    reference, reference_time = timed(lambda text: per_field(analyzer, text), texts)
+    single_pass, single_pass_time = timed(analyzer._extract_amounts, texts)
+    mismatches = sum(1 for a, b in zip(reference, single_pass) if a != b)
+
+    _, parse_time = timed(analyzer.parse_invoice, ocr_results)
+
+    print(f"   per-field amounts:   {reference_time:.3f}s ({len(texts) / reference_time:,.0f}/s)")
+    print(f"   single-pass amounts: {single_pass_time:.3f}s ({len(texts) / single_pass_time:,.0f}/s)")
+    print(f"   speedup:             {reference_time / single_pass_time:.2f}x")
+    print(f"   full parse_invoice:  {parse_time:.3f}s ({len(ocr_results) / parse_time:,.0f}/s)")
+
+    if mismatches:
+        print(f"❌ {mismatches} outputs differ between per-field and single-pass extraction")
+        raise SystemExit(1)
+    print("✅ Single-pass results identical to per-field extraction")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+Pipeline benchmark suite - per-stage latency, throughput, memory and accuracy
+Runs a synthetic GST invoice corpus (benchmarks.corpus) through the same
+steps /analyze uses: decode + preprocess for images, text layer or
+rasterize for PDFs, then OCR (detect, recognize), parse and confidence.
+Reports stage p50/p95, pages/second, peak RSS and field-level accuracy
+against the corpus ground truth for each corpus size.
+
+    python -m benchmarks.bench_suite [--sizes 10,50] [--corpus DIR] [--save baseline.json]
+    python -m benchmarks.bench_suite --compare baseline.json
+
+--compare exits with status 1 when a stage got slower, throughput dropped
+or a field's accuracy fell by more than the thresholds.
+"""
+
+import argparse
+import io
+import json
+import os
+import resource
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.bench_line_items import items_match
+from benchmarks.corpus import TRUTH_FIELDS, generate
+from invoice_analyzer import InvoiceAnalyzer
+from pdf_pages import PDFPageSource
+from pdf_text import extract_text_layer
+from preprocess import ImagePreprocessor
+
+STAGES = ["decode", "preprocess", "rasterize", "textLayer", "detect", "recognize", "parse", "confidence"]
+AMOUNT_TRUTH = {"taxableAmount", "cgst", "sgst", "igst", "total"}
+PDF_DPI = 200
+
+
+def load_corpus(folder):
+    """(name, file bytes, truth entry) from a folder written by benchmarks.corpus"""
+    with open(os.path.join(folder, "truth.json"), encoding="utf-8") as f:
+        entries = json.load(f)["invoices"]
+    for entry in entries:
+        with open(os.path.join(folder, entry["file"]), "rb") as f:
+            yield entry["file"], f.read(), entry
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def analyze_file(analyzer, preprocessor, name, data, timings):
+    """First-page invoice of one corpus file; adds each stage's seconds to timings"""
+    if name.lower().endswith(".pdf"):
+        start = time.perf_counter()
+        _, text_pages = extract_text_layer(io.BytesIO(data), [(1, 1)])
+        timings["textLayer"] = time.perf_counter() - start
+        if 0 in text_pages:
+            record = analyzer.analyze_text_layer(text_pages[0])
+            timings.update(record["timings"])
+            return record["invoice"]
+
+        start = time.perf_counter()
+        with PDFPageSource(data, dpi=PDF_DPI) as source:
+            image = source.render(0)[0]
+        timings["rasterize"] = time.perf_counter() - start
+    else:
+        steps = {}
+        image = preprocessor.open(io.BytesIO(data), steps)
+        timings["decode"] = steps.pop("decode") / 1000
+
+    steps = {}
+    start = time.perf_counter()
+    image, _ = preprocessor.process(image, steps)
+    timings["preprocess"] = time.perf_counter() - start
+    record = analyzer.analyze_image(image)
+    timings.update(record["timings"])
+    return record["invoice"]
+
+
+def field_matches(field, expected, actual):
+    if field in AMOUNT_TRUTH:
+        try:
+            return abs(float(actual) - expected) <= 0.01
+        except (TypeError, ValueError):
+            return False
+    return str(actual).strip().upper() == str(expected).strip().upper()
+
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)) * 1000, 2) if values else None
+
+
+def run(analyzer, preprocessor, files):
+    """Benchmark one corpus; returns the report for it"""
+    stage_times = {stage: [] for stage in STAGES}
+    correct = {field: 0 for field in TRUTH_FIELDS}
+    all_correct = analyzed = items_correct = 0
+    failures = {}
+    profiles = {}  # OCR profile -> pages it produced
+
+    start = time.perf_counter()
+    for name, data, entry in files:
+        timings = {}
+        try:
+            invoice = analyze_file(analyzer, preprocessor, name, data, timings)
+        except Exception as e:
+            kind = type(e).__name__
+            failures[kind] = failures.get(kind, 0) + 1
+            continue
+        analyzed += 1
+        if "ocrProfile" in invoice:
+            profiles[invoice["ocrProfile"]] = profiles.get(invoice["ocrProfile"], 0) + 1
+        for stage, seconds in timings.items():
+            stage_times.setdefault(stage, []).append(seconds)
+        matched = [field_matches(f, entry["truth"][f], invoice.get(f)) for f in TRUTH_FIELDS]
+        for field, ok in zip(TRUTH_FIELDS, matched):
+            correct[field] += ok
+        all_correct += all(matched)
+        if "items" in entry["truth"]:
+            items_correct += items_match(entry["truth"]["items"], invoice.get("items", []))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "files": len(files),
+        "analyzed": analyzed,
+        "failures": failures,
+        "seconds": round(elapsed, 3),
+        "pagesPerSecond": round(analyzed / elapsed, 3) if elapsed else None,
+        "peakRssMb": peak_rss_mb(),
+        "ocrProfiles": profiles,
+        "stagesMs": {
+            stage: {
+                "pages": len(values),
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "mean": round(sum(values) / len(values) * 1000, 2),
+            }
+            for stage, values in stage_times.items()
+            if values
+        },
+        "accuracy": {
+            **{field: round(100 * n / analyzed, 1) if analyzed else 0.0 for field, n in correct.items()},
+            "allFields": round(100 * all_correct / analyzed, 1) if analyzed else 0.0,
+            "lineItems": round(100 * items_correct / analyzed, 1) if analyzed else 0.0,
+        },
+    }
+
+
+def print_report(size, report):
+    print(
+        f"\n📊 {size} invoice(s): {report['analyzed']} analyzed in {report['seconds']:.2f}s"
+        f" ({report['pagesPerSecond']} pages/s), peak RSS {report['peakRssMb']} MB"
+    )
+    if report["failures"]:
+        print(f"   ⚠️  Failed: {report['failures']}")
+    if report["ocrProfiles"]:
+        print(f"   OCR profiles: {report['ocrProfiles']}")
+    print(f"   {'stage':<12}{'pages':>7}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}")
+    for stage, stats in report["stagesMs"].items():
+        print(f"   {stage:<12}{stats['pages']:>7}{stats['p50']:>10}{stats['p95']:>10}{stats['mean']:>10}")
+    print("   accuracy: " + ", ".join(f"{field} {pct}%" for field, pct in report["accuracy"].items()))
+
+
+def compare(baseline, results, latency_tolerance, accuracy_tolerance):
+    """Regressions of results against a saved baseline, as readable lines"""
+    regressions = []
+    for size, report in results.items():
+        before = baseline["results"].get(size)
+        if not before:
+            continue
+        for stage, stats in report["stagesMs"].items():
+            old = before["stagesMs"].get(stage)
+            # Ignore sub-millisecond stages - timer noise, not regressions
+            if old and old["p50"] >= 1 and stats["p50"] > old["p50"] * (1 + latency_tolerance):
+                regressions.append(f"{size}: {stage} p50 {old['p50']} -> {stats['p50']} ms")
+        if before["pagesPerSecond"] and report["pagesPerSecond"] < before["pagesPerSecond"] * (1 - latency_tolerance):
+            regressions.append(f"{size}: throughput {before['pagesPerSecond']} -> {report['pagesPerSecond']} pages/s")
+        for field, pct in report["accuracy"].items():
+            old = before["accuracy"].get(field)
+            if old is not None and pct < old - accuracy_tolerance:
+                regressions.append(f"{size}: {field} accuracy {old}% -> {pct}%")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="10,50", help="comma-separated corpus sizes")
+    parser.add_argument("--corpus", help="folder written by benchmarks.corpus (default: generate in memory)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--formats", help="corpus formats to generate (default: all)")
+    parser.add_argument("--roi", type=int, default=0, help="header/totals OCR like OCR_ROI")
+    parser.add_argument("--backend", default="easyocr")
+    parser.add_argument("--profile", default="accurate", help="OCR profile like OCR_PROFILE")
+    parser.add_argument("--line-items", type=int, default=0, help="read item tables like OCR_LINE_ITEMS")
+    parser.add_argument("--save", help="write the results as a JSON baseline")
+    parser.add_argument("--compare", help="baseline JSON to check for regressions")
+    parser.add_argument("--latency-tolerance", type=float, default=0.2, help="allowed slowdown (0.2 = 20%%)")
+    parser.add_argument("--accuracy-tolerance", type=float, default=2.0, help="allowed accuracy drop in points")
+    args = parser.parse_args()
+
+    sizes = sorted(int(size) for size in args.sizes.split(","))
+    if args.corpus:
+        files = list(load_corpus(args.corpus))
+        source = args.corpus
+    else:
+        formats = args.formats.split(",") if args.formats else None
+        files = list(generate(sizes[-1], args.seed, formats))
+        source = f"synthetic, seed {args.seed}"
+    print(f"📦 {len(files)} invoice(s) ({source})")
+
+    analyzer = InvoiceAnalyzer(
+        roi=bool(args.roi),
+        hindi="never",
+        backend=args.backend,
+        profile=args.profile,
+        line_items=bool(args.line_items),
+    )
+    warm_up = analyzer.warm_up()
+    print(f"🔥 Warm-up took {warm_up:.1f}s")
+    preprocessor = ImagePreprocessor()
+
+    results = {}
+    for size in sizes:
+        results[str(size)] = run(analyzer, preprocessor, files[:size])
+        print_report(size, results[str(size)])
+
+    if args.save:
+        baseline = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "corpus": source,
+            "backend": args.backend,
+            "roi": bool(args.roi),
+            "profile": args.profile,
+            "lineItems": bool(args.line_items),
+            "results": results,
+        }
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=1)
+        print(f"\n💾 Baseline saved to {args.save}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.latency_tolerance, args.accuracy_tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) against {args.compare}:")
+            for line in regressions:
+                print(f"   {line}")
+            sys.exit(1)
+        print(f"\n✅ No regressions against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+"""
+Synthetic GST invoice corpus - rendered invoices with known ground truth
+Each invoice is laid out once (text and rules in PDF points on an A4 page)
+and then written as a photo/scan-like image, a scanned PDF, or a
+born-digital PDF with a text layer. Layout, line-item count, intra-state
+(CGST + SGST) vs inter-state (IGST), font, noise, skew and resolution vary.
+
+    python -m benchmarks.corpus --count 50 --out corpus [--seed 0]
+
+Writes the files plus truth.json: one entry per file with the fields
+InvoiceAnalyzer should extract and the rendering options used.
+"""
+
+import argparse
+import glob
+import io
+import json
+import os
+import random
+from datetime import date, timedelta
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+from gstin import gstin_check_char
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842  # A4 in points
+
+STATE_CODES = {"07": "Delhi", "09": "Uttar Pradesh", "19": "West Bengal", "24": "Gujarat",
+               "27": "Maharashtra", "29": "Karnataka", "33": "Tamil Nadu", "36": "Telangana"}
+
+VENDORS = ["SHREE GANESH DISTRIBUTORS", "BALAJI TRADING COMPANY", "LAXMI WHOLESALE MART",
+           "SAI KRIPA ENTERPRISES", "NEW BHARAT STORES", "JAI AMBE AGENCIES", "OM SAI TRADERS",
+           "KRISHNA PROVISION SUPPLIERS", "MAHALAXMI FOODS PVT LTD", "ANNAPURNA DISTRIBUTORS"]
+CITIES = ["Pune", "Mumbai", "Bengaluru", "Chennai", "Ahmedabad", "Kolkata", "Hyderabad", "Lucknow"]
+
+# (description, HSN, GST rate %, unit price range)
+PRODUCTS = [
+    ("Tata Salt 1kg", "2501", 5, (20, 30)), ("Aashirvaad Atta 5kg", "1101", 5, (220, 280)),
+    ("Parle-G Biscuit 800g", "1905", 18, (80, 100)), ("Fortune Sunflower Oil 1L", "1512", 5, (130, 170)),
+    ("Surf Excel Easy Wash 1kg", "3402", 18, (110, 140)), ("Maggi Noodles 12 Pack", "1902", 12, (140, 170)),
+    ("Amul Butter 500g", "0405", 12, (250, 280)), ("Toor Dal 1kg", "0713", 5, (140, 180)),
+    ("Colgate Strong Teeth 200g", "3306", 18, (95, 120)), ("Brooke Bond Red Label 1kg", "0902", 5, (450, 520)),
+    ("Basmati Rice 5kg", "1006", 5, (450, 650)), ("Haldiram Bhujia 1kg", "2106", 12, (230, 260)),
+    ("Lifebuoy Soap 4x125g", "3401", 18, (140, 160)), ("Sugar 5kg", "1701", 5, (210, 240)),
+    ("Dettol Handwash 750ml", "3401", 18, (180, 220)), ("Moong Dal 1kg", "0713", 5, (120, 150)),
+]
+
+LAYOUTS = ["classic", "centered", "boxed"]
+FORMATS = {"png": 0.3, "jpg": 0.3, "pdf": 0.2, "pdf-text": 0.2}
+DPIS = [100, 150, 200, 300]
+
+
+def random_gstin(rng, state):
+    pan = "".join(rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ") for _ in range(5))
+    pan += f"{rng.randint(0, 9999):04d}" + rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ")
+    first14 = f"{state}{pan}{rng.randint(1, 9)}Z"
+    return first14 + gstin_check_char(first14)
+
+
+def inr(amount, grouping=True):
+    """Rupee amount with Indian digit grouping (1,23,456.78)"""
+    whole, paise = f"{amount:.2f}".split(".")
+    if grouping and len(whole) > 3:
+        head, tail = whole[:-3], whole[-3:]
+        groups = []
+        while len(head) > 2:
+            groups.insert(0, head[-2:])
+            head = head[:-2]
+        whole = ",".join(([head] if head else []) + groups + [tail])
+    return f"{whole}.{paise}"
+
+
+def random_invoice(rng, item_count=None):
+    """Ground truth for one invoice: header fields, line items, tax totals"""
+    state = rng.choice(list(STATE_CODES))
+    inter_state = rng.random() < 0.3
+    buyer_state = rng.choice([s for s in STATE_CODES if s != state]) if inter_state else state
+    issued = date(2024, 4, 1) + timedelta(days=rng.randint(0, 540))
+
+    items = []
+    item_count = item_count or rng.choice([1, 3, 5, 8, 12, 20, 30, 45])
+    for product, hsn, rate, (low, high) in rng.choices(PRODUCTS, k=item_count):
+        qty = rng.randint(1, 24)
+        price = round(rng.uniform(low, high), 2)
+        items.append({"description": product, "hsn": hsn, "qty": qty, "rate": price,
+                      "gstRate": rate, "amount": round(qty * price, 2)})
+
+    taxable = round(sum(item["amount"] for item in items), 2)
+    tax = round(sum(item["amount"] * item["gstRate"] / 100 for item in items), 2)
+    cgst = sgst = igst = 0.0
+    if inter_state:
+        igst = tax
+    else:
+        cgst = round(tax / 2, 2)
+        sgst = round(tax - cgst, 2)
+
+    prefix = rng.choice(["INV", "GST", "SI", "TI"])
+    return {
+        "vendor": rng.choice(VENDORS),
+        "gstin": random_gstin(rng, state),
+        "buyerGstin": random_gstin(rng, buyer_state),
+        "invoiceNo": f"{prefix}/{issued.year}/{rng.randint(1, 9999):04d}",
+        "date": issued.strftime("%d-%m-%Y"),
+        "issued": issued,
+        "items": items,
+        "taxableAmount": taxable,
+        "cgst": cgst,
+        "sgst": sgst,
+        "igst": igst,
+        "total": round(taxable + cgst + sgst + igst, 2),
+        "interState": inter_state,
+    }
+
+
+def layout_invoice(invoice, layout, rng):
+    """
+    Draw operations for one page, in PDF points from the top-left:
+    ("text", x, y, text, size, bold) and ("rule", x0, y0, x1, y1)
+    """
+    ops = []
+    text = lambda x, y, s, size=9, bold=False: ops.append(("text", x, y, s, size, bold))
+    rule = lambda x0, y0, x1, y1: ops.append(("rule", x0, y0, x1, y1))
+    grouping = rng.random() < 0.7
+    date_text = invoice["issued"].strftime(rng.choice(["%d/%m/%Y", "%d-%m-%Y", "%d/%m/%y"]))
+    city = rng.choice(CITIES)
+
+    y = 40
+    if layout == "centered":
+        text(PAGE_WIDTH / 2 - len(invoice["vendor"]) * 4.2, y, invoice["vendor"], 14, True)
+        text(PAGE_WIDTH / 2 - 90, y + 20, f"Main Market Road, {city}", 9)
+        text(PAGE_WIDTH / 2 - 80, y + 34, f"GSTIN: {invoice['gstin']}", 9)
+        text(PAGE_WIDTH / 2 - 30, y + 56, "TAX INVOICE", 11, True)
+        text(40, y + 80, f"Invoice No: {invoice['invoiceNo']}", 9)
+        text(360, y + 80, f"Date: {date_text}", 9)
+        y += 110
+    else:
+        text(40, y, invoice["vendor"], 14, True)
+        text(40, y + 20, f"Shop No. {rng.randint(1, 99)}, Main Market Road, {city}", 9)
+        text(40, y + 34, f"GSTIN: {invoice['gstin']}", 9)
+        text(400, y, "TAX INVOICE", 12, True)
+        text(400, y + 20, f"Invoice No: {invoice['invoiceNo']}", 9)
+        text(400, y + 34, f"Date: {date_text}", 9)
+        y += 64
+    text(40, y, "Bill To: M/s Kirana Retail Store", 9)
+    text(40, y + 14, f"GSTIN: {invoice['buyerGstin']}", 9)
+    y += 40
+
+    columns = [(40, "#"), (62, "Description"), (250, "HSN"), (300, "Qty"), (340, "Rate"), (410, "GST%"), (470, "Amount")]
+    row_height = 15 if len(invoice["items"]) <= 30 else 12
+    size = 8 if row_height == 15 else 7
+    if layout == "boxed":
+        rule(36, y - 4, 560, y - 4)
+    for x, heading in columns:
+        text(x, y, heading, size + 1, True)
+    y += row_height + 2
+    rule(36, y - 5, 560, y - 5)
+    for i, item in enumerate(invoice["items"], 1):
+        cells = [str(i), item["description"], item["hsn"], str(item["qty"]), inr(item["rate"], grouping),
+                 f"{item['gstRate']}%", inr(item["amount"], grouping)]
+        for (x, _), cell in zip(columns, cells):
+            text(x, y, cell, size)
+        y += row_height
+        if layout == "boxed":
+            rule(36, y - 4, 560, y - 4)
+    if layout == "boxed":
+        for x in [36] + [x - 4 for x, _ in columns[1:]] + [560]:
+            rule(x, y - 4 - row_height * (len(invoice["items"]) + 1) - 2, x, y - 4)
+    y += 16
+
+    taxable_label = rng.choice(["Taxable Value", "Taxable Amount", "Sub Total"])
+    total_label = rng.choice(["Grand Total", "Total Amount", "Net Payable"])
+    rows = [(taxable_label, invoice["taxableAmount"])]
+    if invoice["interState"]:
+        rows.append(("IGST", invoice["igst"]))
+    else:
+        rows += [("CGST", invoice["cgst"]), ("SGST", invoice["sgst"])]
+    rows.append((total_label, invoice["total"]))
+    currency = rng.choice(["", "Rs. ", "INR "])
+    for label, amount in rows:
+        bold = label == total_label
+        text(360, y, label, 10 if bold else 9, bold)
+        text(470, y, currency + inr(amount, grouping), 10 if bold else 9, bold)
+        y += 16
+    text(40, min(y + 40, PAGE_HEIGHT - 40), "Thank you for your business!", 8)
+    return ops
+
+
+def available_fonts():
+    """TrueType fonts found on this machine, plus Pillow's built-in font"""
+    paths = []
+    for folder in ("/usr/share/fonts", "/usr/local/share/fonts", "/Library/Fonts", "C:/Windows/Fonts"):
+        paths += glob.glob(os.path.join(folder, "**", "*.ttf"), recursive=True)
+    return ["default"] + sorted(paths)[:20]
+
+
+def _font(name, size):
+    if name == "default":
+        try:
+            return ImageFont.load_default(size=size)
+        except TypeError:  # Pillow < 10.1: one fixed-size bitmap font
+            return ImageFont.load_default()
+    return ImageFont.truetype(name, size)
+
+
+def rasterize(ops, dpi, font_name):
+    """Render draw operations on a white page at `dpi`"""
+    scale = dpi / 72
+    page = Image.new("L", (round(PAGE_WIDTH * scale), round(PAGE_HEIGHT * scale)), 255)
+    draw = ImageDraw.Draw(page)
+    fonts = {}
+    for op in ops:
+        if op[0] == "rule":
+            _, x0, y0, x1, y1 = op
+            draw.line([(x0 * scale, y0 * scale), (x1 * scale, y1 * scale)], fill=60, width=max(1, round(scale / 2)))
+            continue
+        _, x, y, content, size, bold = op
+        key = (max(6, round(size * scale)), bold)
+        if key not in fonts:
+            fonts[key] = _font(font_name, key[0])
+        draw.text((x * scale, y * scale), content, fill=0, font=fonts[key],
+                  stroke_width=1 if bold and scale >= 2 else 0, stroke_fill=0)
+    return page
+
+
+def degrade(page, rng, noise, skew, rotate90):
+    """Make a clean render look photographed/scanned: skew, blur, sensor noise"""
+    if skew:
+        page = page.rotate(skew, resample=Image.Resampling.BILINEAR, expand=True, fillcolor=255)
+    if rotate90:
+        page = page.transpose(Image.Transpose.ROTATE_90)
+    if noise:
+        page = page.filter(ImageFilter.GaussianBlur(noise / 10))
+        pixels = np.asarray(page, dtype=np.float32)
+        pixels += np.random.default_rng(rng.randint(0, 2**32 - 1)).normal(0, noise, pixels.shape)
+        page = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+    return page
+
+
+def text_pdf(ops):
+    """A born-digital PDF with the operations as a real text layer (Helvetica)"""
+    content = ["BT"]
+    for op in ops:
+        if op[0] != "text":
+            continue
+        _, x, y, value, size, bold = op
+        escaped = value.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+        content.append(f"/{'F2' if bold else 'F1'} {size} Tf 1 0 0 1 {x:.1f} {PAGE_HEIGHT - y - size:.1f} Tm ({escaped}) Tj")
+    content.append("ET")
+    for op in ops:
+        if op[0] == "rule":
+            _, x0, y0, x1, y1 = op
+            content.append(f"{x0:.1f} {PAGE_HEIGHT - y0:.1f} m {x1:.1f} {PAGE_HEIGHT - y1:.1f} l S")
+    stream = "\n".join(content).encode("latin-1", "replace")
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Count 1 /Kids [3 0 R] >>",
+        f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] /Contents 4 0 R"
+        " /Resources << /Font << /F1 5 0 R /F2 6 0 R >> >> >>".encode(),
+        b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+    ]
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def render(invoice, rng, fmt=None, fonts=None):
+    """
+    Render one invoice. Returns (file bytes, format, rendering options)
+    fmt: one of FORMATS (random by weight if None)
+    """
+    fmt = fmt or rng.choices(list(FORMATS), weights=list(FORMATS.values()))[0]
+    layout = rng.choice(LAYOUTS)
+    ops = layout_invoice(invoice, layout, rng)
+    options = {"format": fmt, "layout": layout}
+    if fmt == "pdf-text":
+        return text_pdf(ops), fmt, options
+
+    options.update(
+        dpi=rng.choice(DPIS),
+        font=os.path.basename(rng.choice(fonts or available_fonts())),
+        noise=rng.choice([0, 0, 4, 8, 14]),
+        skew=round(rng.uniform(-3, 3), 1) if rng.random() < 0.5 else 0,
+        rotate90=rng.random() < 0.05,
+    )
+    font_path = next((f for f in (fonts or available_fonts()) if os.path.basename(f) == options["font"]), "default")
+    page = rasterize(ops, options["dpi"], font_path)
+    page = degrade(page, rng, options["noise"], options["skew"], options["rotate90"])
+
+    buffer = io.BytesIO()
+    if fmt == "jpg":
+        page.save(buffer, "JPEG", quality=rng.choice([60, 75, 90]), dpi=(options["dpi"],) * 2)
+    elif fmt == "pdf":
+        page.save(buffer, "PDF", resolution=options["dpi"])
+    else:
+        page.save(buffer, "PNG", dpi=(options["dpi"],) * 2)
+    return buffer.getvalue(), fmt, options
+
+
+TRUTH_FIELDS = ["vendor", "gstin", "invoiceNo", "date", "taxableAmount", "cgst", "sgst", "igst", "total"]
+
+
+def generate(count, seed=0, formats=None):
+    """
+    Yield (name, file bytes, truth entry) for `count` invoices
+    formats: restrict to these FORMATS keys (default: all, by weight)
+    """
+    rng = random.Random(seed)
+    fonts = available_fonts()
+    for i in range(count):
+        invoice = random_invoice(rng)
+        fmt = rng.choice(formats) if formats else None
+        data, fmt, options = render(invoice, rng, fmt, fonts)
+        name = f"invoice_{i + 1:04d}.{'pdf' if fmt.startswith('pdf') else fmt}"
+        truth = {field: invoice[field] for field in TRUTH_FIELDS}
+        truth["items"] = invoice["items"]
+        yield name, data, {"file": name, "truth": truth, "render": options}
+
+
+def write_corpus(out_dir, count, seed=0, formats=None):
+    """Write the corpus files and truth.json into out_dir; returns the truth entries"""
+    os.makedirs(out_dir, exist_ok=True)
+    entries = []
+    for name, data, entry in generate(count, seed, formats):
+        with open(os.path.join(out_dir, name), "wb") as f:
+            f.write(data)
+        entries.append(entry)
+    with open(os.path.join(out_dir, "truth.json"), "w", encoding="utf-8") as f:
+        json.dump({"seed": seed, "invoices": entries}, f, indent=1)
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=50)
+    parser.add_argument("--out", default="corpus")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--formats", help=f"comma-separated subset of {', '.join(FORMATS)}")
+    args = parser.parse_args()
+
+    formats = args.formats.split(",") if args.formats else None
+    entries = write_corpus(args.out, args.count, args.seed, formats)
+    by_format = {}
+    for entry in entries:
+        by_format[entry["render"]["format"]] = by_format.get(entry["render"]["format"], 0) + 1
+    print(f"✅ Wrote {len(entries)} invoice(s) to {args.out} ({', '.join(f'{n} {k}' for k, n in sorted(by_format.items()))})")
+
+
+if __name__ == "__main__":
+    main()
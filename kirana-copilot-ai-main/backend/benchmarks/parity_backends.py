@@ -0,0 +1,75 @@
+"""
+OCR backend parity check - invoice fields from each backend vs EasyOCR
+Runs a fixture set through the "easyocr" baseline and the other backends,
+reports per-backend time and exits non-zero if any extracted field differs.
+Needs the EasyOCR models (and onnxruntime for the ONNX backends).
+
+    python -m benchmarks.parity_backends [--images DIR] [--pages 8] [--backends onnx,onnx-int8]
+"""
+
+import argparse
+import random
+import time
+
+from benchmarks.bench_batch import load_images, synthetic_page
+from invoice_analyzer import InvoiceAnalyzer
+from preprocess import ImagePreprocessor
+
+# OCR confidence legitimately moves a little between backends; these must not
+FIELDS = ["vendor", "gstin", "invoiceNo", "date", "taxableAmount", "cgst", "sgst", "igst", "total"]
+
+
+def run_backend(backend, images, model_dir):
+    analyzer = InvoiceAnalyzer(roi=True, hindi="never", backend=backend, model_dir=model_dir)
+    analyzer.warm_up()
+    start = time.perf_counter()
+    invoices = [analyzer.extract_invoice_data(image) for image in images]
+    return invoices, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", help="folder of invoice fixtures (default: synthetic pages)")
+    parser.add_argument("--pages", type=int, default=8, help="synthetic pages to render")
+    parser.add_argument("--backends", default="onnx,onnx-int8", help="backends to compare")
+    parser.add_argument("--model-dir", help="EasyOCR weights folder (like OCR_MODEL_DIR)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.images:
+        images = load_images(args.images, ImagePreprocessor())
+    else:
+        rng = random.Random(args.seed)
+        images = [synthetic_page(rng) for _ in range(args.pages)]
+    if not images:
+        raise SystemExit(f"No images found in {args.images}")
+    print(f"📦 {len(images)} fixture page(s)")
+
+    baseline, baseline_time = run_backend("easyocr", images, args.model_dir)
+    print(f"   easyocr:   {baseline_time:.2f}s ({len(images) / baseline_time:.2f} pages/s)")
+
+    failed = False
+    for backend in args.backends.split(","):
+        invoices, elapsed = run_backend(backend, images, args.model_dir)
+        differences = [
+            (page, field, expected[field], got[field])
+            for page, (expected, got) in enumerate(zip(baseline, invoices))
+            for field in FIELDS
+            if expected[field] != got[field]
+        ]
+        print(
+            f"   {backend + ':':<10} {elapsed:.2f}s ({len(images) / elapsed:.2f} pages/s,"
+            f" {baseline_time / elapsed:.2f}x), {len(differences)} field difference(s)"
+        )
+        for page, field, expected, got in differences[:10]:
+            print(f"      page {page + 1} {field}: {expected!r} -> {got!r}")
+        failed = failed or bool(differences)
+
+    if failed:
+        print("❌ Extracted fields differ from the EasyOCR baseline")
+        raise SystemExit(1)
+    print("✅ All backends extract the same invoice fields as EasyOCR")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+CPU Scheduler - shares the machine's CPU threads between OCR jobs
+Concurrent requests each running OCR with torch's default thread count
+oversubscribe the cores; a lone request running with few threads leaves
+them idle. The scheduler owns a thread budget, admits jobs in arrival order
+and sizes each job's allotment by how many jobs are waiting.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+
+class CPUScheduler:
+    """
+    schedule(start, count) queues a job; once admitted, start(threads) must
+    launch it without blocking and return `count` Futures. The threads are
+    given back when all of them are done.
+
+    Admission: a job starts when a slot is free (max_running) and at least
+    min_threads of the budget are unused. Allotment: the unused threads split
+    evenly between the jobs waiting for them, within [min_threads, max_threads].
+    """
+
+    def __init__(self, total_threads, max_running=None, min_threads=1, max_threads=None):
+        self.total_threads = max(1, total_threads)
+        self.max_running = max_running or self.total_threads
+        self.min_threads = max(1, min(min_threads, self.total_threads))
+        self.max_threads = min(max_threads or self.total_threads, self.total_threads)
+        self._lock = threading.Lock()
+        self._queue = deque()  # (start, count, futures, queued_at)
+        self._running = 0
+        self._used_threads = 0
+        self.stats = {
+            "admitted": 0,
+            "queued": 0,  # jobs that had to wait for threads or a slot
+            "completed": 0,
+            "failed": 0,
+            "waitSecondsTotal": 0.0,
+            "waitSecondsMax": 0.0,
+            "threadsGranted": 0,
+        }
+        self.allocations = {}  # threads per job -> jobs that got that many
+
+    def schedule(self, start, count=1):
+        """Queue one job; returns its `count` Futures"""
+        futures = [Future() for _ in range(count)]
+        with self._lock:
+            self._queue.append((start, count, futures, time.perf_counter()))
+            if not self._can_admit() or len(self._queue) > 1:
+                self.stats["queued"] += 1
+        self._dispatch()
+        return futures
+
+    def _can_admit(self):
+        free = self.total_threads - self._used_threads
+        return self._running < self.max_running and free >= self.min_threads
+
+    def _allotment(self):
+        """Threads for the job at the head of the queue (lock held)"""
+        free = self.total_threads - self._used_threads
+        sharing = min(len(self._queue), self.max_running - self._running)
+        threads = free // max(1, sharing)
+        return max(self.min_threads, min(self.max_threads, threads, free))
+
+    def _dispatch(self):
+        """Start queued jobs while the budget allows"""
+        while True:
+            with self._lock:
+                if not self._queue or not self._can_admit():
+                    return
+                threads = self._allotment()
+                start, count, futures, queued_at = self._queue.popleft()
+                self._running += 1
+                self._used_threads += threads
+
+                waited = time.perf_counter() - queued_at
+                self.stats["admitted"] += 1
+                self.stats["threadsGranted"] += threads
+                self.stats["waitSecondsTotal"] += waited
+                self.stats["waitSecondsMax"] = max(self.stats["waitSecondsMax"], waited)
+                self.allocations[threads] = self.allocations.get(threads, 0) + 1
+
+            self._start(start, count, futures, threads)
+
+    def _start(self, start, count, futures, threads):
+        try:
+            inner = start(threads)
+            if len(inner) != count:
+                raise RuntimeError(f"Job started {len(inner)} tasks, expected {count}")
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            self._release(threads, failed=True)
+            return
+
+        remaining = [count]
+        remaining_lock = threading.Lock()
+
+        def done(source, target):
+            if source.exception() is not None:
+                target.set_exception(source.exception())
+            else:
+                target.set_result(source.result())
+            with remaining_lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                self._release(threads, failed=any(f.exception() is not None for f in inner))
+
+        for source, target in zip(inner, futures):
+            source.add_done_callback(lambda source, target=target: done(source, target))
+
+    def _release(self, threads, failed=False):
+        with self._lock:
+            self._running -= 1
+            self._used_threads -= threads
+            self.stats["failed" if failed else "completed"] += 1
+        self._dispatch()
+
+    def get_stats(self):
+        """Budget, current use and admission/allocation counters for /health"""
+        with self._lock:
+            admitted = self.stats["admitted"]
+            return {
+                "threadBudget": self.total_threads,
+                "maxRunning": self.max_running,
+                "running": self._running,
+                "waiting": len(self._queue),
+                "threadsInUse": self._used_threads,
+                **self.stats,
+                "waitSecondsTotal": round(self.stats["waitSecondsTotal"], 3),
+                "waitSecondsMax": round(self.stats["waitSecondsMax"], 3),
+                "avgThreadsPerJob": round(self.stats["threadsGranted"] / admitted, 2) if admitted else None,
+                "allocations": {str(threads): jobs for threads, jobs in sorted(self.allocations.items())},
+            }
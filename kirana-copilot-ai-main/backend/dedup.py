@@ -0,0 +1,96 @@
+"""
+Duplicate Detection - perceptual page hashes in a Hamming-distance index
+The same paper invoice photographed twice, or sent as a photo and as a PDF,
+gives different file bytes (so the OCR cache misses) but near-identical page
+hashes. phash() reduces a page to 256 bits that survive rescaling, JPEG
+compression and small crops; HashIndex finds stored hashes within a few
+bits of a new one without comparing against all of them (multi-index hashing).
+"""
+
+import threading
+
+import numpy as np
+from PIL import Image
+
+# 16x16 low-frequency DCT coefficients of a 64x64 thumbnail. Invoices are
+# mostly white paper with text blocks - a 64-bit (8x8) hash puts different
+# invoices of one layout only a few bits apart; 256 bits keep them far apart.
+HASH_SIZE = 16
+HASH_BITS = HASH_SIZE * HASH_SIZE
+_SAMPLE = HASH_SIZE * 4
+MIN_DETAIL = 1.0  # largest AC coefficient of a page with any visible content is far above this
+
+
+def _dct_matrix(n):
+    k = np.arange(n)
+    matrix = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+_DCT = _dct_matrix(_SAMPLE)
+
+
+def phash(image):
+    """
+    256-bit perceptual hash (DCT pHash) of a PIL Image, as an int
+    None for a featureless page (blank, one flat colour) - its bits would be noise
+    """
+    small = image.convert("L").resize((_SAMPLE, _SAMPLE), Image.Resampling.LANCZOS, reducing_gap=2.0)
+    low = (_DCT @ np.asarray(small, dtype=np.float64) @ _DCT.T)[:HASH_SIZE, :HASH_SIZE].flatten()
+    if np.abs(low[1:]).max() < MIN_DETAIL:
+        return None
+    # Compare against the median of the AC terms (the DC term is overall brightness)
+    bits = low > np.median(low[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")  # int.bit_count() needs Python 3.10
+
+
+class HashIndex:
+    """
+    Multi-index hashing for lookups within max_distance bits.
+    Each hash is split into max_distance + 1 chunks, each with its own exact
+    table: two hashes within max_distance bits must agree exactly on at least
+    one chunk, so only the hashes sharing a chunk with the query are compared.
+    """
+
+    def __init__(self, max_distance, bits=HASH_BITS):
+        self.max_distance = max_distance
+        chunks = max(1, min(max_distance + 1, bits))
+        edges = [round(i * bits / chunks) for i in range(chunks + 1)]
+        self._chunks = [(start, (1 << (end - start)) - 1) for start, end in zip(edges, edges[1:])]
+        self._tables = [{} for _ in self._chunks]  # chunk value -> [entry number]
+        self._entries = []  # (hash, value)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _keys(self, page_hash):
+        return [(page_hash >> start) & mask for start, mask in self._chunks]
+
+    def add(self, page_hash, value):
+        with self._lock:
+            number = len(self._entries)
+            self._entries.append((page_hash, value))
+            for table, key in zip(self._tables, self._keys(page_hash)):
+                table.setdefault(key, []).append(number)
+
+    def search(self, page_hash, max_distance=None):
+        """[(distance, value)] for stored hashes within max_distance, nearest first"""
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        with self._lock:
+            candidates = set()
+            for table, key in zip(self._tables, self._keys(page_hash)):
+                candidates.update(table.get(key, ()))
+            found = []
+            for number in candidates:
+                stored, value = self._entries[number]
+                distance = hamming(page_hash, stored)
+                if distance <= max_distance:
+                    found.append((distance, value))
+        found.sort(key=lambda item: item[0])
+        return found
@@ -0,0 +1,36 @@
+"""
+Download the EasyOCR weights into a local folder ahead of time
+Run once at build/deploy time, then start the server with OCR_MODEL_DIR
+pointing at the folder - the server will never download at runtime.
+With OCR_BACKEND=onnx / onnx-int8 the ONNX exports are built here too.
+
+    python fetch_models.py [models_dir]
+"""
+
+import os
+import sys
+
+import easyocr
+
+from invoice_analyzer import InvoiceAnalyzer
+from ocr_backends import create_backend
+
+DEFAULT_MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+
+
+def fetch_models(model_dir=DEFAULT_MODEL_DIR, backend="easyocr"):
+    os.makedirs(model_dir, exist_ok=True)
+    print(f"📥 Downloading EasyOCR models (English, English + Hindi) to {model_dir}...")
+    for languages in InvoiceAnalyzer.READER_LANGUAGES.values():
+        easyocr.Reader(languages, gpu=False, model_storage_directory=model_dir, download_enabled=True)
+        if backend != "easyocr":
+            create_backend(backend, languages, model_dir)
+    print("✅ Done! Start the backend with:")
+    print(f"   OCR_MODEL_DIR={model_dir} OCR_BACKEND={backend} python app.py")
+
+
+if __name__ == "__main__":
+    fetch_models(
+        sys.argv[1] if len(sys.argv) > 1 else DEFAULT_MODEL_DIR,
+        os.environ.get("OCR_BACKEND", "easyocr").lower(),
+    )
@@ -0,0 +1,23 @@
+"""
+GSTIN - format and check character of GST identification numbers
+Shared by the analyzer, the layout templates and the GSTR-1 export
+"""
+
+import re
+
+GSTIN_RE = re.compile(r"^\d{2}[A-Z]{5}\d{4}[A-Z][1-9A-Z]Z[0-9A-Z]$")
+GSTIN_CHARS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+
+def gstin_check_char(first14):
+    """GSTIN check character (mod-36 Luhn variant) for the first 14 characters"""
+    total = 0
+    for i, char in enumerate(first14):
+        product = GSTIN_CHARS.index(char) * (2 if i % 2 else 1)
+        total += product // 36 + product % 36
+    return GSTIN_CHARS[(36 - total % 36) % 36]
+
+
+def valid_gstin(gstin):
+    """Well-formed GSTIN with a matching check character (catches most OCR misreads)"""
+    return bool(GSTIN_RE.match(gstin or "")) and gstin[14] == gstin_check_char(gstin[:14])
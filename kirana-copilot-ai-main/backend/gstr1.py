@@ -0,0 +1,348 @@
+"""
+GSTR-1 Export - one pass over the invoices, Decimal money, streamed output
+GSTR1Return.add() folds each invoice into the return's sections as it
+arrives (the invoices themselves are not kept):
+  B2B        invoices to registered buyers (buyerGstin), grouped by buyer GSTIN
+  B2CS       other sales, totalled by supply type, place of supply and rate
+  HSN        line items totalled by HSN code and rate (invoices with "items")
+  DOCS       invoice number series: first / last number and count
+iter_csv() and iter_portal_json() then yield the report in pieces for a
+streaming response. Only invoices marked as a copy of another invoice
+(duplicateOf) are held back until then: a copy whose original is in the
+return is left out, any other copy is filed and reported as a warning.
+flat_csv_row() is the one-row-per-invoice CSV the app has always shown.
+"""
+
+import csv
+import io
+import json
+import re
+from collections import Counter
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from gstin import GSTIN_RE
+
+PAISE = Decimal("0.01")
+ZERO = Decimal("0.00")
+
+# Rates the portal accepts; the rate of an invoice is the nearest of these
+GST_RATES = (0, 0.1, 0.25, 1, 1.5, 3, 5, 6, 7.5, 12, 18, 28)
+DATE_RE = re.compile(r"^(\d{2})-(\d{2})-(\d{4})$")
+SERIES_RE = re.compile(r"^(.*?)(\d+)$")
+
+FLAT_CSV_HEADER = "GSTIN,Invoice No,Date,Taxable Amount,CGST,SGST,IGST,Total\n"
+
+
+def money(value):
+    """
+    Rupees as a Decimal rounded to paise (floats go through str to avoid binary noise)
+    Unreadable text counts as zero; NaN, infinities and absurdly large
+    amounts raise ValueError
+    """
+    if value is None or value == "":
+        return ZERO
+    try:
+        amount = Decimal(str(value).replace(",", ""))
+    except InvalidOperation:
+        return ZERO
+    if not amount.is_finite():
+        raise ValueError(f"amount is not a number: {value!r}")
+    try:
+        return amount.quantize(PAISE, rounding=ROUND_HALF_UP)
+    except InvalidOperation:
+        raise ValueError(f"amount is too large: {value!r}") from None
+
+
+def flat_csv_row(invoice):
+    """One invoice as a row under FLAT_CSV_HEADER (rows are joined with newlines)"""
+    fields = ("gstin", "invoiceNo", "date", "taxableAmount", "cgst", "sgst", "igst", "total")
+    return ",".join(str(invoice.get(field, "")) for field in fields)
+
+
+def nearest_rate(percent):
+    """The GST rate closest to a percentage (rates read off invoices are approximate)"""
+    return min(GST_RATES, key=lambda rate: abs(rate - float(percent)))
+
+
+def _rate_text(rate):
+    return f"{rate:g}"
+
+
+class _Totals:
+    __slots__ = ("taxable", "igst", "cgst", "sgst", "value", "qty", "count")
+
+    def __init__(self):
+        self.taxable = self.igst = self.cgst = self.sgst = self.value = ZERO
+        self.qty = Decimal(0)
+        self.count = 0
+
+    def add(self, taxable, igst, cgst, sgst, value=ZERO, qty=0):
+        self.taxable += taxable
+        self.igst += igst
+        self.cgst += cgst
+        self.sgst += sgst
+        self.value += value
+        self.qty += qty
+        self.count += 1
+
+
+class _Series:
+    __slots__ = ("prefix", "first", "last", "numbers")
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.first = self.last = None  # (number, invoice no)
+        self.numbers = set()
+
+    def add(self, number, invoice_no):
+        if self.first is None or number < self.first[0]:
+            self.first = (number, invoice_no)
+        if self.last is None or number > self.last[0]:
+            self.last = (number, invoice_no)
+        self.numbers.add(number)
+
+
+class GSTR1Return:
+    """
+    Accumulates one return period. gstin: the shop's own GSTIN (its state is
+    the place of supply of intra-state B2C sales); period: "MMYYYY", or
+    taken from the most common invoice month when not given.
+    """
+
+    def __init__(self, gstin=None, period=None):
+        self.gstin = (gstin or "").strip().upper()
+        self.period = period
+        self.b2b = {}  # buyer GSTIN -> [invoice row]
+        self.b2cs = {}  # (supply type, place of supply, rate) -> _Totals
+        self.hsn = {}  # (HSN, rate) -> _Totals
+        self.series = {}  # prefix -> _Series
+        self.totals = _Totals()
+        self.received = 0  # every invoice added, filed or not
+        self.skipped = 0
+        self.duplicates = 0
+        self.duplicate_warnings = []  # copies of invoices outside this return, filed anyway
+        self.without_hsn = 0
+        self._months = Counter()
+        self._invoice_numbers = set()
+        self._ids = set()
+        self._copies = []  # duplicateOf invoices, settled once every original is in
+
+    def add(self, invoice):
+        """Fold one invoice (analyzer output shape) into the return"""
+        self.received += 1
+        if invoice.get("duplicateOf"):
+            # Copy of another invoice (see dedup.py) - the original may come later
+            self._copies.append(invoice)
+            return
+        self._add(invoice)
+
+    def _add(self, invoice):
+        if invoice.get("id"):
+            self._ids.add(invoice["id"])
+        taxable = money(invoice.get("taxableAmount"))
+        cgst = money(invoice.get("cgst"))
+        sgst = money(invoice.get("sgst"))
+        igst = money(invoice.get("igst"))
+        total = money(invoice.get("total")) or taxable + cgst + sgst + igst
+        if total <= 0:
+            # Placeholder rows of files that could not be analyzed
+            self.skipped += 1
+            return
+
+        invoice_no = str(invoice.get("invoiceNo") or "").strip()
+        invoice_date = str(invoice.get("date") or "").strip()
+        match = DATE_RE.match(invoice_date)
+        if match:
+            self._months[match.group(2) + match.group(3)] += 1
+
+        self.totals.add(taxable, igst, cgst, sgst, total)
+        inter_state = igst > 0
+        rate = nearest_rate((cgst + sgst + igst) / taxable * 100) if taxable > 0 else 0
+        # Not "gstin": that is the GSTIN printed first on the invoice - the
+        # supplier's, which on a purchase invoice is not the shop's customer
+        buyer = str(invoice.get("buyerGstin") or "").strip().upper()
+
+        if GSTIN_RE.match(buyer):
+            self.b2b.setdefault(buyer, []).append(
+                (invoice_no, invoice_date, total, buyer[:2], rate, taxable, igst, cgst, sgst)
+            )
+        else:
+            place = str(invoice.get("placeOfSupply") or ("" if inter_state else self.gstin[:2]))
+            key = ("INTER" if inter_state else "INTRA", place, rate)
+            self.b2cs.setdefault(key, _Totals()).add(taxable, igst, cgst, sgst)
+
+        self._add_items(invoice.get("items"), inter_state)
+        self._add_document(invoice_no)
+
+    def _add_items(self, items, inter_state):
+        if not items:
+            self.without_hsn += 1
+            return
+        for item in items:
+            hsn = str(item.get("hsn") or "").strip()
+            if not hsn:
+                continue
+            taxable = money(item.get("amount"))
+            rate = nearest_rate(money(item.get("gstRate")))
+            tax = (taxable * Decimal(str(rate)) / 100).quantize(PAISE, rounding=ROUND_HALF_UP)
+            if inter_state:
+                igst, cgst, sgst = tax, ZERO, ZERO
+            else:
+                cgst = (tax / 2).quantize(PAISE, rounding=ROUND_HALF_UP)
+                igst, sgst = ZERO, tax - cgst
+            try:
+                qty = Decimal(str(item.get("qty") or 0))
+            except InvalidOperation:
+                qty = Decimal(0)
+            self.hsn.setdefault((hsn, rate), _Totals()).add(
+                taxable, igst, cgst, sgst, taxable + tax, qty
+            )
+
+    def _add_document(self, invoice_no):
+        if not invoice_no or invoice_no == "N/A" or invoice_no in self._invoice_numbers:
+            return
+        self._invoice_numbers.add(invoice_no)
+        match = SERIES_RE.match(invoice_no)
+        if not match:
+            return
+        prefix, number = match.group(1), int(match.group(2))
+        if prefix not in self.series:
+            self.series[prefix] = _Series(prefix)
+        self.series[prefix].add(number, invoice_no)
+
+    def settle(self):
+        """Leave out copies of invoices in the return, file the others with a warning"""
+        copies, self._copies = self._copies, []
+        for invoice in copies:
+            original = invoice["duplicateOf"].get("invoiceId")
+            if original in self._ids:
+                self.duplicates += 1
+                continue
+            # Matched an invoice of an earlier upload: maybe a re-upload, maybe not
+            self.duplicate_warnings.append({
+                "invoiceId": invoice.get("id"),
+                "invoiceNo": invoice.get("invoiceNo"),
+                "duplicateOf": original,
+                "match": invoice["duplicateOf"].get("match"),
+            })
+            self._add(invoice)
+
+    @property
+    def return_period(self):
+        self.settle()
+        if self.period:
+            return self.period
+        return self._months.most_common(1)[0][0] if self._months else ""
+
+    def summary(self):
+        """Totals for the GSTR-1 preview screen (plain numbers for JSON)"""
+        self.settle()
+        tax = self.totals.igst + self.totals.cgst + self.totals.sgst
+        return {
+            "totalInvoices": self.received,
+            "filedInvoices": self.totals.count,
+            "totalTaxableAmount": float(self.totals.taxable),
+            "totalCGST": float(self.totals.cgst),
+            "totalSGST": float(self.totals.sgst),
+            "totalIGST": float(self.totals.igst),
+            "totalTax": float(tax),
+            "totalAmount": float(self.totals.taxable + tax),
+            "b2bInvoices": sum(len(rows) for rows in self.b2b.values()),
+            "b2bRecipients": len(self.b2b),
+            "b2csRows": len(self.b2cs),
+            "hsnRows": len(self.hsn),
+            "skippedInvoices": self.skipped,
+            "duplicateInvoices": self.duplicates,
+            "duplicateWarnings": self.duplicate_warnings,
+            "invoicesWithoutHSN": self.without_hsn,
+            "returnPeriod": self.return_period,
+        }
+
+    def document_rows(self):
+        """(series, from, to, total, cancelled) per invoice number series"""
+        for series in sorted(self.series.values(), key=lambda s: s.prefix):
+            # Numbers missing from the range are reported as cancelled
+            span = series.last[0] - series.first[0] + 1
+            yield series.first[1], series.last[1], span, span - len(series.numbers)
+
+    def iter_csv(self):
+        """The return as CSV sections (a title row, a header, rows), one row per chunk"""
+        self.settle()
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        def row(*values):
+            writer.writerow(values)
+            text = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            return text
+
+        yield row("B2B")
+        yield row("GSTIN of Recipient", "Invoice Number", "Invoice Date", "Invoice Value",
+                  "Place Of Supply", "Rate", "Taxable Value", "Integrated Tax", "Central Tax", "State/UT Tax")
+        for buyer in sorted(self.b2b):
+            for invoice_no, invoice_date, value, place, rate, taxable, igst, cgst, sgst in self.b2b[buyer]:
+                yield row(buyer, invoice_no, invoice_date, value, place, _rate_text(rate), taxable, igst, cgst, sgst)
+
+        yield row()
+        yield row("B2CS")
+        yield row("Type", "Place Of Supply", "Rate", "Taxable Value", "Integrated Tax", "Central Tax", "State/UT Tax")
+        for (supply, place, rate), t in sorted(self.b2cs.items()):
+            yield row(supply, place, _rate_text(rate), t.taxable, t.igst, t.cgst, t.sgst)
+
+        yield row()
+        yield row("HSN")
+        yield row("HSN", "Rate", "Total Quantity", "Total Value", "Taxable Value",
+                  "Integrated Tax", "Central Tax", "State/UT Tax")
+        for (hsn, rate), t in sorted(self.hsn.items()):
+            yield row(hsn, _rate_text(rate), t.qty, t.value, t.taxable, t.igst, t.cgst, t.sgst)
+
+        yield row()
+        yield row("DOCS")
+        yield row("Nature of Document", "Sr. No. From", "Sr. No. To", "Total Number", "Cancelled")
+        for first, last, total, cancelled in self.document_rows():
+            yield row("Invoices for outward supply", first, last, total, cancelled)
+
+    def iter_portal_json(self):
+        """The return in the GSTN offline-tool JSON layout, section by section"""
+        self.settle()
+        dump = lambda value: json.dumps(value, separators=(",", ":"))
+        yield '{"gstin":%s,"fp":%s,"b2b":[' % (dump(self.gstin), dump(self.return_period))
+        for i, buyer in enumerate(sorted(self.b2b)):
+            invoices = [
+                {
+                    "inum": invoice_no,
+                    "idt": invoice_date,
+                    "val": float(value),
+                    "pos": place,
+                    "rchrg": "N",
+                    "inv_typ": "R",
+                    "itms": [{"num": 1, "itm_det": {"rt": rate, "txval": float(taxable), "iamt": float(igst),
+                                                    "camt": float(cgst), "samt": float(sgst), "csamt": 0}}],
+                }
+                for invoice_no, invoice_date, value, place, rate, taxable, igst, cgst, sgst in self.b2b[buyer]
+            ]
+            yield ("," if i else "") + dump({"ctin": buyer, "inv": invoices})
+
+        yield '],"b2cs":'
+        yield dump([
+            {"sply_ty": supply, "pos": place, "typ": "OE", "rt": rate, "txval": float(t.taxable),
+             "iamt": float(t.igst), "camt": float(t.cgst), "samt": float(t.sgst), "csamt": 0}
+            for (supply, place, rate), t in sorted(self.b2cs.items())
+        ])
+
+        yield ',"hsn":'
+        yield dump({"data": [
+            {"num": i, "hsn_sc": hsn, "rt": rate, "uqc": "NOS", "qty": float(t.qty), "val": float(t.value),
+             "txval": float(t.taxable), "iamt": float(t.igst), "camt": float(t.cgst), "samt": float(t.sgst), "csamt": 0}
+            for i, ((hsn, rate), t) in enumerate(sorted(self.hsn.items()), 1)
+        ]})
+
+        yield ',"doc_issue":'
+        docs = [
+            {"num": i, "from": first, "to": last, "totnum": total, "cancel": cancelled, "net_issue": total - cancelled}
+            for i, (first, last, total, cancelled) in enumerate(self.document_rows(), 1)
+        ]
+        yield dump({"doc_det": [{"doc_num": 1, "docs": docs}] if docs else []})
+        yield "}"
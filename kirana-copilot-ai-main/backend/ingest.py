@@ -0,0 +1,260 @@
+"""
+Bulk Ingest - analyze a folder or zip archive of invoices from the command line
+Every file goes through the same pipeline as /analyze (PDF text layer or the
+OCR worker pool, OCR cache, duplicate check, invoice store) without HTTP or
+base64: several files at a time, each file's invoices appended to a JSONL
+file as soon as it is done. Scanned PDF pages are rasterized lazily by
+app.queue_uploads through pdf_pages.PDFPageSource.iter_pages, a few pages
+ahead of OCR, so a long PDF is never held in memory as images.
+
+A checkpoint file lists the finished files and how long the JSONL file was
+after each of them, so an interrupted run picks up where it stopped: finished
+files are skipped (no OCR) and results written after the last checkpoint
+are dropped and redone. Files with a page that could not be analyzed are
+left out of both and tried again by the next run.
+
+    python ingest.py invoices/ --out march.jsonl
+    python ingest.py march.zip --out march.jsonl --workers 4 --pages 1
+"""
+
+import argparse
+import json
+import os
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from pdf_pages import parse_page_range
+from telemetry import log
+from uploads import UploadedFile, buffer_from_stream
+
+EXTENSIONS = (".pdf", ".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".webp")
+PROGRESS_SECONDS = 10
+
+
+class Source:
+    """One invoice file in a folder or zip archive; read only when analyzed"""
+
+    __slots__ = ("name", "size", "_read")
+
+    def __init__(self, name, size, read):
+        self.name = name
+        self.size = size
+        self._read = read
+
+    def load(self):
+        return UploadedFile(self._read(), os.path.basename(self.name))
+
+
+def _read_path(path):
+    """File contents as bytes, or memory-mapped when large (as uploads are)"""
+    with open(path, "rb") as f:
+        return buffer_from_stream(f)
+
+
+def list_sources(path):
+    """Invoice files under a folder or in a zip archive, sorted by name"""
+    if os.path.isdir(path):
+        sources = []
+        for folder, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(EXTENSIONS):
+                    full = os.path.join(folder, name)
+                    sources.append(
+                        Source(os.path.relpath(full, path), os.path.getsize(full), lambda full=full: _read_path(full))
+                    )
+        return sources
+
+    if zipfile.is_zipfile(path):
+        archive = zipfile.ZipFile(path)  # reads from several threads are safe
+        return [
+            Source(info.filename, info.file_size, lambda info=info: archive.read(info))
+            for info in sorted(archive.infolist(), key=lambda info: info.filename)
+            if not info.is_dir() and info.filename.lower().endswith(EXTENSIONS)
+        ]
+    raise SystemExit(f"❌ {path} is not a folder or a zip archive")
+
+
+class Checkpoint:
+    """
+    Finished files of a run, one JSON line each: name, size, pages and the
+    length of the results file once that file's invoices were written
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = {}  # file name -> size
+        self.offset = 0
+        valid = 0
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break  # cut off by the interruption
+                    self.done[entry["file"]] = entry["size"]
+                    self.offset = entry["offset"]
+                    valid += len(line)
+            os.truncate(path, valid)
+        self._file = open(path, "a")
+
+    def is_done(self, source):
+        return self.done.get(source.name) == source.size
+
+    def add(self, source, pages, offset):
+        self._file.write(json.dumps({"file": source.name, "size": source.size, "pages": pages, "offset": offset}) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
+
+
+class Progress:
+    """Files, pages, pages/min and ETA of this run"""
+
+    def __init__(self, total_files):
+        self.total_files = total_files
+        self.files = self.pages = self.failed = 0
+        self.started = time.perf_counter()
+
+    def add(self, pages, failed=False):
+        self.files += 1
+        self.pages += pages
+        self.failed += failed
+
+    def line(self):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        per_minute = self.pages / elapsed * 60
+        text = f"{self.files}/{self.total_files} files, {self.pages} pages, {per_minute:.1f} pages/min"
+        if self.failed:
+            text += f", {self.failed} failed"
+        if 0 < self.files < self.total_files:
+            text += f", ETA {format_duration(elapsed / self.files * (self.total_files - self.files))}"
+        return text
+
+
+def analyze_file(backend, source, page_ranges):
+    """The invoices of one file, as /analyze returns them (one per page)"""
+    # Queue every page first (this flushes the last OCR batch), then collect
+    pending = list(backend.queue_uploads([source.load()], page_ranges))
+    return [backend.resolve_invoice(*entry) for entry in pending]
+
+
+def failed_pages(invoices):
+    """Placeholders of pages that could not be analyzed (they have no source)"""
+    return [invoice for invoice in invoices if not invoice.get("source")]
+
+
+def ocr_broken(backend):
+    """The OCR models failed to load - every later page would fail too"""
+    return backend.startup["status"] == "failed" or (backend.startup["status"] == "ready" and not backend.is_ready())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("source", help="folder (searched recursively) or .zip archive of invoices")
+    parser.add_argument("--out", default="invoices.jsonl", help="results, one invoice per line (appended)")
+    parser.add_argument("--checkpoint", help="default: <out>.checkpoint")
+    parser.add_argument("--workers", type=int, help="OCR worker processes (default OCR_WORKERS)")
+    parser.add_argument("--jobs", type=int, help="files in progress at once (default 2 per OCR worker)")
+    parser.add_argument("--pages", help='PDF pages to read, e.g. "1" or "1-3,5" (default all)')
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and start over")
+    args = parser.parse_args()
+
+    # Must be set before the app (and its OCR pool settings) is imported
+    if args.workers is not None:
+        os.environ["OCR_WORKERS"] = str(args.workers)
+    import app as backend
+
+    try:
+        page_ranges = parse_page_range(args.pages)
+    except ValueError as e:
+        raise SystemExit(f"❌ {e}")
+    checkpoint_path = args.checkpoint or f"{args.out}.checkpoint"
+    if args.restart:
+        for path in (args.out, checkpoint_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    checkpoint = Checkpoint(checkpoint_path)
+    out = open(args.out, "ab")
+    if out.tell() < checkpoint.offset:
+        raise SystemExit(f"❌ {args.out} is shorter than {checkpoint_path} expects - use --restart")
+    out.truncate(checkpoint.offset)  # lines of files that never reached the checkpoint
+    out.seek(checkpoint.offset)
+
+    backend.start_warmup()  # OCR models load while the files are listed
+    sources = list_sources(args.source)
+    todo = [source for source in sources if not checkpoint.is_done(source)]
+    jobs = args.jobs or max(2, 2 * backend.OCR_WORKERS)
+    log.info(
+        f"📥 {len(sources)} file(s) in {args.source}, {len(sources) - len(todo)} already done"
+        f" - analyzing {len(todo)} with {jobs} at a time"
+    )
+
+    progress = Progress(len(todo))
+    remaining = iter(todo)
+    pending = {}  # Future -> Source
+    stopping = False
+    next_report = time.perf_counter() + PROGRESS_SECONDS
+    with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="ingest") as executor:
+        while True:
+            try:
+                while not stopping and len(pending) < jobs:
+                    source = next(remaining, None)
+                    if source is None:
+                        break
+                    pending[executor.submit(analyze_file, backend, source, page_ranges)] = source
+                if not pending:
+                    break
+                done, _ = wait(pending, timeout=1, return_when=FIRST_COMPLETED)
+            except KeyboardInterrupt:
+                if stopping:
+                    raise  # second Ctrl+C: the checkpoint is still consistent
+                stopping = True
+                log.info(f"🛑 Stopping after the {len(pending)} file(s) in progress (Ctrl+C again to quit now)")
+                continue
+
+            for future in done:
+                source = pending.pop(future)
+                try:
+                    invoices = future.result()
+                    failed = failed_pages(invoices)
+                except Exception as e:
+                    invoices, failed = [], [{"vendor": f"{type(e).__name__}: {e}"}]
+                if failed:
+                    log.warning(f"   ⚠️  {source.name}: {failed[0]['vendor']} - will be retried by the next run")
+                    progress.add(len(invoices) - len(failed), failed=True)
+                    if not stopping and ocr_broken(backend):
+                        log.error("❌ OCR models are not available - stopping")
+                        stopping = True
+                    continue
+                for invoice in invoices:
+                    out.write(json.dumps({"file": source.name, **invoice}).encode() + b"\n")
+                out.flush()
+                os.fsync(out.fileno())
+                checkpoint.add(source, len(invoices), out.tell())
+                progress.add(len(invoices))
+
+            if time.perf_counter() >= next_report:
+                log.info(f"📈 {progress.line()}")
+                next_report = time.perf_counter() + PROGRESS_SECONDS
+
+    out.close()
+    checkpoint.close()
+    log.info(f"{'⏸️  Stopped' if stopping else '🏁 Done'}: {progress.line()} - results in {args.out}")
+    if progress.failed:
+        log.info(f"   Run the same command again to retry the {progress.failed} failed file(s)")
+
+
+if __name__ == "__main__":
+    main()
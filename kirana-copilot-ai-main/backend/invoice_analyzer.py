@@ -3,10 +3,53 @@ Invoice Analyzer - Uses EasyOCR + Smart Parsing
 No API keys needed - runs completely locally!
 """
 
+import logging
 import re
+import threading
+import time
 from datetime import datetime
 import numpy as np
-import easyocr
+from easyocr.utils import reformat_input
+from PIL import Image
+
+from gstin import valid_gstin
+from layout_templates import FIELDS as TEMPLATE_FIELDS
+from layout_templates import LayoutTemplates, in_regions
+from line_items import check_totals, extract_line_items
+from ocr_backends import create_backend, set_num_threads
+from preprocess import looks_devanagari
+from telemetry import log, span
+from text_layout import TextLayout, boxes_array, group_by_size, select_regions
+
+
+_AMOUNT_VALUE = r"[:\s]*(?:RS\.?|₹|INR)?\s*([\d,]+\.?\d*)"
+
+
+def _leading_chars(pattern):
+    """First letters a field pattern can match, e.g. "(?:SUB|GROSS)..." -> {"S", "G"}"""
+    source = pattern.pattern
+    if source.startswith("(?:"):
+        return {alt[0] for alt in source[3 : source.index(")")].split("|")}
+    return {source[0]}
+
+
+def _pattern_dispatch(field_patterns):
+    """{ first letter: [(field, pattern #, pattern)] } for the single-pass scan"""
+    table = {}
+    for field, patterns in field_patterns.items():
+        for i, pattern in enumerate(patterns):
+            for ch in _leading_chars(pattern):
+                table.setdefault(ch, []).append((field, i, pattern))
+    return table
+
+
+def _keyword_dispatch(field_keywords):
+    """{ first letter: [(field, keyword)] } for the single-pass scan"""
+    table = {}
+    for field, keywords in field_keywords.items():
+        for keyword in keywords:
+            table.setdefault(keyword[0], []).append((field, keyword))
+    return table
 
 
 class InvoiceAnalyzer:
@@ -14,25 +57,251 @@ class InvoiceAnalyzer:
     Analyzes Indian GST invoices using OCR and pattern matching
     """
 
-    def __init__(self):
-        """Initialize EasyOCR reader"""
-        print("   Loading EasyOCR model (English + Hindi)...")
-        # Initialize with English and Hindi support
-        self.reader = easyocr.Reader(["en", "hi"], gpu=False)
-        print("   ✅ OCR model loaded!")
+    # Models per reader: English alone is the cheap first pass; the combined
+    # Devanagari + Latin model only reads lines that need it
+    READER_LANGUAGES = {"en": ["en"], "hi": ["en", "hi"]}
+    LANGUAGE_NAMES = {"en": "English", "hi": "Hindi"}
+    # English readings below this confidence get a Hindi pass
+    HINDI_MIN_CONFIDENCE = 0.4
+
+    # OCR profiles: "fast" reads a downscaled page with a smaller detector
+    # canvas and the English model only; "accurate" reads the page as given
+    # with the analyzer's Hindi mode (hindi=None). profile="cascade" runs
+    # "fast" first and "accurate" only on pages it did not read well enough.
+    OCR_PROFILES = {
+        "fast": {"max_side": 1280, "canvas_size": 1280, "mag_ratio": 1.0, "hindi": "never"},
+        "accurate": {"max_side": None, "canvas_size": 2560, "mag_ratio": 1.0, "hindi": None},
+    }
+    PROFILES = ("cascade", *OCR_PROFILES)
+
+    # Extractions at least this confident teach the supplier's layout template
+    TEMPLATE_MIN_CONFIDENCE = 0.9
+
+    # Field patterns are compiled once here, not on every parse.
+    # Amount patterns per field, in priority order (matched on upper-cased text)
+    AMOUNT_PATTERNS = {
+        field: [re.compile(p, re.DOTALL) for p in patterns]
+        for field, patterns in {
+            "taxable": [
+                r"TAXABLE\s*VALUE" + _AMOUNT_VALUE,
+                r"(?:SUB|GROSS)\s*TOTAL" + _AMOUNT_VALUE,
+                r"BASIC\s*(?:AMOUNT|VALUE)" + _AMOUNT_VALUE,
+            ],
+            "cgst": [
+                r"CGST[\s]*AMOUNT" + _AMOUNT_VALUE,
+                r"CGST" + _AMOUNT_VALUE,
+                r"C\.?G\.?S\.?T" + _AMOUNT_VALUE,
+            ],
+            "sgst": [
+                r"SGST[\s]*AMOUNT" + _AMOUNT_VALUE,
+                r"SGST" + _AMOUNT_VALUE,
+                r"S\.?G\.?S\.?T" + _AMOUNT_VALUE,
+            ],
+            "igst": [
+                r"IGST[\s]*AMOUNT" + _AMOUNT_VALUE,
+                r"IGST" + _AMOUNT_VALUE,
+                r"I\.?G\.?S\.?T" + _AMOUNT_VALUE,
+            ],
+            "total": [
+                r"BALANCE\s*AMOUNT" + _AMOUNT_VALUE,
+                r"(?:GRAND|FINAL|NET)\s*TOTAL" + _AMOUNT_VALUE,
+                r"TOTAL\s*(?:AMOUNT|PAYABLE)" + _AMOUNT_VALUE,
+                r"AMOUNT\s*PAYABLE" + _AMOUNT_VALUE,
+            ],
+        }.items()
+    }
+
+    # Fallback: first number within 100 chars after one of these keywords
+    AMOUNT_KEYWORDS = {
+        "taxable": ["TAXABLE VALUE", "TAXABLE", "SUB TOTAL", "SUBTOTAL"],
+        "cgst": ["CGST", "C.G.S.T", "C G S T"],
+        "sgst": ["SGST", "S.G.S.T", "S G S T"],
+        "igst": ["IGST", "I.G.S.T", "I G S T"],
+        "total": ["BALANCE AMOUNT", "GRAND TOTAL", "TOTAL", "AMOUNT PAYABLE"],
+    }
+
+    # Amounts are searched in the tail of the text, where the summary is
+    AMOUNT_WINDOWS = {"total": 2000, "cgst": 3000, "sgst": 3000, "igst": 3000, "taxable": 3000}
+
+    # Every position where an amount pattern or keyword can start. One scan
+    # with this finds all candidates; the field patterns are then only tried
+    # (anchored) at these positions instead of each scanning the text.
+    AMOUNT_ANCHOR = re.compile(
+        r"(?=TAXABLE|SUB|GROSS|BASIC|BALANCE|GRAND|FINAL|NET|TOTAL|AMOUNT"
+        r"|C\.?G|S\.?G|I\.?G|C G S T|S G S T|I G S T)"
+    )
+    _AMOUNT_DISPATCH = _pattern_dispatch(AMOUNT_PATTERNS)
+    _KEYWORD_DISPATCH = _keyword_dispatch(AMOUNT_KEYWORDS)
+
+    # Labels for the layout lookup: the value is the number after the label
+    # on the same line, to its right, or just below it
+    AMOUNT_LABELS = {
+        "taxable": re.compile(r"TAXABLE\s*(?:VALUE|AMOUNT|AMT)?|SUB\s*-?\s*TOTAL|GROSS\s*(?:TOTAL|AMOUNT)"),
+        "cgst": re.compile(r"C\.?\s?G\.?\s?S\.?\s?T"),
+        "sgst": re.compile(r"S\.?\s?G\.?\s?S\.?\s?T"),
+        "igst": re.compile(r"I\.?\s?G\.?\s?S\.?\s?T"),
+        "total": re.compile(
+            r"GRAND\s*TOTAL|NET\s*(?:TOTAL|AMOUNT|PAYABLE)|BALANCE\s*(?:AMOUNT|DUE)"
+            r"|TOTAL\s*(?:AMOUNT|PAYABLE)|AMOUNT\s*PAYABLE|INVOICE\s*(?:TOTAL|VALUE)"
+        ),
+    }
+
+    NUMBER_PATTERN = re.compile(r"([\d,]+\.?\d+)")
+
+    TOTAL_ROW_PATTERNS = [
+        # Pattern 1: TOTAL separator num separator num num (with Devanagari र)
+        re.compile(
+            r"TOTAL[\s]+[^\d\s]*[\s]*([\d,]+\.?\d*)[\s]+[^\d\s]*[\s]*([\d,]+\.?\d*)[\s]+([\d,]+\.?\d*)",
+            re.IGNORECASE,
+        ),
+        # Pattern 2: TOTAL num num num (just spaces)
+        re.compile(
+            r"TOTAL[\s]+([\d,]+\.?\d*)[\s]+([\d,]+\.?\d*)[\s]+([\d,]+\.?\d*)",
+            re.IGNORECASE,
+        ),
+        # Pattern 3: More flexible - any 3 numbers after TOTAL within 100 chars
+        re.compile(
+            r"TOTAL[^0-9]{0,30}([\d,]+\.?\d*)[^0-9]{1,20}([\d,]+\.?\d*)[^0-9]{1,20}([\d,]+\.?\d*)",
+            re.IGNORECASE,
+        ),
+    ]
+
+    VENDOR_SKIP_PATTERN = re.compile(r"\d{4,}|invoice|bill|date", re.I)
+
+    # GSTIN pattern: 2 digits + 10 alphanumeric + 3 alphanumeric
+    GSTIN_PATTERN = re.compile(r"\b\d{2}[A-Z]{5}\d{4}[A-Z]{1}[A-Z\d]{1}[Z]{1}[A-Z\d]{1}\b")
+    GSTIN_KEYWORD_PATTERN = re.compile(r"GSTIN[:\s]*([A-Z0-9]{15})")
+    # GSTINs within BUYER_LINES lines after one of these labels are the buyer's
+    BUYER_LABEL = re.compile(r"BILL(?:ED)?\s*TO|SHIP(?:PED)?\s*TO|BUYER|CONSIGNEE|RECIPIENT|CUSTOMER|SOLD\s*TO")
+    SELLER_LABEL = re.compile(r"SELLER|SUPPLIER|CONSIGNOR|SOLD\s*BY")
+    BUYER_LINES = 4
+
+    INVOICE_NUMBER_PATTERNS = [
+        re.compile(r"invoice\s*(?:no\.?|number|#)[:\s]*([A-Z0-9/-]+)", re.IGNORECASE),
+        re.compile(r"bill\s*(?:no\.?|number|#)[:\s]*([A-Z0-9/-]+)", re.IGNORECASE),
+        re.compile(r"voucher\s*(?:no\.?|number)[:\s]*([A-Z0-9/-]+)", re.IGNORECASE),
+    ]
+    INVOICE_NUMBER_FALLBACK = re.compile(r"\b[A-Z]{2,4}[/-]?\d{4,}\b")
+    INVOICE_NUMBER_LABEL = re.compile(r"(?:INVOICE|BILL|VOUCHER)\s*(?:NO|NUMBER|#)")
+
+    # Common date formats in India
+    DATE_PATTERNS = [
+        re.compile(r"\b(\d{1,2})[/-](\d{1,2})[/-](\d{4})\b"),  # DD/MM/YYYY or DD-MM-YYYY
+        re.compile(r"\b(\d{1,2})[/-](\d{1,2})[/-](\d{2})\b"),  # DD/MM/YY
+        re.compile(r"\b(\d{4})[/-](\d{1,2})[/-](\d{1,2})\b"),  # YYYY/MM/DD
+    ]
+
+    CONFIDENCE_PATTERNS = {
+        "gstin": re.compile(r"\bGSTIN\b", re.IGNORECASE),
+        "invoice": re.compile(r"\binvoice|bill\b", re.IGNORECASE),
+        "date": re.compile(r"\d{2}[/-]\d{2}[/-]\d{2,4}"),
+        "tax": re.compile(r"CGST|SGST|IGST", re.IGNORECASE),
+    }
+
+    def __init__(
+        self,
+        load_model=True,
+        roi=False,
+        model_dir=None,
+        hindi="auto",
+        batch_size=1,
+        backend="easyocr",
+        profile="accurate",
+        min_confidence=0.7,
+        templates=None,
+        line_items=False,
+        shop_gstin="",
+    ):
+        """
+        Initialize EasyOCR reader
+        load_model=False defers loading to load_model() / the first OCR call
+        (parse-only analyzers for text-layer PDFs and cached OCR never load it)
+        roi=True recognizes only the header and totals regions of a page
+        (see analyze_image), with the full page as fallback
+        model_dir: pre-seeded EasyOCR weights; nothing is downloaded when set
+        hindi: "auto" reads pages with the English model and re-reads only
+        Devanagari-looking or low-confidence lines with the Hindi model;
+        "always" reads everything with the combined model, "never" skips it
+        batch_size: pages per detector batch and boxes per recognizer batch
+        backend: how the OCR networks run - a key of ocr_backends.BACKENDS
+        profile: "fast", "accurate" (see OCR_PROFILES) or "cascade" - fast
+        first, accurate again for pages missing the total or GSTIN or with
+        a confidence below min_confidence
+        templates: SQLite file of per-supplier layout templates (see
+        layout_templates); None = always read pages without them
+        line_items=True reads every page in full, so the item table is
+        recognized too (no region-only or template reads), and parses it
+        into invoice["items"]; off, pages are parsed as before
+        shop_gstin: the shop's own GSTIN - never taken as a supplier's
+        (layout templates are keyed by the supplier GSTIN)
+        """
+        if profile not in self.PROFILES:
+            raise ValueError(f"Unknown OCR profile {profile!r} (use one of {', '.join(self.PROFILES)})")
+        self.reader = None  # the first-pass reader
+        self.readers = {}
+        self.roi = roi and not line_items
+        self.model_dir = model_dir
+        self.hindi = hindi
+        self.batch_size = max(1, batch_size)
+        self.backend = backend
+        self.profile = profile
+        self.min_confidence = min_confidence
+        self.templates = LayoutTemplates(templates) if templates and not line_items else None
+        self.line_items = line_items
+        self.shop_gstin = (shop_gstin or "").upper()
+        self.primary_language = "hi" if hindi == "always" else "en"
+        self._load_lock = threading.Lock()
+        if load_model:
+            self.load_model()
+
+    def load_model(self, language=None):
+        """Load an OCR backend once per language set (thread-safe; later calls return it)"""
+        language = language or self.primary_language
+        with self._load_lock:
+            if language not in self.readers:
+                names = " + ".join(self.LANGUAGE_NAMES[code] for code in self.READER_LANGUAGES[language])
+                log.info(f"   Loading EasyOCR model ({names}, {self.backend} backend)...")
+                self.readers[language] = create_backend(
+                    self.backend, self.READER_LANGUAGES[language], self.model_dir
+                )
+                log.info("   ✅ OCR model loaded!")
+            if language == self.primary_language:
+                self.reader = self.readers[language]
+        return self.readers[language]
+
+    def warm_up(self):
+        """
+        Run one tiny OCR pass so the first real page does not pay for
+        lazy torch initialization. Returns the time taken in seconds.
+        """
+        self.load_model()
+        start = time.perf_counter()
+        # White strip with a few dark bars - enough for detector and recognizer
+        image = np.full((64, 320, 3), 255, dtype=np.uint8)
+        for x in range(20, 300, 40):
+            image[20:44, x : x + 24] = 0
+        self.reader.readtext(image, detail=1)
+        return time.perf_counter() - start
 
     def extract_text(self, image):
         """Extract text from image using EasyOCR"""
         # Convert PIL Image to numpy array
-        img_array = np.array(image)
+        img, img_grey = reformat_input(np.array(image))
 
-        # Perform OCR
-        results = self.reader.readtext(img_array, detail=1)
+        # Perform OCR: detect text boxes, then read them (what readtext does)
+        horizontal_list, free_list = self.load_model().detect(img)
+        return self._recognize(img_grey, horizontal_list[0], free_list[0], self.hindi)
 
+    def _ocr_result(self, results, languages=None):
+        """extract_text output from EasyOCR (bbox, text, conf) results"""
         # Extract text and positions
         extracted = {
             "full_text": " ".join([text for (bbox, text, conf) in results]),
             "lines": [(text, conf) for (bbox, text, conf) in results],
+            # [x0, y0, x1, y1] per line, in image pixels
+            "boxes": boxes_array([bbox for (bbox, text, conf) in results]),
+            # lines read per model, e.g. { "en": 42, "hi": 3 }
+            "languages": languages or {},
         }
 
         return extracted
@@ -42,52 +311,482 @@ class InvoiceAnalyzer:
         Extract structured invoice data from image
         Returns dict with all invoice fields
         """
-        # Step 1: Extract text using OCR
-        print("      Running OCR...")
-        ocr_result = self.extract_text(image)
+        return self.analyze_image(image)["invoice"]
+
+    def extract_invoice_data_batch(self, images):
+        """
+        Extract structured invoice data from several images at once
+        Returns one dict per image, in input order
+        """
+        return [record["invoice"] for record in self.analyze_images(images)]
+
+    def analyze_image(self, image):
+        """
+        OCR an image and parse it
+        Returns { "ocr": extract_text output, "invoice": parsed fields,
+        "timings": seconds per stage, "escalated": re-read by the cascade }
+        so callers can cache the OCR output alongside the result
+        """
+        return self.analyze_images([image])[0]
+
+    def analyze_images(self, images, threads=None):
+        """
+        OCR and parse pages with the analyzer's profile. With "cascade" every
+        page gets the fast profile and only the pages that fall short are run
+        again with the accurate one (their timings include both passes).
+        threads: CPU threads for this call (see cpu_scheduler), None = as is
+        Returns one record per image, in input order; invoice["ocrProfile"]
+        names the profile that produced it.
+        """
+        if threads:
+            set_num_threads(threads)
+        if self.profile != "cascade":
+            records = self._analyze_profile(images, self.profile)
+            for record in records:
+                record["escalated"] = False
+            return records
+
+        records = self._analyze_profile(images, "fast")
+        escalate = [i for i, record in enumerate(records) if not self._good_enough(record["invoice"])]
+        if escalate:
+            log.debug(f"      Re-reading {len(escalate)}/{len(images)} page(s) with the accurate profile")
+            # The fast pass already tried (and charged a miss to) any layout template
+            accurate = self._analyze_profile([images[i] for i in escalate], "accurate", match_templates=False)
+            for i, record in zip(escalate, accurate):
+                for stage, seconds in records[i]["timings"].items():
+                    record["timings"][stage] = record["timings"].get(stage, 0.0) + seconds
+                records[i] = record
+        escalated = set(escalate)
+        for i, record in enumerate(records):
+            record["escalated"] = i in escalated
+        return records
+
+    def _good_enough(self, invoice_data):
+        """Whether the cascade can keep a fast-profile result"""
+        return self._has_required_fields(invoice_data) and invoice_data["confidence"] >= self.min_confidence
+
+    def _analyze_profile(self, images, name, match_templates=True):
+        """
+        OCR and parse pages with one profile. Pages of similar size are
+        padded to a common size and run through the text detector together,
+        up to batch_size pages at a time; the recognizer reads batch_size
+        boxes per step.
+        """
+        profile = self.OCR_PROFILES[name]
+        hindi = profile["hindi"] or self.hindi
+        detect_options = {"canvas_size": profile["canvas_size"], "mag_ratio": profile["mag_ratio"]}
+        shrunk = [self._shrink(image, profile["max_side"]) for image in images]
+        prepared = [reformat_input(np.array(image)) for image, _ in shrunk]
+        records = [None] * len(images)
+        for group in group_by_size([img.shape for img, _ in prepared], self.batch_size):
+            log.debug(f"      Running OCR ({name}) on {len(group)} page(s)...")
+            if len(group) == 1:
+                batch = prepared[group[0]][0]
+                options = detect_options
+            else:
+                height = max(prepared[i][0].shape[0] for i in group)
+                width = max(prepared[i][0].shape[1] for i in group)
+                # Pad at the bottom/right so box coordinates stay the same
+                batch = np.full((len(group), height, width, 3), 255, dtype=np.uint8)
+                for slot, i in enumerate(group):
+                    img = prepared[i][0]
+                    batch[slot, : img.shape[0], : img.shape[1]] = img
+                options = {**detect_options, "reformat": False}
+
+            detect_timings = {}
+            with span(detect_timings, "detect"):
+                horizontal_lists, free_lists = self.load_model().detect(batch, **options)
+            for slot, i in enumerate(group):
+                # Each page is charged an equal share of the batched detection
+                timings = {"detect": detect_timings["detect"] / len(group)}
+                records[i] = self._analyze_detected(
+                    prepared[i][1], horizontal_lists[slot], free_lists[slot], timings, hindi, match_templates
+                )
+
+        for record, (_, scale) in zip(records, shrunk):
+            if scale != 1:
+                # Line boxes in the caller's image pixels, whatever size was read
+                record["ocr"]["boxes"] = record["ocr"]["boxes"] / np.float32(scale)
+            record["invoice"]["ocrProfile"] = name
+        return records
+
+    @staticmethod
+    def _shrink(image, max_side):
+        """(image scaled down to fit max_side, scale factor); small images are left as they are"""
+        if not max_side:
+            return image, 1
+        if not isinstance(image, Image.Image):
+            image = Image.fromarray(np.asarray(image))
+        scale = max_side / max(image.size)
+        if scale >= 1:
+            return image, 1
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        return image.resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0), scale
+
+    def _analyze_detected(self, img_grey, horizontal_list, free_list, timings, hindi, match_templates=True):
+        """
+        Recognize and parse one page whose text boxes are already detected
+        With layout templates, record["template"] tells what happened to
+        them: "matched", "missed", "evicted" or "learned"
+        """
+        event = None
+        if self.templates is not None and match_templates:
+            record, event = self._analyze_with_template(img_grey, horizontal_list, free_list, timings, hindi)
+            if record is not None:
+                return record
+
+        if self.roi:
+            record = self._analyze_regions(img_grey, horizontal_list, free_list, timings, hindi)
+        else:
+            with span(timings, "recognize"):
+                ocr_result = self._recognize(img_grey, horizontal_list, free_list, hindi)
+            invoice_data = self.parse_invoice(ocr_result, timings)
+            invoice_data["source"] = "ocr"
+            record = {"ocr": ocr_result, "invoice": invoice_data, "timings": timings}
+
+        if self.templates is not None and self._learn_template(record, img_grey.shape[1], img_grey.shape[0]):
+            event = "learned"
+        if event:
+            record["template"] = event
+        return record
+
+    @staticmethod
+    def _detected_boxes(horizontal_list, free_list):
+        """[x0, y0, x1, y1] per detected text box, horizontal ones first"""
+        # detect() gives [x_min, x_max, y_min, y_max] and 4-point polygons
+        boxes = [[x0, y0, x1, y1] for x0, x1, y0, y1 in horizontal_list]
+        boxes += [boxes_array([poly])[0].tolist() for poly in free_list]
+        return boxes
+
+    @staticmethod
+    def _select(horizontal_list, free_list, selected):
+        """The detected boxes whose _detected_boxes positions are in selected"""
+        split = len(horizontal_list)
+        return (
+            [box for i, box in enumerate(horizontal_list) if i in selected],
+            [poly for i, poly in enumerate(free_list) if split + i in selected],
+        )
+
+    def _analyze_with_template(self, img_grey, horizontal_list, free_list, timings, hindi):
+        """
+        Read a page with its supplier's layout template: recognize the boxes
+        in the known GSTIN regions, and if they hold a valid GSTIN that has a
+        template, only the boxes in that template's regions.
+        Returns (record, event), record None when the page needs a normal read
+        """
+        gstin_regions = self.templates.gstin_regions()
+        if not len(gstin_regions):
+            return None, None
+        height, width = img_grey.shape[:2]
+        boxes = self._detected_boxes(horizontal_list, free_list)
+        candidates = set(np.flatnonzero(in_regions(boxes, gstin_regions, width, height)).tolist())
+        if not candidates:
+            return None, None
+
+        with span(timings, "recognize"):
+            header = self._recognize(img_grey, *self._select(horizontal_list, free_list, candidates), hindi)
+        template = None
+        for gstin in self._supplier_gstins(header["lines"]):
+            template = self.templates.get(gstin)  # None for misread (checksum) GSTINs
+            if template is not None:
+                break
+        if template is None:
+            return None, None
+
+        selected = set(np.flatnonzero(in_regions(boxes, template["boxes"], width, height)).tolist())
+        with span(timings, "recognize"):
+            ocr_result = self._recognize(img_grey, *self._select(horizontal_list, free_list, selected), hindi)
+        invoice_data = self.parse_invoice(ocr_result, timings)
+        if self._supplier_gstin(ocr_result["lines"]) != template["gstin"] or invoice_data["total"] <= 0:
+            log.debug(f"      ⚠️  Layout template of {template['gstin']} did not fit - reading the page")
+            return None, "evicted" if self.templates.miss(template["gstin"]) else "missed"
+
+        self.templates.hit(template["gstin"])
+        log.debug(f"      Read {len(selected)}/{len(boxes)} text boxes with the layout template of {template['gstin']}")
+        if template["vendor"]:
+            invoice_data["vendor"] = template["vendor"]
+        invoice_data["source"] = "ocr"
+        invoice_data["layoutTemplate"] = template["version"]
+        return {"ocr": ocr_result, "invoice": invoice_data, "timings": timings, "template": "matched"}, "matched"
+
+    def _learn_template(self, record, width, height):
+        """Save where a confident extraction found its fields as the supplier GSTIN's template"""
+        invoice_data = record["invoice"]
+        gstin = self._supplier_gstin(record["ocr"]["lines"])
+        if (
+            invoice_data["confidence"] < self.TEMPLATE_MIN_CONFIDENCE
+            or invoice_data["total"] <= 0
+            or not valid_gstin(gstin)
+        ):
+            return False
+        lines = self._template_lines(record["ocr"], invoice_data, gstin)
+        if not lines["gstin"] or not lines["amounts"]:
+            return False
+        boxes = np.asarray(record["ocr"]["boxes"], dtype=np.float64) / [width, height, width, height]
+        regions = {field: boxes[indexes] for field, indexes in lines.items() if indexes}
+        vendor = invoice_data["vendor"] if invoice_data["vendor"] != "N/A" else None
+        version = self.templates.learn(gstin, vendor, regions)
+        log.debug(f"      Saved layout template v{version} of {gstin}")
+        return True
+
+    def _party_gstins(self, lines):
+        """
+        (GSTIN, printed in a buyer block ("Bill to", "Consignee"...)) for the
+        GSTINs on the page in reading order, without the shop's own
+        """
+        buyer_until = -1
+        for i, (text, _) in enumerate(lines):
+            upper = text.upper()
+            if self.SELLER_LABEL.search(upper):
+                buyer_until = -1
+            if self.BUYER_LABEL.search(upper):
+                buyer_until = i + self.BUYER_LINES
+            for gstin in self.GSTIN_PATTERN.findall(upper):
+                if gstin != self.shop_gstin:
+                    yield gstin, i <= buyer_until
+
+    def _supplier_gstins(self, lines):
+        """GSTINs on the page outside buyer blocks, without the shop's own"""
+        return (gstin for gstin, buyer in self._party_gstins(lines) if not buyer)
+
+    def _supplier_gstin(self, lines):
+        """The supplier's GSTIN (first of _supplier_gstins), or None"""
+        return next(self._supplier_gstins(lines), None)
+
+    def _buyer_gstin(self, lines):
+        """A valid GSTIN printed in a buyer block that is not the shop's own, or None"""
+        return next((gstin for gstin, buyer in self._party_gstins(lines) if buyer and valid_gstin(gstin)), None)
+
+    def _template_lines(self, ocr_result, invoice_data, gstin):
+        """{ template field: [line numbers] } - the lines each field (and its label) was read from"""
+        found = {field: [] for field in TEMPLATE_FIELDS}
+        invoice_no = str(invoice_data["invoiceNo"]).upper()
+        amounts = {
+            round(invoice_data[field], 2)
+            for field in ("taxableAmount", "cgst", "sgst", "igst", "total")
+            if invoice_data[field] > 0
+        }
+        for i, (text, _) in enumerate(ocr_result["lines"]):
+            upper = text.upper()
+            if gstin in upper.replace(" ", ""):
+                found["gstin"].append(i)
+            if invoice_no in upper or self.INVOICE_NUMBER_LABEL.search(upper):
+                found["invoiceNo"].append(i)
+            if any(p.search(text) for p in self.DATE_PATTERNS) and self._extract_date(text) == invoice_data["date"]:
+                found["date"].append(i)
+            numbers = {self._parse_amount(n) for n in self.NUMBER_PATTERN.findall(upper)}
+            if amounts & numbers or any(label.search(upper) for label in self.AMOUNT_LABELS.values()):
+                found["amounts"].append(i)
+        return found
+
+    def _analyze_regions(self, img_grey, horizontal_list, free_list, timings, hindi):
+        """
+        Two-stage OCR: with the text boxes detected once, recognize only the
+        header and totals regions (text_layout.select_regions), and recognize
+        the rest of the page only if the required fields were not found there.
+        Line-item tables are skipped, which is most of the text on dense bills.
+        """
+        boxes = self._detected_boxes(horizontal_list, free_list)
+        selected = set(select_regions(boxes))
+        total_boxes = len(boxes)
+
+        if 0 < len(selected) < total_boxes:
+            with span(timings, "recognize"):
+                roi_result = ocr_result = self._recognize(
+                    img_grey, *self._select(horizontal_list, free_list, selected), hindi
+                )
+            log.debug(f"      Recognized {len(selected)}/{total_boxes} text boxes (header + totals)")
+            invoice_data = self.parse_invoice(ocr_result, timings)
+            if self._has_required_fields(invoice_data):
+                invoice_data["source"] = "ocr"
+                return {"ocr": ocr_result, "invoice": invoice_data, "timings": timings}
+            log.debug("      ⚠️  Key fields missing - recognizing the full page")
+        else:
+            roi_result = None
+
+        with span(timings, "recognize"):
+            ocr_result = self._recognize(img_grey, horizontal_list, free_list, hindi)
+        if roi_result is not None:
+            # Count the lines read by both passes
+            for language, count in roi_result["languages"].items():
+                ocr_result["languages"][language] = ocr_result["languages"].get(language, 0) + count
+        invoice_data = self.parse_invoice(ocr_result, timings)
+        invoice_data["source"] = "ocr"
+        return {"ocr": ocr_result, "invoice": invoice_data, "timings": timings}
+
+    def _recognize(self, img_grey, horizontal_list, free_list, hindi):
+        """
+        Recognize the given detected boxes (same result as readtext on them)
+        hindi: Hindi mode for this pass (the analyzer's, or its OCR profile's).
+        In "auto" mode lines are read in English first, and only the
+        ones that need it are read again with the Hindi model
+        """
+        if not horizontal_list and not free_list:
+            return self._ocr_result([])
+        language = "hi" if hindi == "always" else "en"
+        results = self.load_model(language).recognize(
+            img_grey,
+            horizontal_list=horizontal_list,
+            free_list=free_list,
+            detail=1,
+            batch_size=self.batch_size,
+        )
+        languages = {language: len(results)}
+        if hindi == "auto":
+            results = self._reread_hindi(img_grey, results, languages)
+        return self._ocr_result(results, languages)
+
+    def _reread_hindi(self, img_grey, results, languages):
+        """
+        Re-read Devanagari-looking (e.g. "र" separators) and low-confidence
+        English lines with the Hindi model; keep whichever reading is more confident
+        """
+        retry = []
+        for i, (bbox, text, conf) in enumerate(results):
+            x0, y0, x1, y1 = (int(v) for v in boxes_array([bbox])[0])
+            if conf < self.HINDI_MIN_CONFIDENCE or looks_devanagari(
+                img_grey[max(0, y0) : y1, max(0, x0) : x1]
+            ):
+                retry.append(i)
+        if not retry:
+            return results
+
+        horizontal_list, free_list = [], []
+        for i in retry:
+            points = np.asarray(results[i][0])
+            (x0, y0), (x1, y1) = points.min(axis=0), points.max(axis=0)
+            if set(points[:, 0].tolist()) <= {x0, x1} and set(points[:, 1].tolist()) <= {y0, y1}:
+                horizontal_list.append([int(x0), int(x1), int(y0), int(y1)])
+            else:
+                free_list.append(points.tolist())
+
+        hindi_results = self.load_model("hi").recognize(
+            img_grey,
+            horizontal_list=horizontal_list,
+            free_list=free_list,
+            detail=1,
+            batch_size=self.batch_size,
+        )
+        languages["hi"] = len(hindi_results)
+        by_box = {
+            tuple(boxes_array([bbox])[0].tolist()): (bbox, text, conf)
+            for bbox, text, conf in hindi_results
+        }
+
+        results = list(results)
+        for i in retry:
+            hindi = by_box.get(tuple(boxes_array([results[i][0]])[0].tolist()))
+            if hindi and hindi[2] > results[i][2]:
+                results[i] = (results[i][0], hindi[1], hindi[2])
+        log.debug(f"      Re-read {len(retry)} line(s) with the Hindi model")
+        return results
+
+    @staticmethod
+    def _has_required_fields(invoice_data):
+        """Fields a region-only pass must find before the rest of the page is skipped"""
+        return invoice_data["total"] > 0 and invoice_data["gstin"] != "N/A"
+
+    def analyze_text_layer(self, text_result):
+        """
+        Parse a PDF page's embedded text (pdf_text.extract_text_layer output)
+        Same record shape as analyze_image, without rasterizing or OCR
+        """
+        timings = {}
+        invoice_data = self.parse_invoice(text_result, timings)
+        invoice_data["source"] = "textLayer"
+        return {"ocr": text_result, "invoice": invoice_data, "timings": timings}
+
+    def parse_invoice(self, ocr_result, timings=None):
+        """
+        Parse extract_text output into structured invoice fields
+        Does not run OCR, so it can be replayed on stored OCR output
+        timings: optional dict that gets "parse" and "confidence" seconds
+        """
+        with span(timings, "parse"):
+            invoice_data = self._parse_fields(ocr_result)
+
+        # Step 4: Calculate confidence
+        with span(timings, "confidence"):
+            invoice_data["confidence"] = self._calculate_confidence(
+                ocr_result["full_text"], ocr_result["lines"], invoice_data
+            )
+
+        log.debug("      Final result: %s", invoice_data)
+        return invoice_data
+
+    def _parse_fields(self, ocr_result):
+        """All invoice fields except the confidence score"""
         full_text = ocr_result["full_text"]
         lines = ocr_result["lines"]
 
-        print(f"      Extracted {len(lines)} text lines")
-        print("      === EXTRACTED TEXT DEBUG (First 300 chars) ===")
-        print(full_text[:300] if len(full_text) > 300 else full_text)
-        print("      === EXTRACTED TEXT DEBUG (Last 1000 chars - where totals are) ===")
-        print(full_text[-1000:] if len(full_text) > 1000 else full_text)
-        print("      === END DEBUG ===")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug(f"      Extracted {len(lines)} text lines")
+            log.debug("      === EXTRACTED TEXT DEBUG (First 300 chars) ===")
+            log.debug(full_text[:300] if len(full_text) > 300 else full_text)
+            log.debug("      === EXTRACTED TEXT DEBUG (Last 1000 chars - where totals are) ===")
+            log.debug(full_text[-1000:] if len(full_text) > 1000 else full_text)
+            log.debug("      === END DEBUG ===")
 
         # Step 2: Parse invoice data using patterns
-        # First get the total amount (most reliable)
-        total = self._extract_amount(full_text, "total")
+        # One pass over the text finds every amount field
+        amounts = self._extract_amounts(full_text)
 
-        # Try to extract total tax from TOTAL row (usually shows: TOTAL [disc] [tax] [amount])
-        total_tax_from_row = self._extract_total_tax_from_row(full_text)
+        # Where line positions are known, the number next to each label fills
+        # in the fields the text patterns above did not find
+        layout = TextLayout.from_ocr(ocr_result)
+        items, items_total = [], None
+        if layout is not None:
+            layout_amounts = self._extract_layout_amounts(layout)
+            log.debug("      Layout amounts: %s", layout_amounts)
+            for field, value in layout_amounts.items():
+                if amounts[field] == 0.0:
+                    amounts[field] = value
+            if self.line_items:
+                items, items_total = extract_line_items(layout.texts, layout.boxes)
+
+        # First get the total amount (most reliable)
+        total = amounts["total"]
 
         # Try individual tax extractions
-        cgst = self._extract_amount(full_text, "cgst")
-        sgst = self._extract_amount(full_text, "sgst")
-        igst = self._extract_amount(full_text, "igst")
+        cgst = amounts["cgst"]
+        sgst = amounts["sgst"]
+        igst = amounts["igst"]
 
         # Calculate total tax
         total_tax = cgst + sgst + igst
 
+        # If individual taxes not found, the line items give the tax exactly
+        items_tax = 0.0
+        if total_tax == 0 and items and all("gstRate" in item for item in items):
+            items_tax = round(sum(item["amount"] * item["gstRate"] / 100 for item in items), 2)
+        if items_tax > 0:
+            total_tax = items_tax
+            cgst = round(total_tax / 2, 2)
+            sgst = round(total_tax - cgst, 2)
+            log.debug("      Using line-item tax: %s, split into CGST=%s, SGST=%s", total_tax, cgst, sgst)
+
+        # Else try to extract total tax from TOTAL row (usually shows: TOTAL [disc] [tax] [amount])
+        total_tax_from_row = self._extract_total_tax_from_row(full_text) if total_tax == 0 else 0.0
+
         # If individual taxes not found but we have total tax from TOTAL row, split it
         if total_tax == 0 and total_tax_from_row > 0:
             # Assume CGST = SGST when IGST is 0 (intra-state transaction)
             total_tax = total_tax_from_row
             cgst = total_tax / 2
             sgst = total_tax / 2
-            print(
-                f"      Using TOTAL row tax: {total_tax_from_row}, split into CGST={cgst}, SGST={sgst}"
+            log.debug(
+                "      Using TOTAL row tax: %s, split into CGST=%s, SGST=%s", total_tax_from_row, cgst, sgst
             )
 
         # Calculate taxable amount
         if total > 0 and total_tax > 0:
             taxable = total - total_tax
         else:
-            taxable = self._extract_amount(full_text, "taxable")
+            taxable = amounts["taxable"]
 
-        print(
-            f"      Extracted amounts - Taxable: {taxable}, CGST: {cgst}, SGST: {sgst}, IGST: {igst}, Total: {total}, Total Tax: {total_tax}"
+        log.debug(
+            "      Extracted amounts - Taxable: %s, CGST: %s, SGST: %s, IGST: %s, Total: %s, Total Tax: %s",
+            taxable, cgst, sgst, igst, total, total_tax,
         )
 
         invoice_data = {
@@ -100,15 +799,15 @@ class InvoiceAnalyzer:
             "sgst": round(sgst, 2),
             "igst": round(igst, 2),
             "total": round(total, 2),
-            "confidence": 0.5,  # Will be updated below
+            "confidence": 0.5,  # Set by parse_invoice
         }
-
-        # Step 4: Calculate confidence
-        invoice_data["confidence"] = self._calculate_confidence(
-            full_text, lines, invoice_data
-        )
-
-        print(f"      Final result: {invoice_data}")
+        buyer_gstin = self._buyer_gstin(lines)
+        if buyer_gstin:
+            # A sale to a registered buyer (B2B in GSTR-1)
+            invoice_data["buyerGstin"] = buyer_gstin
+        if items:
+            invoice_data["items"] = items
+            invoice_data["itemsCheck"] = check_totals(items, invoice_data["taxableAmount"], total_tax, items_total)
 
         return invoice_data
 
@@ -118,28 +817,19 @@ class InvoiceAnalyzer:
         # Look in last 1500 chars where TOTAL row usually is
         search_text = text[-1500:] if len(text) > 1500 else text
 
-        print("      DEBUG: Searching for TOTAL row in last part of text...")
+        log.debug("      DEBUG: Searching for TOTAL row in last part of text...")
 
         # Look for pattern: TOTAL followed by 2-3 numbers (disc, tax, amount)
         # Handle multiple separators: र (Devanagari), ₹, RS, or just spaces
-        patterns = [
-            # Pattern 1: TOTAL separator num separator num num (with Devanagari र)
-            r"TOTAL[\s]+[^\d\s]*[\s]*([\d,]+\.?\d*)[\s]+[^\d\s]*[\s]*([\d,]+\.?\d*)[\s]+([\d,]+\.?\d*)",
-            # Pattern 2: TOTAL num num num (just spaces)
-            r"TOTAL[\s]+([\d,]+\.?\d*)[\s]+([\d,]+\.?\d*)[\s]+([\d,]+\.?\d*)",
-            # Pattern 3: More flexible - any 3 numbers after TOTAL within 100 chars
-            r"TOTAL[^0-9]{0,30}([\d,]+\.?\d*)[^0-9]{1,20}([\d,]+\.?\d*)[^0-9]{1,20}([\d,]+\.?\d*)",
-        ]
-
-        for i, pattern in enumerate(patterns):
-            match = re.search(pattern, search_text, re.IGNORECASE)
+        for i, pattern in enumerate(self.TOTAL_ROW_PATTERNS):
+            match = pattern.search(search_text)
             if match:
                 numbers = [match.group(j) for j in range(1, len(match.groups()) + 1)]
-                print(f"      DEBUG: Pattern {i + 1} matched! Found numbers: {numbers}")
+                log.debug("      DEBUG: Pattern %d matched! Found numbers: %s", i + 1, numbers)
                 # Convert to floats
                 try:
                     amounts = [float(n.replace(",", "")) for n in numbers if n]
-                    print(f"      DEBUG: Parsed amounts: {amounts}")
+                    log.debug("      DEBUG: Parsed amounts: %s", amounts)
                     # The largest number is usually the total amount
                     # The smallest is usually discount
                     # The middle one is tax
@@ -151,22 +841,22 @@ class InvoiceAnalyzer:
                         discount = amounts_sorted[0]  # Smallest
                         tax = amounts_sorted[1]  # Middle
 
-                        print(
-                            f"      DEBUG: Sorted - Discount:{discount}, Tax:{tax}, Total:{total_amount}"
+                        log.debug(
+                            "      DEBUG: Sorted - Discount:%s, Tax:%s, Total:%s", discount, tax, total_amount
                         )
 
                         # Sanity check: tax should be less than 50% of total and more than discount
                         if tax < total_amount * 0.5 and tax > 0:
-                            print(f"      DEBUG: Found tax from TOTAL row: {tax}")
+                            log.debug("      DEBUG: Found tax from TOTAL row: %s", tax)
                             return tax
                     elif len(amounts) == 2:
                         # First is likely tax, second is amount
                         return amounts[0] if amounts[0] < amounts[1] else 0
                 except (ValueError, IndexError) as e:
-                    print(f"      DEBUG: Error parsing amounts: {e}")
+                    log.debug("      DEBUG: Error parsing amounts: %s", e)
                     continue
 
-        print("      DEBUG: No tax found in TOTAL row")
+        log.debug("      DEBUG: No tax found in TOTAL row")
         return 0.0
 
     def _extract_vendor(self, text, lines):
@@ -175,21 +865,19 @@ class InvoiceAnalyzer:
         for line_text, conf in lines[:5]:  # Check first 5 lines
             if len(line_text) > 3 and conf > 0.5:
                 # Skip if it looks like invoice number or date
-                if not re.search(r"\d{4,}|invoice|bill|date", line_text, re.I):
+                if not self.VENDOR_SKIP_PATTERN.search(line_text):
                     return line_text.strip()
         return "N/A"
 
     def _extract_gstin(self, text):
         """Extract GSTIN number (format: 22AAAAA0000A1Z5)"""
-        # GSTIN pattern: 2 digits + 10 alphanumeric + 3 alphanumeric
-        pattern = r"\b\d{2}[A-Z]{5}\d{4}[A-Z]{1}[A-Z\d]{1}[Z]{1}[A-Z\d]{1}\b"
-        match = re.search(pattern, text.upper())
+        upper_text = text.upper()
+        match = self.GSTIN_PATTERN.search(upper_text)
         if match:
             return match.group(0)
 
         # Alternative: look for text near "GSTIN" keyword
-        gstin_pattern = r"GSTIN[:\s]*([A-Z0-9]{15})"
-        match = re.search(gstin_pattern, text.upper())
+        match = self.GSTIN_KEYWORD_PATTERN.search(upper_text)
         if match:
             return match.group(1)
 
@@ -197,36 +885,31 @@ class InvoiceAnalyzer:
 
     def _extract_invoice_number(self, text):
         """Extract invoice number"""
+        return self._find_invoice_number(text) or f"INV{datetime.now().strftime('%Y%m%d%H%M%S')}"
+
+    def _find_invoice_number(self, text):
+        """The invoice number printed on the page, or None"""
         # Look for patterns like "Invoice No: 123", "Bill No: 456"
-        patterns = [
-            r"invoice\s*(?:no\.?|number|#)[:\s]*([A-Z0-9/-]+)",
-            r"bill\s*(?:no\.?|number|#)[:\s]*([A-Z0-9/-]+)",
-            r"voucher\s*(?:no\.?|number)[:\s]*([A-Z0-9/-]+)",
-        ]
-
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        for pattern in self.INVOICE_NUMBER_PATTERNS:
+            match = pattern.search(text)
             if match:
                 return match.group(1).strip()
 
         # Fallback: find any invoice-like number
-        match = re.search(r"\b[A-Z]{2,4}[/-]?\d{4,}\b", text)
+        match = self.INVOICE_NUMBER_FALLBACK.search(text)
         if match:
             return match.group(0)
-
-        return f"INV{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        return None
 
     def _extract_date(self, text):
         """Extract invoice date"""
-        # Common date formats in India
-        date_patterns = [
-            r"\b(\d{1,2})[/-](\d{1,2})[/-](\d{4})\b",  # DD/MM/YYYY or DD-MM-YYYY
-            r"\b(\d{1,2})[/-](\d{1,2})[/-](\d{2})\b",  # DD/MM/YY
-            r"\b(\d{4})[/-](\d{1,2})[/-](\d{1,2})\b",  # YYYY/MM/DD
-        ]
-
-        for pattern in date_patterns:
-            match = re.search(pattern, text)
+        # Default to today's date
+        return self._find_date(text) or datetime.now().strftime("%d-%m-%Y")
+
+    def _find_date(self, text):
+        """The invoice date printed on the page (DD-MM-YYYY), or None"""
+        for pattern in self.DATE_PATTERNS:
+            match = pattern.search(text)
             if match:
                 groups = match.groups()
                 try:
@@ -237,112 +920,145 @@ class InvoiceAnalyzer:
                         return f"{groups[0].zfill(2)}-{groups[1].zfill(2)}-{year}"
                 except:
                     pass
+        return None
 
-        # Default to today's date
-        return datetime.now().strftime("%d-%m-%Y")
+    def refresh_fallbacks(self, invoice_data, text):
+        """
+        Make up again the fields the page did not show (today's date, an
+        INV<timestamp> number) - a cached record still holds the ones made
+        up on the day it was first read. text: the OCR text it was parsed from
+        """
+        if self._find_date(text) is None:
+            invoice_data["date"] = self._extract_date("")
+        if self._find_invoice_number(text) is None:
+            invoice_data["invoiceNo"] = self._extract_invoice_number("")
+
+    @staticmethod
+    def _parse_amount(amount_str):
+        """Float value of a matched amount, or None if unreadable or out of range"""
+        try:
+            amount = float(amount_str.replace(",", "").replace(" ", "").strip())
+        except ValueError:
+            return None
+        # Sanity check: amounts should be reasonable (0.01 to 10 crore)
+        return amount if 0.01 <= amount < 100000000 else None
 
     def _extract_amount(self, text, field_type):
-        """Extract monetary amounts (taxable, CGST, SGST, IGST, total)"""
-        # Keep original text for flexible matching
+        """
+        Extract one monetary amount (taxable, CGST, SGST, IGST, total).
+        Reference version of _extract_amounts for a single field.
+        """
         upper_text = text.upper()
 
         # For totals, search in the LAST 2000 chars (where summary section is)
         # For other fields, search in the last 3000 chars
-        if field_type == "total":
-            search_text = upper_text[-2000:] if len(upper_text) > 2000 else upper_text
-        elif field_type in ["cgst", "sgst", "igst", "taxable"]:
-            search_text = upper_text[-3000:] if len(upper_text) > 3000 else upper_text
-        else:
-            search_text = upper_text
-
-        # Patterns for different fields (more specific for invoice formats)
-        patterns = {
-            "taxable": [
-                r"TAXABLE\s*VALUE[:\s]*(?:RS\.?|₹|INR)?\s*([\d,]+\.?\d*)",
-                r"(?:SUB|GROSS)\s*TOTAL[:\s]*(?:RS\.?|₹|INR)?\s*([\d,]+\.?\d*)",
-                r"BASIC\s*(?:AMOUNT|VALUE)[:\s]*(?:RS\.?|₹|INR)?\s*([\d,]+\.?\d*)",
-            ],
-            "cgst": [
-                r"CGST[\s]*AMOUNT[:\s]*(?:RS\.?|₹|INR)?\s*([\d,]+\.?\d*)",
-                r"CGST[:\s]*(?:RS\.?|₹|INR)?\s*([\d,]+\.?\d*)",
-                r"C\.?G\.?S\.?T[:\s]*(?:RS\.?|₹|INR)?\s*([\d,]+\.?\d*)",
-            ],
-            "sgst": [
-                r"SGST[\s]*AMOUNT[:\s]*(?:RS\.?|₹|INR)?\s*([\d,]+\.?\d*)",
-                r"SGST[:\s]*(?:RS\.?|₹|INR)?\s*([\d,]+\.?\d*)",
-                r"S\.?G\.?S\.?T[:\s]*(?:RS\.?|₹|INR)?\s*([\d,]+\.?\d*)",
-            ],
-            "igst": [
-                r"IGST[\s]*AMOUNT[:\s]*(?:RS\.?|₹|INR)?\s*([\d,]+\.?\d*)",
-                r"IGST[:\s]*(?:RS\.?|₹|INR)?\s*([\d,]+\.?\d*)",
-                r"I\.?G\.?S\.?T[:\s]*(?:RS\.?|₹|INR)?\s*([\d,]+\.?\d*)",
-            ],
-            "total": [
-                r"BALANCE\s*AMOUNT[:\s]*(?:RS\.?|₹|INR)?\s*([\d,]+\.?\d*)",
-                r"(?:GRAND|FINAL|NET)\s*TOTAL[:\s]*(?:RS\.?|₹|INR)?\s*([\d,]+\.?\d*)",
-                r"TOTAL\s*(?:AMOUNT|PAYABLE)[:\s]*(?:RS\.?|₹|INR)?\s*([\d,]+\.?\d*)",
-                r"AMOUNT\s*PAYABLE[:\s]*(?:RS\.?|₹|INR)?\s*([\d,]+\.?\d*)",
-            ],
-        }
+        window = self.AMOUNT_WINDOWS.get(field_type)
+        search_text = upper_text[-window:] if window and len(upper_text) > window else upper_text
 
-        # Try each pattern in the search_text (last part of invoice)
-        for pattern in patterns.get(field_type, []):
-            # Search with DOTALL to handle line breaks
-            matches = list(re.finditer(pattern, search_text, re.DOTALL))
-
-            # Take the last match (usually the final calculated value)
-            if matches:
-                match = matches[-1]
-                amount_str = match.group(1).replace(",", "").replace(" ", "").strip()
-                try:
-                    amount = float(amount_str)
-                    # Sanity check: amounts should be reasonable (0.01 to 10 crore)
-                    if 0.01 <= amount < 100000000:
-                        return amount
-                except (ValueError, IndexError):
-                    continue
+        # Try each pattern in the search_text; take the last match
+        # (usually the final calculated value)
+        for pattern in self.AMOUNT_PATTERNS.get(field_type, []):
+            match = None
+            for match in pattern.finditer(search_text):
+                pass
+            if match:
+                amount = self._parse_amount(match.group(1))
+                if amount is not None:
+                    return amount
 
         # Fallback: Look for any number after the keyword in search_text
-        keyword_map = {
-            "taxable": ["TAXABLE VALUE", "TAXABLE", "SUB TOTAL", "SUBTOTAL"],
-            "cgst": ["CGST", "C.G.S.T", "C G S T"],
-            "sgst": ["SGST", "S.G.S.T", "S G S T"],
-            "igst": ["IGST", "I.G.S.T", "I G S T"],
-            "total": ["BALANCE AMOUNT", "GRAND TOTAL", "TOTAL", "AMOUNT PAYABLE"],
-        }
-
-        for keyword in keyword_map.get(field_type, []):
+        for keyword in self.AMOUNT_KEYWORDS.get(field_type, []):
             idx = search_text.find(keyword)
             if idx != -1:
-                # Search in next 100 characters
-                search_zone = search_text[idx : idx + 100]
-                # Find all numbers in this zone
-                numbers = re.findall(r"([\d,]+\.?\d+)", search_zone)
-                for num_str in numbers:
-                    try:
-                        amount = float(num_str.replace(",", ""))
-                        if 0.01 <= amount < 100000000:
-                            return amount
-                    except ValueError:
-                        continue
+                amount = self._first_amount(search_text[idx : idx + 100])
+                if amount is not None:
+                    return amount
 
         return 0.0
 
+    def _first_amount(self, search_zone):
+        for num_str in self.NUMBER_PATTERN.findall(search_zone):
+            amount = self._parse_amount(num_str)
+            if amount is not None:
+                return amount
+        return None
+
+    def _extract_amounts(self, text):
+        """
+        Extract all amount fields in one pass over the text.
+        Returns the same values as _extract_amount per field: the text is
+        upper-cased once, AMOUNT_ANCHOR finds every place a field pattern or
+        keyword can start, and only the patterns for that leading letter are
+        tried there (anchored), instead of every pattern scanning the text.
+        """
+        upper_text = text.upper()
+        length = len(upper_text)
+        starts = {
+            field: max(0, length - window) for field, window in self.AMOUNT_WINDOWS.items()
+        }
+
+        last_match = {}  # (field, pattern #) -> last match in the field's window
+        keyword_at = {}  # (field, keyword) -> first position in the field's window
+        for anchor in self.AMOUNT_ANCHOR.finditer(upper_text, min(starts.values())):
+            pos = anchor.start()
+            for field, i, pattern in self._AMOUNT_DISPATCH.get(upper_text[pos], ()):
+                if pos >= starts[field]:
+                    match = pattern.match(upper_text, pos)
+                    if match:
+                        last_match[field, i] = match
+            for field, keyword in self._KEYWORD_DISPATCH.get(upper_text[pos], ()):
+                if (
+                    pos >= starts[field]
+                    and (field, keyword) not in keyword_at
+                    and upper_text.startswith(keyword, pos)
+                ):
+                    keyword_at[field, keyword] = pos
+
+        amounts = {}
+        for field, patterns in self.AMOUNT_PATTERNS.items():
+            amounts[field] = 0.0
+            found = None
+            for i in range(len(patterns)):
+                match = last_match.get((field, i))
+                if match:
+                    found = self._parse_amount(match.group(1))
+                    if found is not None:
+                        break
+            if found is None:
+                for keyword in self.AMOUNT_KEYWORDS[field]:
+                    idx = keyword_at.get((field, keyword))
+                    if idx is not None:
+                        found = self._first_amount(upper_text[idx : idx + 100])
+                        if found is not None:
+                            break
+            if found is not None:
+                amounts[field] = found
+        return amounts
+
+    def _extract_layout_amounts(self, layout):
+        """Amount fields found next to their labels (TextLayout); missing ones are left out"""
+        amounts = {}
+        for field, label in self.AMOUNT_LABELS.items():
+            value = layout.value_after(label)
+            if value is not None and 0.01 <= value < 100000000:
+                amounts[field] = value
+        return amounts
+
     def _calculate_confidence(self, text, lines, invoice_data):
         """Calculate confidence score based on extracted data quality"""
         score = 0.5  # Base score
 
         # Check for key invoice elements
-        if re.search(r"\bGSTIN\b", text, re.IGNORECASE):
+        if self.CONFIDENCE_PATTERNS["gstin"].search(text):
             score += 0.15
 
-        if re.search(r"\binvoice|bill\b", text, re.IGNORECASE):
+        if self.CONFIDENCE_PATTERNS["invoice"].search(text):
             score += 0.1
 
-        if re.search(r"\d{2}[/-]\d{2}[/-]\d{2,4}", text):  # Date found
+        if self.CONFIDENCE_PATTERNS["date"].search(text):  # Date found
             score += 0.1
 
-        if re.search(r"CGST|SGST|IGST", text, re.IGNORECASE):
+        if self.CONFIDENCE_PATTERNS["tax"].search(text):
             score += 0.1
 
         # Boost score if we extracted actual amounts
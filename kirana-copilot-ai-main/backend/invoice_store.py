@@ -0,0 +1,362 @@
+"""
+Invoice Store - analyzed invoices kept in a local SQLite file
+Every invoice /analyze returns is saved with indexes on GSTIN, invoice
+number, return period, date and confidence band. Per-period totals (taxable,
+CGST, SGST, IGST, total) are kept in their own table and adjusted in the
+same transaction as each insert, correction or delete, so a period summary
+is one row lookup instead of a sum over its invoices.
+Amounts are stored as integer paise.
+"""
+
+import json
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from gstr1 import money
+
+DATE_RE = re.compile(r"^(\d{2})-(\d{2})-(\d{4})$")
+AMOUNTS = ("taxableAmount", "cgst", "sgst", "igst", "total")
+# Fields a correction may change (id, source and timestamps are kept)
+EDITABLE = ("vendor", "gstin", "buyerGstin", "invoiceNo", "date", *AMOUNTS, "confidence", "items")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS invoices (
+    id TEXT PRIMARY KEY,
+    vendor TEXT,
+    gstin TEXT,
+    invoice_no TEXT,
+    invoice_date TEXT,      -- YYYY-MM-DD ('' if the date could not be read)
+    period TEXT,            -- MMYYYY, the GSTR-1 return period
+    taxable INTEGER NOT NULL,
+    cgst INTEGER NOT NULL,
+    sgst INTEGER NOT NULL,
+    igst INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    confidence REAL,
+    confidence_band TEXT,
+    source TEXT,
+    page_hash TEXT,         -- perceptual hash of the page image (hex), see dedup.py
+    data TEXT NOT NULL,     -- the invoice as returned by /analyze (JSON)
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_invoices_gstin ON invoices (gstin);
+CREATE INDEX IF NOT EXISTS idx_invoices_invoice_no ON invoices (invoice_no);
+CREATE INDEX IF NOT EXISTS idx_invoices_period ON invoices (period);
+CREATE INDEX IF NOT EXISTS idx_invoices_date ON invoices (invoice_date);
+CREATE INDEX IF NOT EXISTS idx_invoices_band ON invoices (confidence_band);
+CREATE INDEX IF NOT EXISTS idx_invoices_same ON invoices (gstin, invoice_no, total);
+
+CREATE TABLE IF NOT EXISTS period_totals (
+    period TEXT PRIMARY KEY,
+    invoices INTEGER NOT NULL,
+    taxable INTEGER NOT NULL,
+    cgst INTEGER NOT NULL,
+    sgst INTEGER NOT NULL,
+    igst INTEGER NOT NULL,
+    total INTEGER NOT NULL
+);
+"""
+
+TOTAL_COLUMNS = ("taxable", "cgst", "sgst", "igst", "total")
+
+
+def confidence_band(confidence):
+    """"high" (>= 0.9), "medium" (>= 0.7) or "low" - the bands /analyze reports"""
+    if confidence >= 0.9:
+        return "high"
+    if confidence >= 0.7:
+        return "medium"
+    return "low"
+
+
+def validate_changes(changes):
+    """
+    The EDITABLE fields of a correction, checked and normalized: amounts as
+    numbers, confidence between 0 and 1, dates as a real DD-MM-YYYY day.
+    Raises ValueError naming the first bad field.
+    """
+    valid = {}
+    for field, value in changes.items():
+        if field not in EDITABLE:
+            continue
+        if field in AMOUNTS or field == "confidence":
+            if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+                raise ValueError(f"{field} must be a number")
+            try:
+                number = Decimal(str(value).replace(",", ""))
+            except InvalidOperation:
+                raise ValueError(f"{field} must be a number") from None
+            if not number.is_finite():
+                raise ValueError(f"{field} must be a number")
+            if field == "confidence":
+                if not 0 <= number <= 1:
+                    raise ValueError("confidence must be between 0 and 1")
+                value = float(number)
+            else:
+                value = float(money(number))
+        elif field == "date":
+            try:
+                if not (isinstance(value, str) and DATE_RE.match(value)):
+                    raise ValueError
+                datetime.strptime(value, "%d-%m-%Y")  # a real day, not 31-02
+            except ValueError:
+                raise ValueError("date must be a DD-MM-YYYY date") from None
+        elif field == "items":
+            if not isinstance(value, list):
+                raise ValueError("items must be a list")
+        elif not isinstance(value, str):
+            raise ValueError(f"{field} must be text")
+        valid[field] = value
+    return valid
+
+
+def _paise(value):
+    return int(money(value) * 100)
+
+
+def _rupees(paise):
+    return float(Decimal(paise) / 100)
+
+
+def _row(invoice):
+    """Column values for one invoice dict"""
+    match = DATE_RE.match(str(invoice.get("date") or ""))
+    day, month, year = match.groups() if match else ("", "", "")
+    confidence = float(invoice.get("confidence") or 0)
+    return {
+        "vendor": invoice.get("vendor"),
+        "gstin": str(invoice.get("gstin") or "").upper(),
+        "invoice_no": invoice.get("invoiceNo"),
+        "invoice_date": f"{year}-{month}-{day}" if match else "",
+        "period": month + year,
+        "taxable": _paise(invoice.get("taxableAmount")),
+        "cgst": _paise(invoice.get("cgst")),
+        "sgst": _paise(invoice.get("sgst")),
+        "igst": _paise(invoice.get("igst")),
+        "total": _paise(invoice.get("total")),
+        "confidence": confidence,
+        "confidence_band": confidence_band(confidence),
+        "source": invoice.get("source"),
+        "page_hash": invoice.get("pageHash"),
+        "data": json.dumps(invoice),
+    }
+
+
+class InvoiceStore:
+    """
+    SQLite-backed invoice store, safe to share between request threads
+    (one connection, writes serialized by a lock).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        columns = [row["name"] for row in self._conn.execute("PRAGMA table_info(invoices)")]
+        if columns and "page_hash" not in columns:
+            # Stores created before duplicate detection
+            self._conn.execute("ALTER TABLE invoices ADD COLUMN page_hash TEXT")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _adjust_totals(self, row, sign):
+        """Add (sign=1) or remove (sign=-1) one invoice's amounts from its period"""
+        values = [row[column] * sign for column in TOTAL_COLUMNS]
+        self._conn.execute(
+            "INSERT INTO period_totals (period, invoices, taxable, cgst, sgst, igst, total)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT(period) DO UPDATE SET invoices = invoices + excluded.invoices,"
+            " taxable = taxable + excluded.taxable, cgst = cgst + excluded.cgst,"
+            " sgst = sgst + excluded.sgst, igst = igst + excluded.igst, total = total + excluded.total",
+            (row["period"], sign, *values),
+        )
+        self._conn.execute("DELETE FROM period_totals WHERE period = ? AND invoices <= 0", (row["period"],))
+
+    def _write(self, invoice_id, invoice, now):
+        """Insert or replace one invoice, keeping the period totals in step (lock and transaction held)"""
+        old = self._conn.execute("SELECT * FROM invoices WHERE id = ?", (invoice_id,)).fetchone()
+        if old is not None:
+            self._adjust_totals(old, -1)
+        row = _row(invoice)
+        columns = ["id", *row, "created_at", "updated_at"]
+        values = [invoice_id, *row.values(), old["created_at"] if old else now, now]
+        self._conn.execute(
+            f"INSERT OR REPLACE INTO invoices ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            values,
+        )
+        self._adjust_totals(row, 1)
+
+    def add_many(self, invoices):
+        """
+        Save analyzed invoices (one transaction); an invoice whose id is
+        already stored replaces it. Returns how many were saved.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for invoice in invoices:
+                    self._write(invoice["id"], invoice, now)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return len(invoices)
+
+    def get(self, invoice_id):
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM invoices WHERE id = ?", (invoice_id,)).fetchone()
+        return json.loads(row["data"]) if row else None
+
+    def update(self, invoice_id, changes):
+        """
+        Correct an invoice's fields (EDITABLE only); the period totals follow,
+        including a move to another period. Returns the updated invoice, or None.
+        Raises ValueError for a field that does not pass validate_changes().
+        """
+        changes = validate_changes(changes)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT data FROM invoices WHERE id = ?", (invoice_id,)).fetchone()
+                if row is None:
+                    self._conn.execute("ROLLBACK")
+                    return None
+                invoice = json.loads(row["data"])
+                invoice.update(changes)
+                invoice["corrected"] = True
+                self._write(invoice_id, invoice, time.time())
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return invoice
+
+    def delete(self, invoice_id):
+        """Remove an invoice and its amounts from the period totals; False if unknown"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT * FROM invoices WHERE id = ?", (invoice_id,)).fetchone()
+                if row is not None:
+                    self._conn.execute("DELETE FROM invoices WHERE id = ?", (invoice_id,))
+                    self._adjust_totals(row, -1)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return row is not None
+
+    def find(self, gstin=None, invoice_no=None, period=None, band=None, date_from=None, date_to=None,
+             limit=100, offset=0):
+        """Stored invoices matching all given filters, oldest first (dates as YYYY-MM-DD)"""
+        filters = [
+            ("gstin = ?", gstin and gstin.upper()),
+            ("invoice_no = ?", invoice_no),
+            ("period = ?", period),
+            ("confidence_band = ?", band),
+            ("invoice_date >= ?", date_from),
+            ("invoice_date <= ?", date_to),
+        ]
+        clauses = [clause for clause, value in filters if value]
+        params = [value for _, value in filters if value]
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT data FROM invoices{where} ORDER BY invoice_date, rowid LIMIT ? OFFSET ?",
+                (*params, limit, offset),
+            ).fetchall()
+        return [json.loads(row["data"]) for row in rows]
+
+    def find_same(self, gstin, invoice_no, total):
+        """Id of a stored invoice with the same GSTIN, invoice number and total, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id FROM invoices WHERE gstin = ? AND invoice_no = ? AND total = ? LIMIT 1",
+                (str(gstin).upper(), invoice_no, _paise(total)),
+            ).fetchone()
+        return row["id"] if row else None
+
+    def iter_page_hashes(self, after=0, batch=5000):
+        """
+        (row id, invoice id, page hash) of every stored invoice that has one,
+        in insertion order; after= skips the rows up to that row id
+        """
+        last_rowid = after
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT rowid, id, page_hash FROM invoices"
+                    " WHERE page_hash IS NOT NULL AND rowid > ? ORDER BY rowid LIMIT ?",
+                    (last_rowid, batch),
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield row["rowid"], row["id"], row["page_hash"]
+            last_rowid = rows[-1]["rowid"]
+
+    def iter_period(self, period, batch=500):
+        """All invoices of a return period, read a batch at a time"""
+        last_rowid = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT rowid, data FROM invoices WHERE period = ? AND rowid > ? ORDER BY rowid LIMIT ?",
+                    (period, last_rowid, batch),
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield json.loads(row["data"])
+            last_rowid = rows[-1]["rowid"]
+
+    def period_summary(self, period):
+        """Running totals of one return period (GSTR-1 summary shape), or None"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM period_totals WHERE period = ?", (period,)).fetchone()
+        return self._summary(row) if row else None
+
+    def periods(self):
+        """Running totals of every period with stored invoices, latest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM period_totals ORDER BY substr(period, 3) DESC, substr(period, 1, 2) DESC"
+            ).fetchall()
+        return [self._summary(row) for row in rows]
+
+    @staticmethod
+    def _summary(row):
+        tax = row["cgst"] + row["sgst"] + row["igst"]
+        return {
+            "returnPeriod": row["period"],
+            "totalInvoices": row["invoices"],
+            "totalTaxableAmount": _rupees(row["taxable"]),
+            "totalCGST": _rupees(row["cgst"]),
+            "totalSGST": _rupees(row["sgst"]),
+            "totalIGST": _rupees(row["igst"]),
+            "totalTax": _rupees(tax),
+            "totalAmount": _rupees(row["taxable"] + tax),
+            "invoiceValue": _rupees(row["total"]),
+        }
+
+    def get_stats(self):
+        """Invoice count per confidence band for /health"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT confidence_band, COUNT(*) AS n FROM invoices GROUP BY confidence_band"
+            ).fetchall()
+        bands = {row["confidence_band"]: row["n"] for row in rows}
+        return {"invoices": sum(bands.values()), "byConfidence": bands, "path": self.path}
@@ -0,0 +1,348 @@
+"""
+Analysis Jobs - background /analyze runs with partial results
+Lets the client get a job id right away and stream invoices as pages finish.
+With a database path, jobs are also written to SQLite, so every serve.py
+worker can answer /jobs/<id> for a job another worker is running.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from telemetry import process_alive
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    pid INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    created REAL NOT NULL,
+    finished REAL,
+    total INTEGER,
+    explanation TEXT,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS job_results (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    idx INTEGER NOT NULL,
+    invoice TEXT NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished);
+"""
+
+FINISHED = ("done", "failed")
+
+
+class Job:
+    """
+    One asynchronous /analyze run.
+    Results are keyed by upload position and also kept in completion order,
+    so streams can send each invoice as soon as its page is done.
+    """
+
+    def __init__(self, journal=None):
+        self.id = uuid.uuid4().hex
+        self.status = "queued"  # queued -> running -> done | failed
+        self.created = time.time()
+        self.finished = None
+        self.total = None  # known once every file has been queued
+        self.results = {}  # index -> invoice dict
+        self.completion_order = []
+        self.explanation = None
+        self.error = None
+        self._cond = threading.Condition()
+        self._journal = journal  # JobJournal that other processes read, or None
+
+    def _changed(self):
+        """Wake streams and write the new state to the journal (condition held)"""
+        self._cond.notify_all()
+        if self._journal is not None:
+            self._journal.save(self)
+
+    def start(self):
+        with self._cond:
+            self.status = "running"
+            self._changed()
+
+    def add_result(self, index, invoice):
+        """Record one finished page; returns True when it was the last one"""
+        with self._cond:
+            self.results[index] = invoice
+            self.completion_order.append(index)
+            if self._journal is not None:
+                self._journal.add_result(self, len(self.completion_order), index, invoice)
+            self._cond.notify_all()
+            return self.total is not None and len(self.results) >= self.total
+
+    def set_total(self, total):
+        """Record how many results to expect; returns True if all are already in"""
+        with self._cond:
+            self.total = total
+            self._changed()
+            return len(self.results) >= total
+
+    def finish(self, explanation):
+        with self._cond:
+            if self.status in FINISHED:
+                return
+            self.status = "done"
+            self.explanation = explanation
+            self.finished = time.time()
+            self._changed()
+
+    def fail(self, error):
+        with self._cond:
+            self.status = "failed"
+            self.error = str(error)
+            self.finished = time.time()
+            self._changed()
+
+    def snapshot(self):
+        """Status plus the invoices finished so far, in upload order"""
+        with self._cond:
+            return {
+                "jobId": self.id,
+                "status": self.status,
+                "total": self.total,
+                "completed": len(self.results),
+                "invoices": [self.results[i] for i in sorted(self.results)],
+                "explanation": self.explanation,
+                "error": self.error,
+            }
+
+    def events(self, heartbeat=15.0):
+        """
+        Yield stream events: one per finished invoice (completion order),
+        then a final "done" or "failed" event. Heartbeats keep idle
+        mobile connections from being dropped by proxies.
+        """
+        sent = 0
+        while True:
+            timed_out = False
+            with self._cond:
+                if sent == len(self.completion_order) and self.status not in FINISHED:
+                    timed_out = not self._cond.wait(timeout=heartbeat)
+
+                pending = [
+                    (i, self.results[i]) for i in self.completion_order[sent:]
+                ]
+                sent += len(pending)
+                status = self.status
+                total = self.total
+
+            if not pending and status not in FINISHED:
+                if timed_out:
+                    yield {"type": "heartbeat"}
+                continue
+
+            for index, invoice in pending:
+                yield {"type": "invoice", "index": index, "total": total, "invoice": invoice}
+
+            if status == "done" and sent == len(self.completion_order):
+                yield {"type": "done", "total": total, "explanation": self.explanation}
+                return
+            if status == "failed":
+                yield {"type": "failed", "error": self.error}
+                return
+
+
+def format_ndjson(event):
+    return json.dumps(event) + "\n"
+
+
+def format_sse(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+class JobJournal:
+    """
+    SQLite copy of the jobs, shared by processes: the process running a job
+    writes each change, the others read it (one connection, writes
+    serialized by a lock)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def save(self, job):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (id, pid, status, created, finished, total, explanation, error)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job.id, os.getpid(), job.status, job.created, job.finished, job.total, job.explanation, job.error),
+            )
+
+    def add_result(self, job, seq, index, invoice):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO job_results (job_id, seq, idx, invoice) VALUES (?, ?, ?, ?)",
+                (job.id, seq, index, json.dumps(invoice)),
+            )
+
+    def has(self, job_id):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM jobs WHERE id = ?", (job_id,)).fetchone() is not None
+
+    def load(self, job_id, after=0):
+        """
+        (job row, [(index, invoice)] finished after the first `after` ones)
+        The row is read first, so a "done" row always comes with every result
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None, []
+            results = self._conn.execute(
+                "SELECT idx, invoice FROM job_results WHERE job_id = ? AND seq > ? ORDER BY seq",
+                (job_id, after),
+            ).fetchall()
+        return dict(row), [(result["idx"], json.loads(result["invoice"])) for result in results]
+
+    def prune(self, ttl, max_jobs):
+        """Forget expired jobs, then the oldest finished ones beyond max_jobs"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "DELETE FROM jobs WHERE finished < ?"
+                    " OR id IN (SELECT id FROM jobs WHERE finished IS NOT NULL ORDER BY finished DESC LIMIT -1 OFFSET ?)",
+                    (time.time() - ttl, max_jobs),
+                )
+                self._conn.execute("DELETE FROM job_results WHERE job_id NOT IN (SELECT id FROM jobs)")
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def get_stats(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) AS jobs FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["jobs"] for row in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class StoredJob:
+    """
+    Read-only view of a job another process is running (see JobJournal):
+    the same snapshot() and events() as Job, polled from the database
+    """
+
+    def __init__(self, journal, job_id, poll=0.5):
+        self.id = job_id
+        self._journal = journal
+        self._poll = poll
+
+    def _load(self, after=0):
+        row, results = self._journal.load(self.id, after)
+        if row is None:
+            row = {"status": "failed", "total": None, "explanation": None, "error": "Job expired"}
+        elif row["status"] not in FINISHED and not process_alive(row["pid"]):
+            row.update(status="failed", error="The server worker running this job exited")
+        return row, results
+
+    def snapshot(self):
+        row, results = self._load()
+        invoices = dict(results)
+        return {
+            "jobId": self.id,
+            "status": row["status"],
+            "total": row["total"],
+            "completed": len(invoices),
+            "invoices": [invoices[i] for i in sorted(invoices)],
+            "explanation": row["explanation"],
+            "error": row["error"],
+        }
+
+    def events(self, heartbeat=15.0):
+        """Job.events() for a job of another process: polls for new results"""
+        sent = 0
+        idle = 0.0
+        while True:
+            row, results = self._load(sent)
+            sent += len(results)
+            for index, invoice in results:
+                yield {"type": "invoice", "index": index, "total": row["total"], "invoice": invoice}
+            if row["status"] == "done":
+                yield {"type": "done", "total": row["total"], "explanation": row["explanation"]}
+                return
+            if row["status"] == "failed":
+                yield {"type": "failed", "error": row["error"]}
+                return
+            if results:
+                idle = 0.0
+                continue
+            time.sleep(self._poll)
+            idle += self._poll
+            if idle >= heartbeat:
+                idle = 0.0
+                yield {"type": "heartbeat"}
+
+
+class JobStore:
+    """
+    Job registry; finished jobs are dropped after ttl seconds. Jobs live in
+    memory, and with a database path (path) also in SQLite, where get() finds
+    the jobs of other processes.
+    """
+
+    def __init__(self, ttl=3600, max_jobs=1000, path=None):
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.journal = JobJournal(path) if path else None
+
+    def create(self):
+        job = Job(self.journal)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        if self.journal is not None:
+            self.journal.prune(self.ttl, self.max_jobs)
+            self.journal.save(job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.journal is not None and self.journal.has(job_id):
+            return StoredJob(self.journal, job_id)
+        return job
+
+    def _prune(self):
+        """Forget expired jobs, then the oldest finished ones if over max_jobs (lock held)"""
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished and now - job.finished > self.ttl:
+                del self._jobs[job_id]
+
+        if len(self._jobs) >= self.max_jobs:
+            finished = sorted(
+                (job for job in self._jobs.values() if job.finished),
+                key=lambda job: job.finished,
+            )
+            for job in finished[: len(self._jobs) - self.max_jobs + 1]:
+                del self._jobs[job.id]
+
+    def get_stats(self):
+        if self.journal is not None:
+            return self.journal.get_stats()  # every process's jobs
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return counts
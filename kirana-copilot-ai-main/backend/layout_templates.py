@@ -0,0 +1,206 @@
+"""
+Layout Templates - where each supplier prints its invoice fields, keyed by GSTIN
+A distributor prints every invoice from one fixed layout. After a
+high-confidence extraction the analyzer saves where the lines holding the
+GSTIN, invoice number, date and amounts sat on the page, as fractions of the
+page size. On later pages only the lines inside the known GSTIN regions are
+read first; a valid GSTIN found there selects its supplier's template, and
+only the lines inside that template's regions are recognized.
+
+Templates are kept in SQLite so all OCR worker processes share them. A
+template that stops matching (MAX_MISSES pages in a row) is dropped, and
+the least recently used ones go once there are more than max_templates.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from gstin import valid_gstin
+
+# Templates written with another format are dropped on load (bump on layout changes here)
+FORMAT_VERSION = 1
+FIELDS = ("gstin", "invoiceNo", "date", "amounts")
+MAX_MISSES = 3
+# Lines move a little between photos and scans of one layout (fraction of the page)
+REGION_MARGIN = 0.015
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS templates (
+    gstin TEXT PRIMARY KEY,
+    format INTEGER NOT NULL,
+    version INTEGER NOT NULL,   -- 1, 2... each time the layout is learned again
+    vendor TEXT,
+    regions TEXT NOT NULL,      -- { field: [[x0, y0, x1, y1], ...] } as page fractions (JSON)
+    hits INTEGER NOT NULL DEFAULT 0,
+    misses INTEGER NOT NULL DEFAULT 0,  -- pages in a row the template did not read
+    created_at REAL NOT NULL,
+    used_at REAL NOT NULL
+);
+"""
+
+
+def in_regions(boxes, regions, width, height, margin=REGION_MARGIN):
+    """
+    Mask of the [x0, y0, x1, y1] pixel boxes that fall in any region (page
+    fractions): overlapping it horizontally, vertical centre inside it
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    regions = np.asarray(regions, dtype=np.float32).reshape(-1, 4)
+    if not len(boxes) or not len(regions):
+        return np.zeros(len(boxes), dtype=bool)
+    scaled = regions * np.array([width, height, width, height], dtype=np.float32)
+    scaled += np.array([-width, -height, width, height], dtype=np.float32) * margin
+    x0, y0, x1, y1 = (boxes[:, None, i] for i in range(4))
+    centre = (y0 + y1) / 2
+    hit = (x0 <= scaled[:, 2]) & (x1 >= scaled[:, 0]) & (centre >= scaled[:, 1]) & (centre <= scaled[:, 3])
+    return hit.any(axis=1)
+
+
+class LayoutTemplates:
+    """
+    GSTIN -> template store, safe to share between threads. Each process
+    keeps the templates in memory and reloads them when another process
+    has changed the file.
+    """
+
+    def __init__(self, path, max_templates=1000):
+        self.path = path
+        self.max_templates = max_templates
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.execute("DELETE FROM templates WHERE format != ?", (FORMAT_VERSION,))
+        self._templates = {}  # GSTIN -> template
+        self._gstin_regions = np.zeros((0, 4), dtype=np.float32)
+        self._data_version = None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _refresh(self):
+        """Reload the templates if another connection wrote to the file (lock held)"""
+        data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return
+        self._data_version = data_version
+        self._templates = {
+            row["gstin"]: self._template(row) for row in self._conn.execute("SELECT * FROM templates")
+        }
+        self._index()
+
+    @staticmethod
+    def _template(row):
+        regions = json.loads(row["regions"])
+        return {
+            "gstin": row["gstin"],
+            "version": row["version"],
+            "vendor": row["vendor"],
+            "regions": {field: np.asarray(boxes, dtype=np.float32).reshape(-1, 4) for field, boxes in regions.items()},
+            # Every stored line box, for the second (template) pass
+            "boxes": np.concatenate(
+                [np.asarray(boxes, dtype=np.float32).reshape(-1, 4) for boxes in regions.values()]
+            ),
+        }
+
+    def _index(self):
+        """Rebuild the GSTIN regions of all templates (lock held)"""
+        boxes = [template["regions"]["gstin"] for template in self._templates.values()]
+        self._gstin_regions = np.unique(np.concatenate(boxes).round(3), axis=0) if boxes else np.zeros((0, 4))
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._templates)
+
+    def gstin_regions(self):
+        """(N, 4) page-fraction boxes where the known suppliers print their GSTIN"""
+        with self._lock:
+            self._refresh()
+            return self._gstin_regions
+
+    def get(self, gstin):
+        """The template for a GSTIN, or None - also for a GSTIN that fails its checksum"""
+        if not valid_gstin(gstin):
+            return None
+        with self._lock:
+            self._refresh()
+            return self._templates.get(gstin)
+
+    def learn(self, gstin, vendor, regions):
+        """
+        Save (or replace, as the next version) the template of a GSTIN
+        regions: { field: [[x0, y0, x1, y1], ...] } as page fractions
+        Returns the template's version, or None if the GSTIN is not valid
+        """
+        if not valid_gstin(gstin):
+            return None
+        regions = {field: np.round(np.asarray(boxes, dtype=np.float64), 4).tolist() for field, boxes in regions.items()}
+        now = time.time()
+        with self._lock:
+            self._refresh()
+            row = self._conn.execute(
+                "INSERT INTO templates (gstin, format, version, vendor, regions, created_at, used_at)"
+                " VALUES (?, ?, 1, ?, ?, ?, ?)"
+                " ON CONFLICT(gstin) DO UPDATE SET format = excluded.format, version = version + 1,"
+                " vendor = excluded.vendor, regions = excluded.regions, misses = 0,"
+                " created_at = excluded.created_at, used_at = excluded.used_at"
+                " RETURNING *",
+                (gstin, FORMAT_VERSION, vendor, json.dumps(regions), now, now),
+            ).fetchone()
+            self._templates[gstin] = self._template(row)
+            excess = len(self._templates) - self.max_templates
+            if excess > 0:
+                oldest = [
+                    row["gstin"]
+                    for row in self._conn.execute(
+                        "SELECT gstin FROM templates ORDER BY used_at LIMIT ?", (excess,)
+                    )
+                ]
+                self._delete(oldest)
+            self._index()
+            return self._templates[gstin]["version"]
+
+    def hit(self, gstin):
+        """A page was read with the GSTIN's template"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE templates SET hits = hits + 1, misses = 0, used_at = ? WHERE gstin = ?",
+                (time.time(), gstin),
+            )
+
+    def miss(self, gstin):
+        """
+        The GSTIN's template did not read a page (fields missing or another
+        GSTIN in its place). Returns True if that dropped the template.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "UPDATE templates SET misses = misses + 1 WHERE gstin = ? RETURNING misses", (gstin,)
+            ).fetchone()
+            if row is None or row["misses"] < MAX_MISSES:
+                return False
+            self._delete([gstin])
+            self._index()
+            return True
+
+    def _delete(self, gstins):
+        """Evict templates (lock held)"""
+        for gstin in gstins:
+            self._conn.execute("DELETE FROM templates WHERE gstin = ?", (gstin,))
+            self._templates.pop(gstin, None)
+
+    def get_stats(self):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) AS templates, COALESCE(SUM(hits), 0) AS hits FROM templates"
+            ).fetchone()
+            return {"templates": row["templates"], "pagesRead": row["hits"]}
@@ -0,0 +1,211 @@
+"""
+Line Items - the item table of an invoice from positioned text lines
+Works on whole-page OCR lines (or a PDF text layer) with their boxes. Rows
+come from text_layout.group_rows (line centres sorted, split at gaps).
+Columns come from the table's horizontal projection: how many rows have
+text at each x position. A column is a run of positions that enough rows
+cover, so one long description or two merged cells cannot join two columns.
+The header row (the one with "HSN") names the columns; every row below it
+up to the TOTAL row or the end of the table is one item.
+"""
+
+import re
+
+import numpy as np
+
+from text_layout import boxes_array, group_rows, parse_value
+
+# Column header -> item field, checked in this order (the first match names the column)
+HEADER_PATTERNS = [
+    (field, re.compile(pattern, re.I))
+    for field, pattern in [
+        ("hsn", r"\bHSN|\bSAC\b"),
+        ("taxAmount", r"(?:[CSI]?GST|TAX)\s*(?:AMT|AMOUNT)"),
+        ("gstRate", r"(?:GST|TAX)\s*(?:%|RATE)|RATE\s*%|^\s*%\s*$"),
+        ("qty", r"\bQTY\b|QUANTITY|\bNOS\b"),
+        ("rate", r"\bRATE\b|PRICE|\bMRP\b"),
+        ("amount", r"TAXABLE|AMOUNT|\bAMT\b|VALUE|\bTOTAL\b"),
+        ("description", r"DESCRIPTION|PARTICULARS|\bITEM|PRODUCT|GOODS"),
+    ]
+]
+HEADER_ANCHOR = HEADER_PATTERNS[0][1]
+# A line starting with TOTAL / SUB TOTAL / GRAND TOTAL ends the table
+TOTAL_ROW = re.compile(r"^\W*(?:SUB\s*-?\s*|GRAND\s*)?TOTAL\b", re.I | re.M)
+PERCENT = re.compile(r"(\d+(?:\.\d+)?)\s*%?")
+HSN_CODE = re.compile(r"^\d{4,8}$")
+
+# Rows with fewer boxes than this are not item rows (wrapped descriptions,
+# notes); two of them in a row end the table
+MIN_ROW_CELLS = 3
+# A column is x positions covered by at least this share of the table rows
+COLUMN_MIN_COVERAGE = 0.3
+# Line sums may differ from the invoice totals by per-line rounding
+CHECK_TOLERANCE = 1.0
+
+
+def _header_row(rows, texts):
+    """Position in rows of the first row that looks like a table header, or None"""
+    for r, members in enumerate(rows):
+        if len(members) < MIN_ROW_CELLS or not any(HEADER_ANCHOR.search(texts[i]) for i in members):
+            continue
+        named = {field for i in members for field, pattern in HEADER_PATTERNS if pattern.search(texts[i])}
+        if len(named) >= 2:
+            return r
+    return None
+
+
+def find_columns(boxes, row_count):
+    """
+    [x0, x1) spans of the table's columns from its boxes (N, 4): runs of x
+    positions that at least COLUMN_MIN_COVERAGE of the rows have text at
+    """
+    start = int(np.floor(boxes[:, 0].min()))
+    x0 = np.floor(boxes[:, 0]).astype(np.int64) - start
+    x1 = np.ceil(boxes[:, 2]).astype(np.int64) - start
+    coverage = np.zeros(int(x1.max()) + 2, dtype=np.int64)
+    np.add.at(coverage, x0, 1)
+    np.add.at(coverage, x1, -1)
+    covered = np.cumsum(coverage) >= max(1, COLUMN_MIN_COVERAGE * row_count)
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], covered.astype(np.int8), [0]])))
+    return edges.reshape(-1, 2) + start
+
+
+def assign_columns(boxes, columns):
+    """Column number per box: the column it overlaps most (nearest one if none)"""
+    overlap = np.minimum(boxes[:, None, 2], columns[None, :, 1]) - np.maximum(boxes[:, None, 0], columns[None, :, 0])
+    centres = (boxes[:, 0] + boxes[:, 2]) / 2
+    distance = np.abs(centres[:, None] - columns.mean(axis=1)[None, :])
+    return np.where(overlap.max(axis=1) > 0, overlap.argmax(axis=1), distance.argmin(axis=1))
+
+
+def _column_fields(header, texts, column_of):
+    """{ column number: item field } from the header row's boxes"""
+    fields = {}
+    for i in header:
+        for field, pattern in HEADER_PATTERNS:
+            if pattern.search(texts[i]):
+                fields.setdefault(int(column_of[i]), field)
+                break
+    # Several amount columns (taxable value, total with tax): keep the taxable one
+    amounts = sorted(column for column, field in fields.items() if field == "amount")
+    if len(amounts) > 1:
+        taxable = [c for c in amounts if any("TAXABLE" in texts[i].upper() for i in header if column_of[i] == c)]
+        keep = taxable[0] if taxable else amounts[0]
+        fields = {c: f for c, f in fields.items() if f != "amount" or c == keep}
+    return fields
+
+
+def _item(cells):
+    """One item dict from { field: cell text }, or None if the row has no amount"""
+    item = {}
+    if "description" in cells:
+        item["description"] = cells["description"].strip()
+    hsn = re.sub(r"[^0-9]", "", cells.get("hsn", ""))
+    if HSN_CODE.match(hsn):
+        item["hsn"] = hsn
+    for field in ("qty", "rate", "amount"):
+        value = parse_value(cells.get(field, ""))
+        if value is not None:
+            item[field] = value
+    match = PERCENT.search(cells.get("gstRate", ""))
+    if match:
+        item["gstRate"] = float(match.group(1))
+    if "amount" not in item and "qty" in item and "rate" in item:
+        item["amount"] = round(item["qty"] * item["rate"], 2)
+    return item if item.get("amount") else None
+
+
+def extract_line_items(texts, boxes):
+    """
+    Items of the page's table as dicts with description, hsn, qty, rate,
+    gstRate and amount (the taxable value; fields that could not be read are
+    left out), plus the amount on the TOTAL row if there is one.
+    Returns (items, total row amount or None); ([], None) without a table.
+    """
+    boxes = boxes_array(boxes)
+    if len(boxes) != len(texts) or len(boxes) < MIN_ROW_CELLS * 2:
+        return [], None
+    rows = group_rows(boxes)
+    first = _header_row(rows, texts)
+    if first is None:
+        return [], None
+
+    # One scan of the page text finds the TOTAL lines
+    joined = "\n".join(texts)
+    line_starts = np.cumsum([0] + [len(text) + 1 for text in texts[:-1]])
+    total_lines = np.searchsorted(line_starts, [m.start() for m in TOTAL_ROW.finditer(joined)], side="right") - 1
+    row_of = np.empty(len(boxes), dtype=np.int64)
+    row_of[np.concatenate(rows)] = np.repeat(np.arange(len(rows)), [len(members) for members in rows])
+    total_rows = set(row_of[total_lines].tolist())
+
+    table, total_row, short = [first], None, 0
+    for r in range(first + 1, len(rows)):
+        if r in total_rows:
+            total_row = rows[r]
+            break
+        if len(rows[r]) < MIN_ROW_CELLS:
+            short += 1
+            if short == 2:
+                break
+            continue
+        short = 0
+        table.append(r)
+    if len(table) < 2:
+        return [], None
+
+    indices = np.concatenate([rows[r] for r in table])
+    columns = find_columns(boxes[indices], len(table))
+    column_of = np.full(len(boxes), -1, dtype=np.int64)
+    column_of[indices] = assign_columns(boxes[indices], columns)
+    fields = _column_fields(rows[first], texts, column_of)
+    if "amount" not in fields.values():
+        return [], None
+
+    # Item boxes in reading order (row, then x), only in named columns
+    field_names = [fields.get(c) for c in range(len(columns))]
+    item_rows = row_of[indices]
+    order = np.lexsort((boxes[indices, 0], item_rows))
+    items, cells, current = [], {}, None
+    for i, r in zip(indices[order].tolist(), item_rows[order].tolist()):
+        field = field_names[column_of[i]]
+        if r == first or field is None:
+            continue
+        if r != current:
+            item = _item(cells) if cells else None
+            if item is not None:
+                items.append(item)
+            cells, current = {}, r
+        cells[field] = f"{cells[field]} {texts[i]}" if field in cells else texts[i]
+    item = _item(cells) if cells else None
+    if item is not None:
+        items.append(item)
+
+    total = None
+    if total_row is not None:
+        placed = assign_columns(boxes[total_row], columns)
+        for i, column in zip(total_row.tolist(), placed.tolist()):
+            if field_names[column] == "amount":
+                total = parse_value(texts[i])
+    return items, total
+
+
+def check_totals(items, taxable, tax, total_row=None):
+    """
+    Whether the line items add up: summed taxable values against the
+    invoice's taxable amount (and the table's TOTAL row), summed
+    amount x GST rate against its CGST + SGST + IGST
+    """
+    items_taxable = round(sum(item["amount"] for item in items), 2)
+    rated = [item for item in items if "gstRate" in item]
+    items_tax = round(sum(item["amount"] * item["gstRate"] / 100 for item in rated), 2)
+    matches = abs(items_taxable - taxable) <= CHECK_TOLERANCE
+    if total_row is not None:
+        matches = matches and abs(items_taxable - total_row) <= CHECK_TOLERANCE
+    if rated and len(rated) == len(items) and tax > 0:
+        matches = matches and abs(items_tax - tax) <= CHECK_TOLERANCE
+    return {
+        "lineItems": len(items),
+        "itemsTaxable": items_taxable,
+        "itemsTax": items_tax if rated else None,
+        "matchesTotals": matches,
+    }
@@ -0,0 +1,175 @@
+"""
+OCR Backends - what InvoiceAnalyzer runs its detector and recognizer on
+Every backend offers the EasyOCR Reader calls the analyzer uses
+(detect, recognize, readtext); they differ in how the networks are run:
+
+- "easyocr": stock EasyOCR Reader, eager PyTorch
+  (on CPU EasyOCR already applies dynamic int8 quantization to the recognizer)
+- "onnx": same weights exported once to ONNX and run with ONNX Runtime
+- "onnx-int8": as "onnx", with the exported models quantized to int8
+"""
+
+import os
+
+import easyocr
+import torch
+
+from telemetry import log
+
+
+class EasyOCRBackend:
+    """The stock EasyOCR Reader on CPU"""
+
+    name = "easyocr"
+
+    def __init__(self, languages, model_dir=None):
+        options = {}
+        if model_dir:
+            options = {"model_storage_directory": model_dir, "download_enabled": False}
+        self.model_dir = model_dir or os.path.join(os.path.expanduser("~"), ".EasyOCR", "model")
+        self.reader = self._create_reader(languages, options)
+
+    def _create_reader(self, languages, options):
+        return easyocr.Reader(languages, gpu=False, **options)
+
+    def detect(self, img, **kwargs):
+        return self.reader.detect(img, **kwargs)
+
+    def recognize(self, img_grey, **kwargs):
+        return self.reader.recognize(img_grey, **kwargs)
+
+    def readtext(self, image, **kwargs):
+        return self.reader.readtext(image, **kwargs)
+
+
+class ONNXBackend(EasyOCRBackend):
+    """
+    EasyOCR pre/post-processing with the detector (CRAFT) and recognizer
+    networks run by ONNX Runtime. The networks are exported next to the
+    EasyOCR weights on first use and reused afterwards.
+    """
+
+    name = "onnx"
+
+    def __init__(self, languages, model_dir=None, int8=False):
+        self.int8 = int8
+        super().__init__(languages, model_dir)
+
+    def _create_reader(self, languages, options):
+        # Export needs the fp32 networks - EasyOCR quantizes them by default
+        reader = easyocr.Reader(languages, gpu=False, quantize=False, **options)
+        reader.detector = self._session_module(
+            reader.detector,
+            "craft_detector",
+            torch.zeros(1, 3, 320, 320),
+            {"input": {0: "batch", 2: "height", 3: "width"}},
+        )
+        reader.recognizer = self._session_module(
+            _RecognizerImageOnly(reader.recognizer),
+            f"recognizer_{getattr(reader, 'model_lang', '_'.join(languages))}",
+            # grey text-line crops, 64 px high
+            torch.zeros(1, 1, 64, 256),
+            {"input": {0: "batch", 3: "width"}},
+        )
+        return reader
+
+    def _session_module(self, network, name, dummy_input, dynamic_axes):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise RuntimeError("The ONNX OCR backend needs onnxruntime (pip install onnxruntime)") from None
+
+        path = os.path.join(self.model_dir, f"{name}.onnx")
+        if not os.path.exists(path):
+            log.info(f"   Exporting {name} to ONNX...")
+            os.makedirs(self.model_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            torch.onnx.export(
+                network.eval(),
+                dummy_input,
+                tmp_path,
+                input_names=["input"],
+                dynamic_axes=dynamic_axes,
+                opset_version=13,
+            )
+            os.replace(tmp_path, path)
+
+        if self.int8:
+            int8_path = os.path.join(self.model_dir, f"{name}.int8.onnx")
+            if not os.path.exists(int8_path):
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+
+                log.info(f"   Quantizing {name} to int8...")
+                tmp_path = f"{int8_path}.{os.getpid()}.tmp"
+                quantize_dynamic(path, tmp_path, weight_type=QuantType.QInt8)
+                os.replace(tmp_path, int8_path)
+            path = int8_path
+
+        options = onnxruntime.SessionOptions()
+        # Stay within the torch thread budget of this process (OCR_TORCH_THREADS)
+        options.intra_op_num_threads = torch.get_num_threads()
+        options.inter_op_num_threads = 1
+        session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        return _SessionModule(session)
+
+
+def set_num_threads(threads):
+    """
+    Intra-op threads for OCR started from the calling thread (per thread with
+    torch's OpenMP backend; ONNX sessions keep the count they were created with)
+    """
+    torch.set_num_threads(max(1, threads))
+
+
+BACKENDS = {
+    "easyocr": EasyOCRBackend,
+    "onnx": ONNXBackend,
+    "onnx-int8": lambda languages, model_dir=None: ONNXBackend(languages, model_dir, int8=True),
+}
+
+
+def create_backend(name, languages, model_dir=None):
+    """Backend `name` (a BACKENDS key) reading the given EasyOCR languages"""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown OCR backend {name!r} - choose from {', '.join(BACKENDS)}")
+    return BACKENDS[name](languages, model_dir)
+
+
+class _MeanLastAxis(torch.nn.Module):
+    """
+    Replaces the recognizer's AdaptiveAvgPool2d((None, 1)), which has no ONNX
+    form for dynamic widths; it averages the last axis, same as this mean
+    """
+
+    def forward(self, x):
+        return x.mean(dim=3, keepdim=True)
+
+
+class _RecognizerImageOnly(torch.nn.Module):
+    """EasyOCR recognizer with its unused text argument dropped, for export"""
+
+    def __init__(self, recognizer):
+        super().__init__()
+        if isinstance(getattr(recognizer, "AdaptiveAvgPool", None), torch.nn.AdaptiveAvgPool2d):
+            recognizer.AdaptiveAvgPool = _MeanLastAxis()
+        self.recognizer = recognizer
+
+    def forward(self, x):
+        return self.recognizer(x, None)
+
+
+class _SessionModule(torch.nn.Module):
+    """
+    Stands in for a torch network inside EasyOCR: takes and returns tensors,
+    runs the ONNX Runtime session in between
+    """
+
+    def __init__(self, session):
+        super().__init__()
+        self.session = session
+        self.input_name = session.get_inputs()[0].name
+
+    def forward(self, x, *unused):
+        outputs = self.session.run(None, {self.input_name: x.detach().cpu().numpy()})
+        tensors = tuple(torch.from_numpy(output) for output in outputs)
+        return tensors if len(tensors) > 1 else tensors[0]
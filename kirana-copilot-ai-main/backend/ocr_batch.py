@@ -0,0 +1,76 @@
+"""
+Page Batcher - collects the pages of one request into OCR batches
+Pages are handed out as Futures right away; the images are only loaded
+(rendered, preprocessed) when their batch is flushed
+"""
+
+from concurrent.futures import Future
+
+
+class PageBatcher:
+    """
+    Groups queued pages into batches of batch_size for run_batch.
+    run_batch(images) must start OCR and return one Future per image.
+    A batch is flushed when it is full, or by flush() - callers flush before
+    waiting on any of the returned Futures.
+    """
+
+    def __init__(self, run_batch, batch_size):
+        self.run_batch = run_batch
+        self.batch_size = max(1, batch_size)
+        self._pending = []  # (load_image, Future)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, load_image):
+        """Queue one page; load_image() returns it at flush time. Returns its Future."""
+        future = Future()
+        self._pending.append((load_image, future))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+        return future
+
+    def flush(self):
+        """Load the queued pages and start OCR on them as one batch"""
+        pending, self._pending = self._pending, []
+        images, futures = [], []
+        for load_image, future in pending:
+            try:
+                images.append(load_image())
+                futures.append(future)
+            except Exception as e:
+                future.set_exception(e)
+        if not images:
+            return
+
+        try:
+            results = self.run_batch(images)
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+        for future, result in zip(futures, results):
+            result.add_done_callback(lambda done, future=future: _copy_result(done, future))
+
+
+def split_result(future, count):
+    """Per-item Futures for a Future resolving to a list of `count` results"""
+    parts = [Future() for _ in range(count)]
+
+    def done(source):
+        for i, part in enumerate(parts):
+            if source.exception() is not None:
+                part.set_exception(source.exception())
+            else:
+                part.set_result(source.result()[i])
+
+    future.add_done_callback(done)
+    return parts
+
+
+def _copy_result(source, target):
+    if source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
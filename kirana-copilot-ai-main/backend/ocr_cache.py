@@ -0,0 +1,238 @@
+"""
+OCR Result Cache - content-addressed, stored on disk
+Re-uploaded invoices are answered from disk instead of running EasyOCR again
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from telemetry import log
+
+# Bump when the shape of a cached page record changes
+CACHE_FORMAT = 2
+
+
+def completed_future(compute):
+    """Run compute() now and wrap its result (or exception) in a Future"""
+    future = Future()
+    try:
+        future.set_result(compute())
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def _to_json(value):
+    """json.dumps default: NumPy arrays (e.g. OCR line boxes) become lists"""
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def file_digest(file_data):
+    """SHA-256 of the decoded file bytes (not the base64 text)"""
+    return hashlib.sha256(file_data).hexdigest()
+
+
+def cache_version(options, code_files=()):
+    """
+    Short fingerprint of what shapes a cached record: CACHE_FORMAT, the OCR and
+    preprocessing settings and the source of the code that reads a page.
+    Entries of another version are never returned and age out of the LRU
+    """
+    h = hashlib.sha256(f"{CACHE_FORMAT}:{json.dumps(options, sort_keys=True)}".encode())
+    for path in code_files:
+        with open(path, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()[:12]
+
+
+def page_key(digest, page_index=0, version=""):
+    """Cache key for one page of a file (images are always page 0)"""
+    return f"{digest}-p{page_index}-{version}" if version else f"{digest}-p{page_index}"
+
+
+class OCRCache:
+    """
+    Stores one JSON entry per page, keyed by content hash.
+    Total size on disk is capped; the least recently used entries are evicted.
+    Identical pages requested at the same time share a single OCR run.
+    Several processes (serve.py workers, ingest runs) may share the directory:
+    a key missing from this process's index is looked up on disk, and the index
+    is rebuilt from the directory every rescan_seconds so the cap holds for all.
+    """
+
+    def __init__(self, cache_dir, max_bytes=512 * 1024 * 1024, rescan_seconds=60):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.rescan_seconds = rescan_seconds
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> size in bytes, oldest first
+        self._total_bytes = 0
+        self._inflight = {}  # key -> Future shared by concurrent callers
+        self._next_scan = 0.0
+        self._scanning = False
+        self.stats = {"hits": 0, "misses": 0, "dedup_waits": 0, "evictions": 0}
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._rescan()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _scan(self):
+        """(key, size) of every entry on disk, least recently used first"""
+        found = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue  # evicted by another process meanwhile
+            found.append((st.st_mtime, name[:-5], st.st_size))
+        return [(key, size) for _, key, size in sorted(found)]
+
+    def _rescan(self):
+        """Rebuild the LRU order from file modification times, then enforce the cap"""
+        found = self._scan()  # outside the lock - can take a while on a big cache
+        with self._lock:
+            self._entries = OrderedDict(found)
+            self._total_bytes = sum(self._entries.values())
+            self._next_scan = time.monotonic() + self.rescan_seconds
+            self._scanning = False
+            self._evict()
+
+    def _evict(self):
+        """Drop least recently used entries until the size cap is met (lock held)"""
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(self._path(key))
+                self.stats["evictions"] += 1
+            except OSError:
+                pass  # already evicted by another process
+
+    def __contains__(self, key):
+        """Cheap membership check (no file read) - e.g. to skip rendering a cached page"""
+        with self._lock:
+            if key in self._entries:
+                return True
+        return os.path.exists(self._path(key))  # written by another process
+
+    def get(self, key):
+        """Return the stored value for key, or None"""
+        path = self._path(key)
+        # Read and decode outside the lock: hits on other keys go on meanwhile
+        try:
+            with open(path, "rb") as f:
+                payload = f.read()
+            value = json.loads(payload)
+            os.utime(path)  # keep LRU order across restarts and processes
+        except (OSError, ValueError):
+            # Never stored, evicted meanwhile or half-written - forget it
+            with self._lock:
+                self._total_bytes -= self._entries.pop(key, 0)
+            return None
+        with self._lock:
+            # Entries written by another process join this process's index here
+            self._total_bytes += len(payload) - self._entries.pop(key, 0)
+            self._entries[key] = len(payload)
+        return value
+
+    def put(self, key, value):
+        """Store value (must be JSON-serializable, NumPy arrays allowed) under key"""
+        payload = json.dumps(value, ensure_ascii=False, default=_to_json).encode("utf-8")
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)  # readers see the whole entry or none
+
+        with self._lock:
+            self._total_bytes -= self._entries.pop(key, 0)
+            self._entries[key] = len(payload)
+            self._total_bytes += len(payload)
+            self._evict()
+            rescan = not self._scanning and time.monotonic() >= self._next_scan
+            self._scanning = self._scanning or rescan
+        if rescan:
+            # Count what other processes wrote, so the cap holds for the whole directory
+            self._rescan()
+
+    def get_or_compute(self, key, compute):
+        """
+        Return the cached value for key, computing and storing it on a miss.
+        If the same key is already being computed, wait for that run instead.
+        """
+        return self.get_or_submit(key, lambda: completed_future(compute)).result()
+
+    def get_or_submit(self, key, submit):
+        """
+        Future-returning version of get_or_compute.
+        submit() must start the work and return a Future for the value;
+        it is only called when no cached value or in-flight run exists.
+        """
+        value = self.get(key)
+        if value is not None:
+            with self._lock:
+                self.stats["hits"] += 1
+            return completed_future(lambda: value)
+
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.stats["dedup_waits"] += 1
+                return future
+            future = Future()
+            self._inflight[key] = future
+            self.stats["misses"] += 1
+
+        # Another caller may have finished this key between our lookup and claim
+        value = self.get(key)
+        if value is not None:
+            self._release(key, future, value=value)
+            return future
+
+        def finish(inner):
+            try:
+                value = inner.result()
+            except Exception as e:
+                self._release(key, future, error=e)
+                return
+            try:
+                self.put(key, value)
+            except (OSError, TypeError, ValueError) as e:
+                log.warning(f"   ⚠️  Could not cache OCR result: {e}")
+            self._release(key, future, value=value)
+
+        try:
+            submit().add_done_callback(finish)
+        except Exception as e:
+            self._release(key, future, error=e)
+        return future
+
+    def _release(self, key, future, value=None, error=None):
+        """Resolve a claimed in-flight future and forget the claim"""
+        with self._lock:
+            self._inflight.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(value)
+
+    def get_stats(self):
+        """Counters plus current size, for health/metrics output"""
+        with self._lock:
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "maxBytes": self.max_bytes,
+            }
@@ -0,0 +1,293 @@
+"""
+OCR Worker Pool - runs InvoiceAnalyzer in several processes
+Each worker loads its own EasyOCR reader; pages are handed over in shared memory
+"""
+
+import collections
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from telemetry import log
+
+
+class OCRWorkerError(Exception):
+    """Raised (through the job's Future) when a worker fails a page"""
+
+
+def _worker_main(job_conn, result_queue, torch_threads, analyzer_options=None, warm_up=False):
+    """Worker process: load one analyzer, then OCR the jobs sent to it until told to stop"""
+    if torch_threads:
+        # Must be set before torch is imported by easyocr
+        os.environ["OMP_NUM_THREADS"] = str(torch_threads)
+        os.environ["MKL_NUM_THREADS"] = str(torch_threads)
+
+    from invoice_analyzer import InvoiceAnalyzer
+
+    if torch_threads:
+        import torch
+
+        torch.set_num_threads(torch_threads)
+
+    analyzer = InvoiceAnalyzer(**(analyzer_options or {}))
+    if warm_up:
+        analyzer.warm_up()
+    pid = os.getpid()
+    result_queue.put(("ready", None, pid, None))
+
+    while True:
+        try:
+            job = job_conn.recv()
+        except EOFError:
+            break  # the pool is gone
+        if job is None:
+            break
+
+        job_id, pages, threads = job
+        buffers = [shared_memory.SharedMemory(name=shm_name) for shm_name, _, _ in pages]
+        images = [
+            np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+            for shm, (_, shape, dtype) in zip(buffers, pages)
+        ]
+        try:
+            records = analyzer.analyze_images(images, threads=threads)
+            result_queue.put(("done", job_id, pid, records))
+        except Exception as e:
+            result_queue.put(("error", job_id, pid, f"{type(e).__name__}: {e}"))
+        finally:
+            del images
+            for shm in buffers:
+                shm.close()
+
+
+class OCRWorkerPool:
+    """
+    Pool of OCR worker processes; jobs wait here and are sent to idle workers
+    one at a time, so the pool always knows which job a worker holds and can
+    fail it when that worker dies (even if it was killed at once).
+    submit() returns a Future for each page, so callers can queue every
+    page of a request first and then collect results in their own order;
+    submit_batch() hands several pages to one worker for batched OCR.
+    """
+
+    def __init__(self, size, torch_threads=1, analyzer_options=None, warm_up=False):
+        self.size = size
+        self.torch_threads = torch_threads
+        self.analyzer_options = analyzer_options or {}  # InvoiceAnalyzer kwargs
+        self.warm_up = warm_up  # workers run one OCR pass before reporting ready
+        self._ctx = mp.get_context("spawn")  # never fork a process holding torch
+        self._result_queue = self._ctx.Queue()
+        self._lock = threading.Lock()
+        self._jobs = {}  # job_id -> ([Future per page], [SharedMemory per page], job message)
+        self._pending = collections.deque()  # job_ids waiting for an idle worker
+        self._conns = {}  # worker pid -> its job pipe
+        self._idle = []  # pids of ready workers without a job
+        self._running = {}  # worker pid -> job_id sent to it
+        self._ids = itertools.count()
+        self._closed = False
+        self._broken = None  # set when workers keep dying before they load
+        self._startup_failures = 0
+        self._ready_pids = set()
+        self.ready_workers = 0
+        self.processes = []
+
+        for _ in range(size):
+            self._start_worker()
+
+        self._collector = threading.Thread(
+            target=self._collect, name="ocr-pool-collector", daemon=True
+        )
+        self._collector.start()
+
+    def _start_worker(self):
+        receiver, sender = self._ctx.Pipe(duplex=False)
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(
+                receiver,
+                self._result_queue,
+                self.torch_threads,
+                self.analyzer_options,
+                self.warm_up,
+            ),
+            daemon=True,
+        )
+        process.start()
+        receiver.close()
+        with self._lock:
+            self._conns[process.pid] = sender
+        self.processes.append(process)
+
+    def submit(self, image):
+        """
+        Queue one page (PIL Image or numpy array) for OCR
+        Returns a Future resolving to InvoiceAnalyzer.analyze_image output
+        """
+        return self.submit_batch([image])[0]
+
+    def submit_batch(self, images, threads=None):
+        """
+        Queue several pages as one job: a single worker runs them through
+        InvoiceAnalyzer.analyze_images (batched detection), with `threads`
+        torch threads if given (else the worker keeps its current count)
+        Returns one Future per page, in input order
+        """
+        shms, pages = [], []
+        for image in images:
+            array = np.ascontiguousarray(np.asarray(image))
+            shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+            shms.append(shm)
+            pages.append((shm.name, array.shape, array.dtype.str))
+
+        futures = [Future() for _ in images]
+        with self._lock:
+            if self._closed or self._broken:
+                for shm in shms:
+                    shm.close()
+                    shm.unlink()
+                raise RuntimeError(self._broken or "OCR worker pool is shut down")
+            job_id = next(self._ids)
+            self._jobs[job_id] = (futures, shms, (job_id, pages, threads))
+            self._pending.append(job_id)
+            self._dispatch()
+        return futures
+
+    def map(self, images):
+        """OCR several pages in parallel; results come back in input order"""
+        futures = [self.submit(image) for image in images]
+        return [future.result() for future in futures]
+
+    def _dispatch(self):
+        """Send waiting jobs to idle workers, recording which worker got which (lock held)"""
+        while self._pending and self._idle:
+            pid = self._idle.pop()
+            job_id = self._pending.popleft()
+            if job_id not in self._jobs:
+                self._idle.append(pid)  # failed meanwhile
+                continue
+            try:
+                self._conns[pid].send(self._jobs[job_id][2])
+            except OSError:
+                self._pending.appendleft(job_id)  # worker just died - it is reaped shortly
+                continue
+            self._running[pid] = job_id
+
+    def _finish(self, job_id, result=None, error=None):
+        with self._lock:
+            entry = self._jobs.pop(job_id, None)
+        if entry is None:
+            return
+        futures, shms, _ = entry
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+        for i, future in enumerate(futures):
+            if error is not None:
+                future.set_exception(OCRWorkerError(error))
+            else:
+                future.set_result(result[i])
+
+    def _collect(self):
+        """Route worker messages to job Futures and replace crashed workers"""
+        next_reap = time.monotonic() + 1.0
+        while True:
+            # Check for dead workers every second, also while results keep coming
+            if time.monotonic() >= next_reap:
+                self._reap_dead_workers()
+                next_reap = time.monotonic() + 1.0
+            try:
+                kind, job_id, pid, payload = self._result_queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+
+            if kind == "stop":
+                break
+            elif kind == "ready":
+                with self._lock:
+                    self.ready_workers += 1
+                    self._ready_pids.add(pid)
+                    self._startup_failures = 0
+                self._worker_idle(pid)
+            elif kind == "done":
+                self._worker_idle(pid)
+                self._finish(job_id, result=payload)
+            elif kind == "error":
+                self._worker_idle(pid)
+                self._finish(job_id, error=payload)
+
+    def _worker_idle(self, pid):
+        """A worker finished its job (or loaded): give it the next one"""
+        with self._lock:
+            self._running.pop(pid, None)
+            if pid in self._conns and not self._closed:
+                self._idle.append(pid)
+                self._dispatch()
+
+    def _reap_dead_workers(self):
+        if self._closed or self._broken:
+            return
+        for process in list(self.processes):
+            if process.is_alive():
+                continue
+            log.warning(f"   ⚠️  OCR worker {process.pid} exited (code {process.exitcode})")
+            self.processes.remove(process)
+            with self._lock:
+                job_id = self._running.pop(process.pid, None)
+                self._conns.pop(process.pid).close()
+                if process.pid in self._idle:
+                    self._idle.remove(process.pid)
+                if process.pid in self._ready_pids:
+                    self._ready_pids.discard(process.pid)
+                    self.ready_workers -= 1
+                else:
+                    self._startup_failures += 1
+            if job_id is not None:
+                self._finish(job_id, error=f"worker {process.pid} died")
+
+            if self._startup_failures >= 3:
+                # Restarting would just crash again (missing model, bad install...)
+                self._broken = "OCR workers fail to start - check the worker logs"
+                log.error(f"   ❌ {self._broken}")
+                with self._lock:
+                    leftover = list(self._jobs)
+                for leftover_id in leftover:
+                    self._finish(leftover_id, error=self._broken)
+                return
+            self._start_worker()
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "workers": self.size,
+                "readyWorkers": self.ready_workers,
+                "broken": self._broken,
+                "torchThreads": self.torch_threads,
+                "queuedOrRunning": sum(len(futures) for futures, _, _ in self._jobs.values()),
+            }
+
+    def shutdown(self):
+        """Stop workers after their current jobs and free any leftover buffers"""
+        with self._lock:
+            self._closed = True
+            for conn in self._conns.values():
+                try:
+                    conn.send(None)
+                except OSError:
+                    pass
+        for process in self.processes:
+            process.join(timeout=30)
+        self._result_queue.put(("stop", None, None, None))
+        self._collector.join(timeout=5)
+
+        with self._lock:
+            leftover = list(self._jobs)
+        for job_id in leftover:
+            self._finish(job_id, error="OCR worker pool shut down")
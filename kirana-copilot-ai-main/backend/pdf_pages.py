@@ -0,0 +1,167 @@
+"""
+PDF Page Rendering - one page at a time instead of the whole document
+Pages are rasterized on a background thread a few pages ahead of OCR,
+so memory stays bounded and rendering overlaps with recognition
+"""
+
+import os
+import queue
+import tempfile
+import threading
+import time
+from collections import deque
+
+from pdf2image import convert_from_path, pdfinfo_from_path
+
+from telemetry import STAGE_SECONDS
+
+
+def parse_page_range(spec):
+    """
+    Parse a page selection like "1-3,5,8-" (1-based, inclusive)
+    Returns a list of (first, last) tuples, last=None meaning "to the end",
+    or None for "all pages". Raises ValueError on bad input.
+    """
+    if spec is None:
+        return None
+    spec = str(spec).strip().lower()
+    if spec in ("", "all"):
+        return None
+
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            if "-" in part:
+                first, last = part.split("-", 1)
+                first = int(first) if first.strip() else 1
+                last = int(last) if last.strip() else None
+            else:
+                first = last = int(part)
+        except ValueError:
+            raise ValueError(f"Invalid page range: {part}") from None
+
+        if first < 1 or (last is not None and last < first):
+            raise ValueError(f"Invalid page range: {part}")
+        ranges.append((first, last))
+
+    if not ranges:
+        raise ValueError(f"Invalid page range: {spec}")
+    return ranges
+
+
+def select_pages(ranges, page_count):
+    """0-based page indices picked by parse_page_range output, in document order"""
+    if ranges is None:
+        return list(range(page_count))
+
+    selected = set()
+    for first, last in ranges:
+        last = page_count if last is None else min(last, page_count)
+        selected.update(range(first - 1, last))
+    return sorted(selected)
+
+
+class PDFPageSource:
+    """
+    A PDF written to disk once, rendered page by page on request.
+    Use as a context manager so the temp file is removed.
+    """
+
+    def __init__(self, pdf_data, dpi=200):
+        self.dpi = dpi
+        fd, self.path = tempfile.mkstemp(suffix=".pdf")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(pdf_data)
+            self.page_count = int(pdfinfo_from_path(self.path)["Pages"])
+        except Exception:
+            self.close()
+            raise
+
+    def render(self, first, last=None):
+        """Render pages first..last (0-based, inclusive) as RGB PIL Images"""
+        last = first if last is None else last
+        start = time.perf_counter()
+        images = convert_from_path(
+            self.path, dpi=self.dpi, first_page=first + 1, last_page=last + 1
+        )
+        for _ in images:
+            STAGE_SECONDS.observe((time.perf_counter() - start) / len(images), stage="rasterize")
+        return [img if img.mode == "RGB" else img.convert("RGB") for img in images]
+
+    def iter_pages(self, page_indices, window=2, skip=None):
+        """
+        Yield (page_index, image) for the given pages in order.
+        A background thread renders up to `window` pages ahead of the consumer.
+        Pages where skip(page_index) is true are yielded as (page_index, None)
+        without rendering (e.g. already in the OCR cache).
+        """
+        window = max(1, window)
+        rendered = queue.Queue(maxsize=window)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    rendered.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def produce():
+            try:
+                pending = deque(page_indices)
+                while pending and not stop.is_set():
+                    if skip is not None and skip(pending[0]):
+                        if not put((pending.popleft(), None, None)):
+                            return
+                        continue
+
+                    # Render a short run of consecutive pages in one poppler call
+                    run = [pending.popleft()]
+                    while (
+                        pending
+                        and len(run) < window
+                        and pending[0] == run[-1] + 1
+                        and not (skip is not None and skip(pending[0]))
+                    ):
+                        run.append(pending.popleft())
+
+                    for page_index, image in zip(run, self.render(run[0], run[-1])):
+                        if not put((page_index, image, None)):
+                            return
+            except Exception as e:
+                put((None, None, e))
+            finally:
+                put(None)
+
+        producer = threading.Thread(target=produce, name="pdf-render", daemon=True)
+        producer.start()
+        try:
+            while True:
+                item = rendered.get()
+                if item is None:
+                    return
+                page_index, image, error = item
+                if error is not None:
+                    raise error
+                yield page_index, image
+        finally:
+            stop.set()
+            producer.join(timeout=5)
+
+    def close(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
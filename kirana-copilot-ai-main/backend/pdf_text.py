@@ -0,0 +1,116 @@
+"""
+PDF Text Layer - read invoices from billing software without OCR
+Tally / Busy / Vyapar exports embed real text; reading it is faster and
+exact, so only scanned pages need to be rasterized and OCR'd
+"""
+
+import re
+
+from PyPDF2 import PdfReader
+
+from pdf_pages import select_pages
+from telemetry import log
+
+# A page needs at least this many letters/digits to count as having text
+TEXT_LAYER_MIN_CHARS = 40
+# Share of characters that must look like normal text (broken font
+# encodings extract as symbol soup)
+TEXT_LAYER_MIN_CLEAN_RATIO = 0.8
+# Fragments on one baseline further apart than this (in font heights) are
+# separate lines, like OCR boxes: table cells, a label and a far-off value
+LINE_GAP_EM = 2.0
+
+_CLEAN_CHARS = re.compile(r"[\w\s.,:;/()\-+%&#@₹'\"]", re.UNICODE)
+
+
+def _is_usable(text):
+    alnum = sum(1 for ch in text if ch.isalnum())
+    if alnum < TEXT_LAYER_MIN_CHARS or not re.search(r"\d", text):
+        return False
+    clean = len(_CLEAN_CHARS.findall(text))
+    return clean / max(1, len(text)) >= TEXT_LAYER_MIN_CLEAN_RATIO
+
+
+def _page_fragments(page):
+    """Text fragments with their position: (x, y_top, width, height, text), PDF points"""
+    page_height = float(page.mediabox.height)
+    fragments = []
+
+    def visitor(text, cm, tm, font_dict, font_size):
+        text = text.strip()
+        if not text:
+            return
+        # Text rendering matrix = tm x cm; the origin is its translation part
+        x = tm[4] * cm[0] + tm[5] * cm[2] + cm[4]
+        y = tm[4] * cm[1] + tm[5] * cm[3] + cm[5]
+        size = abs(font_size * (tm[3] or 1) * (cm[3] or 1)) or 10.0
+        width = 0.5 * size * len(text)  # rough average glyph width
+        fragments.append((x, page_height - y - size, width, size, text))
+
+    page.extract_text(visitor_text=visitor)
+    return fragments
+
+
+def _group_lines(fragments):
+    """
+    Group fragments sharing a baseline into lines, top to bottom, left to
+    right; a wide gap (LINE_GAP_EM) starts a new line on the same baseline
+    """
+    rows = []
+    for frag in sorted(fragments, key=lambda f: (f[1], f[0])):
+        if rows and abs(frag[1] - rows[-1][0][1]) <= 0.5 * frag[3]:
+            rows[-1].append(frag)
+        else:
+            rows.append([frag])
+
+    runs = []
+    for row in rows:
+        row.sort(key=lambda f: f[0])
+        runs.append([row[0]])
+        for frag in row[1:]:
+            previous = runs[-1][-1]
+            if frag[0] - (previous[0] + previous[2]) > LINE_GAP_EM * max(frag[3], previous[3]):
+                runs.append([frag])
+            else:
+                runs[-1].append(frag)
+
+    lines = []
+    for row in runs:
+        x0 = min(f[0] for f in row)
+        y0 = min(f[1] for f in row)
+        x1 = max(f[0] + f[2] for f in row)
+        y1 = max(f[1] + f[3] for f in row)
+        lines.append((" ".join(f[4] for f in row), [x0, y0, x1, y1]))
+    return lines
+
+
+def extract_text_layer(stream, page_ranges=None):
+    """
+    Read the embedded text of the selected PDF pages (parse_page_range output).
+    Returns (page_count, { page_index: ocr_result }) for pages with a usable
+    text layer, in the same shape as InvoiceAnalyzer.extract_text output plus
+    line "boxes" ([x0, y0, x1, y1] in PDF points, top-left origin).
+    Scanned pages are left out; page_count is None if the PDF cannot be read.
+    """
+    try:
+        reader = PdfReader(stream)
+        if reader.is_encrypted:
+            return None, {}
+        pages = reader.pages
+
+        results = {}
+        for page_index in select_pages(page_ranges, len(pages)):
+            lines = _group_lines(_page_fragments(pages[page_index]))
+            full_text = " ".join(text for text, _ in lines)
+            if not _is_usable(full_text):
+                continue
+            results[page_index] = {
+                "full_text": full_text,
+                # Embedded text is exact - full confidence per line
+                "lines": [(text, 1.0) for text, _ in lines],
+                "boxes": [box for _, box in lines],
+            }
+        return len(pages), results
+    except Exception as e:
+        log.warning(f"   ⚠️  Could not read PDF text layer: {e}")
+        return None, {}
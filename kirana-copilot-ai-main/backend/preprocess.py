@@ -0,0 +1,234 @@
+"""
+Image Preprocessing - normalize invoice photos before OCR
+Phone photos arrive as 12MP RGB, often rotated or slightly skewed; OCR time
+and memory grow with pixel count, so pages are shrunk, converted to
+grayscale, straightened and trimmed first
+"""
+
+import time
+
+import numpy as np
+from PIL import Image, ImageOps
+
+# Pixels this far from the background grey level count as ink
+INK_THRESHOLD = 40
+# Deskew search range and step, in degrees
+DESKEW_MAX_ANGLE = 5.0
+DESKEW_STEP = 0.5
+# Side of the thumbnail used for orientation and skew estimates
+ANALYSIS_SIDE = 600
+# Margin kept around the trimmed content, in pixels
+TRIM_MARGIN = 10
+# Devanagari headline (shirorekha): share of a text line's width covered by
+# one ink row near the top, and how much denser it is than a typical row
+DEVANAGARI_HEADLINE_COVERAGE = 0.55
+DEVANAGARI_HEADLINE_CONTRAST = 2.5
+
+
+def _ms(start):
+    return round((time.perf_counter() - start) * 1000, 1)
+
+
+def _ink_mask(grey):
+    """Boolean ink mask of a grayscale array (background = median border level)"""
+    border = np.concatenate([grey[0], grey[-1], grey[:, 0], grey[:, -1]])
+    return np.abs(grey.astype(np.int16) - int(np.median(border))) > INK_THRESHOLD
+
+
+def _profile_score(mask):
+    """
+    How sharply ink alternates between rows: horizontal text lines with
+    gaps between them give a jagged row profile, independent of page size
+    """
+    rows = mask.sum(axis=1).astype(np.float64)
+    mean = rows.mean()
+    if len(rows) < 2 or mean == 0:
+        return 0.0
+    return float(np.mean(np.diff(rows) ** 2) / mean**2)
+
+
+def looks_devanagari(crop):
+    """
+    Cheap script check on one grayscale text-line crop: Devanagari letters
+    hang from a continuous headline, so one row near the top is covered by
+    ink across most of the line and is much denser than the rows below.
+    """
+    crop = np.asarray(crop)
+    if crop.ndim != 2 or min(crop.shape) < 8:
+        return False
+    mask = _ink_mask(crop)
+    rows = np.flatnonzero(mask.any(axis=1))
+    cols = np.flatnonzero(mask.any(axis=0))
+    if len(rows) < 6:
+        return False
+
+    coverage = mask[rows[0] : rows[-1] + 1, cols[0] : cols[-1] + 1].mean(axis=1)
+    headline = float(coverage[: max(1, len(coverage) * 2 // 5)].max())
+    return (
+        headline >= DEVANAGARI_HEADLINE_COVERAGE
+        and headline >= DEVANAGARI_HEADLINE_CONTRAST * float(np.median(coverage))
+    )
+
+
+class ImagePreprocessor:
+    """
+    Configurable preprocessing stage in front of InvoiceAnalyzer.extract_text.
+    Steps: JPEG draft decoding, longest-side / DPI cap, grayscale,
+    90° orientation, deskew, blank-border trim. Each step is timed.
+    """
+
+    def __init__(
+        self,
+        max_side=2000,
+        max_dpi=300,
+        grayscale=True,
+        orient=True,
+        deskew=True,
+        trim=True,
+    ):
+        self.max_side = max_side
+        self.max_dpi = max_dpi
+        self.grayscale = grayscale
+        self.orient = orient
+        self.deskew = deskew
+        self.trim = trim
+
+    def _target_scale(self, image):
+        """Downscale factor (<= 1) for the longest side and DPI caps"""
+        scale = 1.0
+        if self.max_side:
+            scale = min(scale, self.max_side / max(image.size))
+        dpi = image.info.get("dpi")
+        if self.max_dpi and dpi:
+            try:
+                scale = min(scale, self.max_dpi / float(max(dpi)))
+            except (TypeError, ValueError, ZeroDivisionError):
+                pass
+        return scale
+
+    def open(self, fp, timings=None):
+        """
+        Decode an image file. JPEGs are decoded at reduced scale (draft mode)
+        when the cap allows it - far less work and memory than a full decode.
+        """
+        start = time.perf_counter()
+        image = Image.open(fp)
+        scale = self._target_scale(image)
+        if scale < 1:
+            width, height = image.size
+            image.draft(
+                "L" if self.grayscale else "RGB",
+                (int(width * scale) + 1, int(height * scale) + 1),
+            )
+            dpi = image.info.get("dpi")
+            if dpi and image.width != width:
+                # Keep the effective DPI right for the cap in process()
+                factor = image.width / width
+                image.info["dpi"] = tuple(d * factor for d in dpi)
+        image.load()
+        if timings is not None:
+            timings["decode"] = _ms(start)
+        return image
+
+    def process(self, image, timings=None):
+        """
+        Run the enabled steps on a PIL Image
+        Returns (image, { step: milliseconds })
+        """
+        timings = {} if timings is None else timings
+
+        start = time.perf_counter()
+        image = ImageOps.exif_transpose(image)
+        scale = self._target_scale(image)
+        if scale < 1:
+            size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+            image = image.resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+        timings["resize"] = _ms(start)
+
+        start = time.perf_counter()
+        if self.grayscale:
+            image = image.convert("L")
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        timings["grayscale"] = _ms(start)
+
+        if self.orient:
+            start = time.perf_counter()
+            image = self._fix_orientation(image)
+            timings["orient"] = _ms(start)
+
+        if self.deskew:
+            start = time.perf_counter()
+            image = self._deskew(image)
+            timings["deskew"] = _ms(start)
+
+        if self.trim:
+            start = time.perf_counter()
+            image = self._trim(image)
+            timings["trim"] = _ms(start)
+
+        return image, timings
+
+    def _thumbnail_mask(self, image):
+        thumb = image.convert("L")
+        thumb.thumbnail((ANALYSIS_SIDE, ANALYSIS_SIDE), Image.Resampling.BILINEAR)
+        return _ink_mask(np.asarray(thumb))
+
+    def _fix_orientation(self, image):
+        """
+        Turn pages whose text lines run vertically by 90°.
+        Lines are vertical when ink profiles are sharper across columns than
+        across rows; the turn direction puts the aligned (left) margin of the
+        lines on the left. Upside-down pages are not detected.
+        """
+        mask = self._thumbnail_mask(image)
+        if not mask.any() or _profile_score(mask.T) <= 1.5 * _profile_score(mask):
+            return image
+
+        # For each vertical line of text, where does it start and end?
+        columns = np.flatnonzero(mask.any(axis=0))
+        starts = mask.argmax(axis=0)[columns]
+        ends = mask.shape[0] - 1 - mask[::-1].argmax(axis=0)[columns]
+        if starts.std() <= ends.std():
+            # Line starts aligned at the top: page was turned clockwise
+            return image.transpose(Image.Transpose.ROTATE_90)
+        return image.transpose(Image.Transpose.ROTATE_270)
+
+    def _deskew(self, image):
+        """Small-angle rotation that makes the text rows sharpest (projection profile)"""
+        thumb = image.convert("L")
+        thumb.thumbnail((ANALYSIS_SIDE, ANALYSIS_SIDE), Image.Resampling.BILINEAR)
+        background = int(np.median(np.asarray(thumb)[[0, -1]]))
+
+        # Start from "no rotation" so blank or ambiguous pages are left alone
+        best_angle = 0.0
+        best_score = _profile_score(_ink_mask(np.asarray(thumb)))
+        for angle in np.arange(-DESKEW_MAX_ANGLE, DESKEW_MAX_ANGLE + DESKEW_STEP / 2, DESKEW_STEP):
+            if angle == 0:
+                continue
+            rotated = thumb.rotate(float(angle), resample=Image.Resampling.NEAREST, fillcolor=background)
+            score = _profile_score(_ink_mask(np.asarray(rotated)))
+            if score > best_score:
+                best_angle, best_score = float(angle), score
+
+        if abs(best_angle) < DESKEW_STEP:
+            return image
+        fill = background if image.mode == "L" else (background,) * 3
+        return image.rotate(best_angle, resample=Image.Resampling.BILINEAR, expand=True, fillcolor=fill)
+
+    def _trim(self, image):
+        """Crop blank borders (keeps a small margin)"""
+        mask = _ink_mask(np.asarray(image.convert("L") if image.mode != "L" else image))
+        rows = np.flatnonzero(mask.any(axis=1))
+        cols = np.flatnonzero(mask.any(axis=0))
+        if not len(rows) or not len(cols):
+            return image
+        box = (
+            max(0, int(cols[0]) - TRIM_MARGIN),
+            max(0, int(rows[0]) - TRIM_MARGIN),
+            min(image.width, int(cols[-1]) + TRIM_MARGIN + 1),
+            min(image.height, int(rows[-1]) + TRIM_MARGIN + 1),
+        )
+        if (box[2] - box[0]) * (box[3] - box[1]) > 0.98 * image.width * image.height:
+            return image
+        return image.crop(box)
@@ -0,0 +1,348 @@
+"""
+Production Server - preforked WSGI workers sharing the loaded OCR models
+The master process imports the app and loads the OCR models once, then
+forks SERVE_WORKERS workers that accept requests on one shared socket.
+The model weights are only read after loading, so every worker uses the
+master's copy (shared copy-on-write pages) instead of loading its own;
+/health ("server") shows each process's RSS and how much of it is shared.
+
+Each worker runs SERVE_THREADS requests at a time and lets SERVE_QUEUE more
+wait; beyond that requests get 429 with Retry-After. Bodies over
+MAX_UPLOAD_MB get 413. SIGTERM or Ctrl+C drains the server: workers stop
+accepting, finish their requests (up to SERVE_DRAIN_SECONDS) and exit.
+Async jobs (JOB_DB) and /metrics are shared through files in a temporary
+directory, so any worker can answer for all of them.
+
+    python serve.py
+"""
+
+import contextlib
+import gc
+import json
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import threading
+import time
+
+from werkzeug.serving import make_server
+from werkzeug.wsgi import ClosingIterator
+
+from telemetry import (
+    REQUESTS_REJECTED,
+    CallbackMetric,
+    child_pids,
+    log,
+    process_memory,
+    share_metrics,
+    start_metrics_writer,
+    write_metrics,
+)
+
+CPU_COUNT = os.cpu_count() or 1
+SERVE_HOST = os.environ.get("SERVE_HOST", "0.0.0.0")
+SERVE_PORT = int(os.environ.get("SERVE_PORT", "5000"))
+SERVE_WORKERS = int(os.environ.get("SERVE_WORKERS", str(max(1, CPU_COUNT // 2))))
+# Per worker: requests running at once, and requests waiting for one of them
+SERVE_THREADS = int(os.environ.get("SERVE_THREADS", "4"))
+SERVE_QUEUE = int(os.environ.get("SERVE_QUEUE", "16"))
+SERVE_RETRY_AFTER = int(os.environ.get("SERVE_RETRY_AFTER", "5"))  # seconds, sent with 429
+SERVE_DRAIN_SECONDS = float(os.environ.get("SERVE_DRAIN_SECONDS", "30"))
+SERVE_MEMORY_LOG_SECONDS = float(os.environ.get("SERVE_MEMORY_LOG_SECONDS", "300"))  # 0 = off
+# How often each worker saves its metrics for the /metrics of the others
+SERVE_METRICS_SECONDS = float(os.environ.get("SERVE_METRICS_SECONDS", "5"))
+
+# Never held back by the admission limit: monitoring and polling async jobs
+EXEMPT_PATHS = ("/health", "/ready", "/metrics")
+EXEMPT_PREFIXES = ("/jobs/",)
+
+# OCR runs in the serving workers themselves (a spawned OCR pool per worker
+# would load private models again); must be set before the app is imported
+if os.environ.get("OCR_WORKERS", "0") != "0":
+    log.warning("⚠️  OCR_WORKERS is ignored by serve.py - OCR runs in the serving workers")
+os.environ["OCR_WORKERS"] = "0"
+
+# Shared by the workers of this run: the async job database and metric files
+SERVE_STATE_DIR = tempfile.mkdtemp(prefix="invoice-serve-")
+os.environ.setdefault("JOB_DB", os.path.join(SERVE_STATE_DIR, "jobs.db"))
+
+import app as backend
+from ocr_backends import set_num_threads
+
+
+def _json_response(start_response, status, message, headers=()):
+    body = json.dumps({"error": message}).encode()
+    start_response(status, [("Content-Type", "application/json"), ("Content-Length", str(len(body))), *headers])
+    return [body]
+
+
+class AdmissionControl:
+    """
+    WSGI middleware of one worker: at most `running` requests run at once
+    and `queued` more wait for a slot; any more are answered 429 at once.
+    Bodies over max_bytes get 413 before they are read.
+    """
+
+    def __init__(self, app, running, queued, retry_after, max_bytes=None):
+        self.app = app
+        self.queued = queued
+        self.retry_after = retry_after
+        self.max_bytes = max_bytes
+        self.draining = False
+        self._slots = threading.Semaphore(running)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._waiting = 0
+        self._active = 0  # waiting + running
+        self.stats = {"accepted": 0, "overloaded": 0, "tooLarge": 0, "draining": 0}
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        if path in EXEMPT_PATHS or path.startswith(EXEMPT_PREFIXES):
+            return self.app(environ, start_response)
+
+        length = environ.get("CONTENT_LENGTH") or ""
+        with self._lock:
+            if self.max_bytes and length.isdigit() and int(length) > self.max_bytes:
+                return self._reject(start_response, "tooLarge", "413 Request Entity Too Large", "Request body too large")
+            if self.draining:
+                return self._reject(start_response, "draining", "503 Service Unavailable", "Server is shutting down")
+            if self._waiting >= self.queued:
+                return self._reject(start_response, "overloaded", "429 Too Many Requests", "Server busy, retry later")
+            self._waiting += 1
+            self._active += 1
+            self.stats["accepted"] += 1
+
+        self._slots.acquire()
+        with self._lock:
+            self._waiting -= 1
+        try:
+            # The slot is held until the response (possibly streamed) is closed
+            return ClosingIterator(self.app(environ, start_response), self._release)
+        except BaseException:
+            self._release()
+            raise
+
+    def _reject(self, start_response, reason, status, message):
+        """Answer without running the app (lock held)"""
+        self.stats[reason] += 1
+        REQUESTS_REJECTED.inc(reason=reason)
+        headers = [("Retry-After", str(self.retry_after))] if reason != "tooLarge" else []
+        return _json_response(start_response, status, message, headers)
+
+    def _release(self):
+        self._slots.release()
+        with self._lock:
+            self._active -= 1
+            if self._active == 0:
+                self._idle.notify_all()
+
+    def wait_idle(self, timeout):
+        """Wait until no request is waiting or running; False on timeout"""
+        with self._lock:
+            return self._idle.wait_for(lambda: self._active == 0, timeout)
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "running": self._active - self._waiting,
+                "waiting": self._waiting,
+                **self.stats,
+            }
+
+
+def server_memory(master_pid):
+    """Memory of the master and each worker (see process_memory)"""
+    master = process_memory(master_pid)
+    workers = [memory for memory in map(process_memory, child_pids(master_pid)) if memory]
+    return {
+        "master": master,
+        "workers": workers,
+        # What the whole server really uses: shared pages are counted once
+        "totalPssMb": round(sum(memory["pssMb"] for memory in filter(None, [master, *workers])), 1),
+    }
+
+
+def _memory_samples(master_pid):
+    samples = {}
+    memory = server_memory(master_pid)
+    for role, entries in (("master", [memory["master"]]), ("worker", memory["workers"])):
+        for entry in filter(None, entries):
+            for kind in ("rss", "shared", "private", "pss"):
+                samples[(role, entry["pid"], kind)] = int(entry[f"{kind}Mb"] * 1024 * 1024)
+    return samples
+
+
+def _log_memory(master_pid):
+    memory = server_memory(master_pid)
+    workers = ", ".join(
+        f"{entry['pid']}: {entry['rssMb']:.0f} MB ({entry['sharedMb']:.0f} shared)" for entry in memory["workers"]
+    )
+    log.info(f"📊 Worker RSS {workers} - PSS total {memory['totalPssMb']:.0f} MB")
+
+
+def run_worker(listener, cpu_budget, master_pid):
+    """Worker process: serve on the shared socket until SIGTERM, then drain and exit"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C reaches the master, which drains us
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    backend.init_serving_worker(cpu_budget)
+    start_metrics_writer(SERVE_METRICS_SECONDS)
+    admission = AdmissionControl(
+        backend.app,
+        running=SERVE_THREADS,
+        queued=SERVE_QUEUE,
+        retry_after=SERVE_RETRY_AFTER,
+        max_bytes=backend.app.config["MAX_CONTENT_LENGTH"],
+    )
+    backend.server_stats = lambda: {
+        "workers": SERVE_WORKERS,
+        "pid": os.getpid(),
+        "requests": admission.get_stats(),
+        "memory": server_memory(master_pid),
+    }
+    backend.start_warmup()  # models are loaded; this runs the warm-up pass
+    server = make_server(SERVE_HOST, SERVE_PORT, admission, threaded=True, fd=listener.fileno())
+
+    def drain(signum, frame):
+        admission.draining = True
+        # shutdown() waits for serve_forever, which runs in this (main) thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, drain)
+    server.serve_forever()
+    listener.close()
+    if not admission.wait_idle(SERVE_DRAIN_SECONDS):
+        log.warning(f"   ⚠️  Worker {os.getpid()} stopped with requests still running")
+    with contextlib.suppress(OSError):
+        write_metrics()  # the other workers keep counting this one's requests
+    os._exit(0)
+
+
+class Master:
+    """Forks the workers, replaces any that die, and drains them on SIGTERM / Ctrl+C"""
+
+    def __init__(self, listener, workers):
+        self.listener = listener
+        self.size = workers
+        self.cpu_budget = max(1, backend.OCR_CPU_BUDGET // workers)
+        self.pid = os.getpid()
+        self.workers = set()
+        self.stopping = None  # time the drain started
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(self.listener, self.cpu_budget, self.pid)
+            finally:
+                os._exit(1)
+        self.workers.add(pid)
+        return pid
+
+    def signal_workers(self, signum):
+        for pid in list(self.workers):
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(pid, signum)
+
+    def stop(self, signum, frame):
+        if self.stopping is not None:
+            log.warning("⚠️  Stopping now")
+            self.signal_workers(signal.SIGKILL)
+            return
+        self.stopping = time.monotonic()
+        # Connections still in the backlog get refused instead of hanging
+        self.listener.close()
+        log.info(f"🛑 Draining {len(self.workers)} worker(s) (up to {SERVE_DRAIN_SECONDS:.0f}s)...")
+        self.signal_workers(signal.SIGTERM)
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for _ in range(self.size):
+            self.spawn()
+        log.info(f"🚀 Serving on http://{SERVE_HOST}:{SERVE_PORT} with {self.size} worker(s)")
+
+        next_log = time.monotonic() + SERVE_MEMORY_LOG_SECONDS
+        while self.workers:
+            pid, status = self._reap()
+            if pid:
+                self.workers.discard(pid)
+                if self.stopping is None:
+                    log.warning(f"   ⚠️  Worker {pid} exited ({self._describe(status)}), starting a new one")
+                    time.sleep(1)  # don't spin if workers crash at once
+                    self.spawn()
+                continue
+            if self.stopping is not None and time.monotonic() - self.stopping > SERVE_DRAIN_SECONDS + 5:
+                log.warning(f"   ⚠️  {len(self.workers)} worker(s) still running after the drain, killing them")
+                self.signal_workers(signal.SIGKILL)
+                self.stopping = float("inf")  # next SIGTERM does not kill again
+            if SERVE_MEMORY_LOG_SECONDS and self.stopping is None and time.monotonic() >= next_log:
+                _log_memory(self.pid)
+                next_log = time.monotonic() + SERVE_MEMORY_LOG_SECONDS
+            time.sleep(0.5)
+        log.info("👋 All workers stopped")
+
+    def _reap(self):
+        try:
+            return os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return 0, 0
+
+    @staticmethod
+    def _describe(status):
+        if os.WIFSIGNALED(status):
+            return f"signal {os.WTERMSIG(status)}"
+        return f"code {os.WEXITSTATUS(status)}"
+
+
+def load_shared_state():
+    """
+    Load what the workers share before forking: the OCR models and the page
+    hash index. Torch runs single-threaded here so the master never starts a
+    thread pool the forked workers would inherit in a broken state.
+    """
+    if backend.OCR_BACKEND != "easyocr":
+        # ONNX Runtime sessions own thread pools that do not survive a fork
+        log.warning(f"⚠️  {backend.OCR_BACKEND} models are loaded by each worker (not shared)")
+    else:
+        set_num_threads(1)
+        backend.analyzer.load_model()
+        if backend.OCR_HINDI != "never":
+            backend.analyzer.load_model("hi")
+    backend.get_page_hashes()
+    # Objects made so far live for good: keep the collector from writing to
+    # their pages (which would copy them into every worker)
+    gc.collect()
+    gc.freeze()
+
+
+def main():
+    if not hasattr(os, "fork"):
+        raise SystemExit("serve.py needs fork() (Linux or macOS); use python app.py on Windows")
+    start = time.perf_counter()
+    log.info("🚀 Invoice OCR Backend (production server) - loading models...")
+    load_shared_state()
+    log.info(f"✅ Models loaded in {time.perf_counter() - start:.1f}s, forking {SERVE_WORKERS} worker(s)")
+
+    master_pid = os.getpid()
+    CallbackMetric(
+        "invoice_server_memory_bytes",
+        "Memory of the serve.py master and workers (rss, shared and private part, pss)",
+        "gauge",
+        lambda: _memory_samples(master_pid),
+        labels=("role", "pid", "kind"),
+        aggregate="local",  # every worker sees all processes already
+    )
+    share_metrics(os.path.join(SERVE_STATE_DIR, "metrics"))
+    listener = socket.create_server((SERVE_HOST, SERVE_PORT), backlog=SERVE_WORKERS * (SERVE_THREADS + SERVE_QUEUE))
+    try:
+        Master(listener, SERVE_WORKERS).run()
+    finally:
+        shutil.rmtree(SERVE_STATE_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""
+Telemetry - logging, per-stage timing, Prometheus metrics and process memory
+Log verbosity comes from LOG_LEVEL (debug shows per-page detail and the OCR
+text dumps; the default, info, does not). Metrics are kept in this process
+and rendered in the Prometheus text format for /metrics; OCR workers send
+their stage timings back with each page instead of keeping metrics.
+serve.py workers each write their metrics to a shared directory
+(share_metrics), and /metrics on any of them adds up all the files.
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+log = logging.getLogger("invoice_ocr")
+
+# Latency buckets in seconds (decode/parse are milliseconds, OCR is seconds)
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+CONFIDENCE_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 1.0)
+
+
+def configure_logging(level=None):
+    """Print log records as plain lines (as before) at `level` / LOG_LEVEL"""
+    level = (level or os.environ.get("LOG_LEVEL", "info")).upper()
+    if not log.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        log.addHandler(handler)
+        log.propagate = False
+    log.setLevel(level)
+
+
+configure_logging()
+
+
+@contextmanager
+def span(timings, stage):
+    """Time a block into timings[stage] (seconds, added up); timings may be None"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+    # Across serve.py workers: "sum" every process that ever wrote values,
+    # "livesum" only running ones (gauges), "local" this process's own values
+    aggregate = "sum"
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple((name, labels.get(name, "")) for name in self.label_names)
+
+    def render(self, samples=None):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self.samples() if samples is None else samples:
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, description, labels=()):
+        super().__init__(name, description, labels)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield self.name, key, value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # label key -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, list(state)) for key, state in self._values.items())
+        for key, state in items:
+            for bound, count in zip(self.buckets + (float("inf"),), state[: len(self.buckets)] + [state[-1]]):
+                yield f"{self.name}_bucket", key + (("le", _format_value(float(bound))),), count
+            yield f"{self.name}_sum", key, state[-2]
+            yield f"{self.name}_count", key, state[-1]
+
+
+class CallbackMetric(_Metric):
+    """
+    Values read from elsewhere at scrape time (cache, pool, scheduler stats)
+    collect() returns { (label values...): value }
+    aggregate: see _Metric (default "sum" for counters, "livesum" for gauges)
+    """
+
+    def __init__(self, name, description, kind, collect, labels=(), aggregate=None):
+        super().__init__(name, description, labels)
+        self.kind = kind
+        self.collect = collect
+        self.aggregate = aggregate or ("sum" if kind == "counter" else "livesum")
+
+    def samples(self):
+        for values, value in sorted(self.collect().items()):
+            if value is not None:
+                yield self.name, tuple(zip(self.label_names, values)), value
+
+
+REGISTRY = []
+
+# Directory of per-process metric files (see share_metrics); None = this process only
+_metrics_dir = None
+
+STAGE_SECONDS = Histogram(
+    "invoice_stage_seconds",
+    "Time per page in each pipeline stage",
+    labels=("stage",),
+)
+PAGES = Counter(
+    "invoice_pages_total",
+    "Invoices returned, by where the fields came from (ocr, textLayer, error)",
+    labels=("source",),
+)
+ERRORS = Counter(
+    "invoice_errors_total",
+    "Files or pages that could not be analyzed, by failure kind",
+    labels=("kind",),
+)
+OCR_LINE_CONFIDENCE = Histogram(
+    "invoice_ocr_line_confidence",
+    "OCR confidence of each recognized text line",
+    buckets=CONFIDENCE_BUCKETS,
+)
+INVOICE_CONFIDENCE = Histogram(
+    "invoice_confidence",
+    "Confidence score of each extracted invoice",
+    buckets=CONFIDENCE_BUCKETS,
+)
+OCR_PROFILE_PAGES = Counter(
+    "invoice_ocr_profile_pages_total",
+    "OCR'd pages by the profile that produced the result and whether the cascade escalated them",
+    labels=("profile", "escalated"),
+)
+LAYOUT_TEMPLATE_EVENTS = Counter(
+    "invoice_layout_template_pages_total",
+    "OCR'd pages by what happened with supplier layout templates (matched, missed, evicted, learned)",
+    labels=("event",),
+)
+DUPLICATES = Counter(
+    "invoice_duplicates_total",
+    "Pages recognised as duplicates, by match (image, fields) and action (reused, flagged)",
+    labels=("match", "action"),
+)
+REQUESTS_REJECTED = Counter(
+    "invoice_requests_rejected_total",
+    "Requests the production server (serve.py) turned away, by reason (overloaded, tooLarge, draining)",
+    labels=("reason",),
+)
+ANALYZE_SECONDS = Histogram(
+    "invoice_analyze_seconds",
+    "Duration of /analyze requests (sync) and analysis jobs (async)",
+    labels=("mode",),
+)
+
+
+def process_memory(pid):
+    """
+    Memory of a process in MB from /proc (Linux): RSS split into pages shared
+    with other processes and private ones, and PSS (each shared page divided
+    among the processes using it). None if the process can't be read.
+    """
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if value.strip().endswith("kB"):
+                    fields[key] = int(value.split()[0])
+    except OSError:
+        return None
+
+    def mb(*keys):
+        return round(sum(fields.get(key, 0) for key in keys) / 1024, 1)
+
+    return {
+        "pid": pid,
+        "rssMb": mb("Rss"),
+        "sharedMb": mb("Shared_Clean", "Shared_Dirty"),
+        "privateMb": mb("Private_Clean", "Private_Dirty"),
+        "pssMb": mb("Pss"),
+    }
+
+
+def process_alive(pid):
+    """Whether a process with this pid is running"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # running, as another user
+    return True
+
+
+def child_pids(parent):
+    """Live child processes of a process (scans /proc)"""
+    pids = []
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as f:
+                # pid (comm) state ppid ... - comm may contain spaces or ')'
+                ppid = int(f.read().rpartition(")")[2].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == parent:
+            pids.append(int(name))
+    return sorted(pids)
+
+
+def observe_stages(timings):
+    """Add one page's stage timings (seconds) to the stage histogram"""
+    for stage, seconds in timings.items():
+        STAGE_SECONDS.observe(seconds, stage=stage)
+
+
+def share_metrics(directory):
+    """Add up the metrics of every process that writes to directory (serve.py workers)"""
+    global _metrics_dir
+    os.makedirs(directory, exist_ok=True)
+    _metrics_dir = directory
+
+
+def write_metrics():
+    """Save this process's metric values as <pid>.json in the shared directory"""
+    if _metrics_dir is None:
+        return
+    snapshot = {
+        metric.name: list(metric.samples()) for metric in REGISTRY if metric.aggregate != "local"
+    }
+    path = os.path.join(_metrics_dir, f"{os.getpid()}.json")
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(snapshot, f)
+    os.replace(f"{path}.tmp", path)  # readers see the whole file or the previous one
+
+
+def start_metrics_writer(interval):
+    """write_metrics() every interval seconds, so the other processes see recent values"""
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                write_metrics()
+            except OSError as e:
+                log.warning(f"   ⚠️  Could not write metrics: {e}")
+
+    threading.Thread(target=run, name="metrics-writer", daemon=True).start()
+
+
+def _read_shared_metrics():
+    """[(pid, snapshot)] of every process's metric file, this process first"""
+    snapshots = []
+    for name in os.listdir(_metrics_dir):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(_metrics_dir, name)) as f:
+                snapshots.append((int(name[:-5]), json.load(f)))
+        except (OSError, ValueError):
+            continue  # half-written by a process that died
+    return sorted(snapshots, key=lambda entry: entry[0] != os.getpid())
+
+
+def _added_up(metric, snapshots, alive):
+    """(name, labels, value) samples of a metric, added up over the processes"""
+    totals = {}  # keeps the first process's sample order (histogram buckets)
+    for pid, snapshot in snapshots:
+        if metric.aggregate == "livesum" and not alive(pid):
+            continue
+        for name, labels, value in snapshot.get(metric.name, ()):
+            key = (name, tuple(tuple(label) for label in labels))
+            totals[key] = totals.get(key, 0) + value
+    return [(name, labels, value) for (name, labels), value in totals.items()]
+
+
+def render_metrics():
+    """All registered metrics in the Prometheus text exposition format"""
+    lines = []
+    if _metrics_dir is None:
+        for metric in REGISTRY:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    write_metrics()
+    snapshots = _read_shared_metrics()
+    alive = {pid: process_alive(pid) for pid, _ in snapshots}.get
+    for metric in REGISTRY:
+        if metric.aggregate == "local":
+            lines.extend(metric.render())
+        else:
+            lines.extend(metric.render(_added_up(metric, snapshots, alive)))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,6 @@
+"""Tests import the backend modules the way app.py does: from the backend folder"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,100 @@
+from concurrent.futures import Future
+
+import pytest
+
+from cpu_scheduler import CPUScheduler
+
+
+class Jobs:
+    """start() callbacks whose tasks finish when the test says so"""
+
+    def __init__(self):
+        self.granted = []
+        self.tasks = []
+
+    def start(self, count=1):
+        def start(threads):
+            self.granted.append(threads)
+            tasks = [Future() for _ in range(count)]
+            self.tasks.append(tasks)
+            return tasks
+        return start
+
+    def finish(self, job, result="ok"):
+        for task in self.tasks[job]:
+            task.set_result(result)
+
+
+def test_lone_job_gets_the_budget():
+    scheduler = CPUScheduler(8, max_threads=6)
+    jobs = Jobs()
+    futures = scheduler.schedule(jobs.start(2), count=2)
+    assert jobs.granted == [6]
+    assert scheduler.get_stats()["threadsInUse"] == 6
+
+    jobs.finish(0)
+    assert [f.result() for f in futures] == ["ok", "ok"]
+    stats = scheduler.get_stats()
+    assert (stats["running"], stats["threadsInUse"], stats["completed"]) == (0, 0, 1)
+
+
+def test_jobs_wait_for_a_slot():
+    scheduler = CPUScheduler(4, max_running=2)
+    jobs = Jobs()
+    for _ in range(3):
+        scheduler.schedule(jobs.start())
+    assert jobs.granted == [4]  # alone when admitted; the others wait for threads
+    assert scheduler.get_stats()["waiting"] == 2
+
+    jobs.finish(0)
+    assert jobs.granted == [4, 2, 2]  # freed threads split between the two waiting
+    stats = scheduler.get_stats()
+    assert (stats["running"], stats["waiting"], stats["threadsInUse"]) == (2, 0, 4)
+    assert stats["allocations"] == {"2": 2, "4": 1}
+    assert stats["queued"] == 2
+
+
+def test_min_threads_holds_jobs_back():
+    scheduler = CPUScheduler(4, min_threads=3, max_threads=3)
+    jobs = Jobs()
+    scheduler.schedule(jobs.start())
+    scheduler.schedule(jobs.start())
+    assert jobs.granted == [3]  # one thread left is below min_threads
+
+    jobs.finish(0)
+    assert jobs.granted == [3, 3]
+
+
+def test_failed_start_releases_threads():
+    scheduler = CPUScheduler(2)
+    jobs = Jobs()
+
+    def broken(threads):
+        raise RuntimeError("no model")
+
+    failed = scheduler.schedule(broken)
+    with pytest.raises(RuntimeError):
+        failed[0].result()
+    scheduler.schedule(jobs.start())
+    assert jobs.granted == [2]
+    assert scheduler.get_stats()["failed"] == 1
+
+
+def test_failed_task_is_counted():
+    scheduler = CPUScheduler(2)
+    jobs = Jobs()
+    futures = scheduler.schedule(jobs.start())
+    jobs.tasks[0][0].set_exception(ValueError("bad page"))
+    with pytest.raises(ValueError):
+        futures[0].result()
+    stats = scheduler.get_stats()
+    assert (stats["failed"], stats["threadsInUse"]) == (1, 0)
+
+
+def test_wrong_task_count_fails_the_job():
+    scheduler = CPUScheduler(2)
+    futures = scheduler.schedule(Jobs().start(1), count=2)
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result()
+    assert scheduler.get_stats()["running"] == 0
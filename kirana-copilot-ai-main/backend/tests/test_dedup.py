@@ -0,0 +1,63 @@
+import random
+
+from PIL import Image, ImageDraw
+
+from dedup import HASH_BITS, HashIndex, hamming, phash
+
+
+def flip(page_hash, bits):
+    for bit in bits:
+        page_hash ^= 1 << bit
+    return page_hash
+
+
+def test_search_matches_brute_force():
+    rng = random.Random(7)
+    index = HashIndex(max_distance=8)
+    stored = [rng.getrandbits(HASH_BITS) for _ in range(200)]
+    # Near copies: a few bits off one stored hash, spread over several chunks
+    stored += [flip(stored[i], rng.sample(range(HASH_BITS), rng.randint(1, 12))) for i in range(50)]
+    for number, page_hash in enumerate(stored):
+        index.add(page_hash, number)
+    assert len(index) == len(stored)
+
+    for query in stored[:60] + [rng.getrandbits(HASH_BITS) for _ in range(20)]:
+        expected = sorted(
+            (hamming(query, page_hash), number) for number, page_hash in enumerate(stored)
+            if hamming(query, page_hash) <= 8
+        )
+        found = index.search(query)
+        assert sorted(found) == expected
+        assert [distance for distance, _ in found] == sorted(distance for distance, _ in found)
+
+
+def test_search_distance_is_capped():
+    index = HashIndex(max_distance=4)
+    index.add(0, "a")
+    index.add(flip(0, [1, 100, 200]), "b")
+    assert index.search(0) == [(0, "a"), (3, "b")]
+    assert index.search(0, max_distance=2) == [(0, "a")]
+    assert index.search(0, max_distance=50) == [(0, "a"), (3, "b")]  # never past the index's own limit
+    assert index.search(flip(0, range(5))) == []
+
+
+def page(blocks):
+    image = Image.new("RGB", (600, 800), "white")
+    draw = ImageDraw.Draw(image)
+    for block in blocks:
+        draw.rectangle(block, fill="black")
+    return image
+
+
+TEXT_LINES = [[40, 60 + row * 55, 200 + (row * 37) % 300, 80 + row * 55] for row in range(12)]
+BOXES = [[300, 100 + row * 110, 560, 150 + row * 110] for row in range(6)]
+
+
+def test_phash_survives_rescaling():
+    original = phash(page(TEXT_LINES))
+    assert hamming(original, phash(page(TEXT_LINES).resize((450, 600)))) <= 10
+    assert hamming(original, phash(page(BOXES))) > 40
+
+
+def test_blank_page_has_no_hash():
+    assert phash(Image.new("RGB", (600, 800), "white")) is None
@@ -0,0 +1,139 @@
+import csv
+import io
+import json
+from decimal import Decimal
+
+import pytest
+
+from gstin import gstin_check_char, valid_gstin
+from gstr1 import FLAT_CSV_HEADER, GSTR1Return, flat_csv_row, money
+
+
+def gstin(first14):
+    return first14 + gstin_check_char(first14)
+
+
+SHOP = gstin("29ABCDE1234F1Z")
+BUYER = gstin("27PQRST6789K1Z")
+
+
+def invoice(invoice_no, taxable, cgst=0, sgst=0, igst=0, **fields):
+    total = taxable + cgst + sgst + igst
+    return {"invoiceNo": invoice_no, "date": "05-03-2024", "taxableAmount": taxable,
+            "cgst": cgst, "sgst": sgst, "igst": igst, "total": total, **fields}
+
+
+def sections(report):
+    """CSV sections by title -> data rows (header row dropped)"""
+    found = {}
+    rows = list(csv.reader(io.StringIO("".join(report.iter_csv()))))
+    title = None
+    for row in rows:
+        if len(row) == 1:
+            title = row[0]
+            found[title] = []
+        elif row:
+            found[title].append(row)
+    return {title: rows[1:] for title, rows in found.items()}
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, "0.00"),
+    ("", "0.00"),
+    ("n/a", "0.00"),
+    ("1,234.5", "1234.50"),
+    (0.1 + 0.2, "0.30"),
+    ("2.675", "2.68"),
+    (7, "7.00"),
+])
+def test_money(value, expected):
+    assert money(value) == Decimal(expected)
+
+
+@pytest.mark.parametrize("value", ["NaN", float("inf"), "-Infinity", "1e40"])
+def test_money_rejects(value):
+    with pytest.raises(ValueError):
+        money(value)
+
+
+def test_valid_gstin():
+    assert valid_gstin(SHOP)
+    assert not valid_gstin(SHOP[:14] + ("A" if SHOP[14] != "A" else "B"))
+    assert not valid_gstin("29ABCDE1234F1Z")
+    assert not valid_gstin("")
+    assert not valid_gstin(None)
+
+
+def test_flat_csv_row():
+    row = flat_csv_row(invoice("INV-1", 100.0, cgst=9.0, sgst=9.0, gstin=SHOP))
+    assert FLAT_CSV_HEADER.count(",") == row.count(",")
+    assert row == f"{SHOP},INV-1,05-03-2024,100.0,9.0,9.0,0,118.0"
+
+
+def test_sectioned_csv():
+    report = GSTR1Return(gstin=SHOP)
+    # "gstin" is the supplier's; only buyerGstin makes a B2B invoice
+    report.add(invoice("INV-1", 1000.0, igst=180.0, gstin=SHOP, buyerGstin=BUYER))
+    report.add(invoice("INV-2", 500.0, cgst=45.0, sgst=45.0, gstin=BUYER,
+                       items=[{"hsn": "1006", "qty": 5, "amount": 500.0, "gstRate": 18}]))
+    report.add(invoice("INV-4", 200.0, cgst=18.0, sgst=18.0))
+    report.add(invoice("INV-5", 0.0))  # unreadable page
+
+    found = sections(report)
+    assert found["B2B"] == [[BUYER, "INV-1", "05-03-2024", "1180.00", "27", "18",
+                             "1000.00", "180.00", "0.00", "0.00"]]
+    assert found["B2CS"] == [["INTRA", "29", "18", "700.00", "0.00", "63.00", "63.00"]]
+    assert found["HSN"] == [["1006", "18", "5", "590.00", "500.00", "0.00", "45.00", "45.00"]]
+    # INV-3 is missing from the series
+    assert found["DOCS"] == [["Invoices for outward supply", "INV-1", "INV-4", "4", "1"]]
+
+    summary = report.summary()
+    assert summary["totalInvoices"] == 4
+    assert summary["filedInvoices"] == 3
+    assert summary["skippedInvoices"] == 1
+    assert summary["b2bRecipients"] == 1
+    assert summary["totalTax"] == 306.0
+    assert summary["returnPeriod"] == "032024"
+
+
+def test_portal_json_parses():
+    report = GSTR1Return(gstin=SHOP, period="032024")
+    report.add(invoice("INV-1", 1000.0, igst=180.0, buyerGstin=BUYER))
+    portal = json.loads("".join(report.iter_portal_json()))
+    assert portal["fp"] == "032024"
+    assert portal["b2b"][0]["ctin"] == BUYER
+    assert portal["b2b"][0]["inv"][0]["itms"][0]["itm_det"]["iamt"] == 180.0
+
+
+def copy_of(original, invoice_no, taxable, invoice_id, match="image"):
+    return invoice(invoice_no, taxable, cgst=9.0, sgst=9.0, id=invoice_id,
+                   duplicateOf={"invoiceId": original, "match": match})
+
+
+def test_copy_of_invoice_in_return_is_left_out():
+    report = GSTR1Return(gstin=SHOP)
+    # The copy arrives before its original
+    report.add(copy_of("a", "INV-1", 100.0, "b"))
+    report.add(invoice("INV-1", 100.0, cgst=9.0, sgst=9.0, id="a"))
+
+    summary = report.summary()
+    assert (summary["totalInvoices"], summary["filedInvoices"]) == (2, 1)
+    assert summary["duplicateInvoices"] == 1
+    assert summary["duplicateWarnings"] == []
+    assert summary["totalTaxableAmount"] == 100.0
+
+
+def test_copy_of_earlier_upload_is_filed_with_warning():
+    report = GSTR1Return(gstin=SHOP)
+    report.add(copy_of("stored-id", "INV-7", 100.0, "c", match="fields"))
+    report.add(invoice("INV-8", 50.0, id="d"))
+
+    summary = report.summary()
+    assert summary["filedInvoices"] == 2
+    assert summary["duplicateInvoices"] == 0
+    assert summary["duplicateWarnings"] == [
+        {"invoiceId": "c", "invoiceNo": "INV-7", "duplicateOf": "stored-id", "match": "fields"}
+    ]
+    # Settling again (summary, then CSV) does not file the copy twice
+    list(report.iter_csv())
+    assert report.summary()["filedInvoices"] == 2
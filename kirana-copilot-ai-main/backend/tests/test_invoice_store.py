@@ -0,0 +1,90 @@
+import pytest
+
+from invoice_store import InvoiceStore, validate_changes
+
+
+@pytest.fixture
+def store():
+    store = InvoiceStore(":memory:")
+    yield store
+    store.close()
+
+
+def invoice(invoice_id, date, taxable, tax, **fields):
+    return {"id": invoice_id, "invoiceNo": invoice_id.upper(), "date": date, "gstin": "29abcde1234f1z5",
+            "taxableAmount": taxable, "cgst": tax / 2, "sgst": tax / 2, "igst": 0,
+            "total": taxable + tax, "confidence": 0.95, **fields}
+
+
+def totals(store, period):
+    summary = store.period_summary(period)
+    return summary and (summary["totalInvoices"], summary["totalTaxableAmount"], summary["totalTax"])
+
+
+def test_period_totals_follow_changes(store):
+    store.add_many([
+        invoice("a", "05-03-2024", 100.10, 18.02),
+        invoice("b", "20-03-2024", 200.20, 36.04),
+        invoice("c", "01-04-2024", 50.0, 9.0),
+    ])
+    assert totals(store, "032024") == (2, 300.3, 54.06)
+    assert [p["returnPeriod"] for p in store.periods()] == ["042024", "032024"]
+
+    # A correction moves the amounts, including to another period
+    store.update("b", {"taxableAmount": "1,000", "date": "02-04-2024"})
+    assert totals(store, "032024") == (1, 100.1, 18.02)
+    assert totals(store, "042024") == (2, 1050.0, 45.04)
+    assert store.get("b")["corrected"] is True
+
+    # Saving the same id again replaces it instead of counting it twice
+    store.add_many([invoice("a", "05-03-2024", 10.0, 1.8)])
+    assert totals(store, "032024") == (1, 10.0, 1.8)
+
+    assert store.delete("a") is True
+    assert store.delete("a") is False
+    assert store.period_summary("032024") is None
+    assert [p["returnPeriod"] for p in store.periods()] == ["042024"]
+
+
+def test_update_unknown_invoice(store):
+    assert store.update("missing", {"vendor": "Shop"}) is None
+
+
+def test_bad_update_leaves_totals(store):
+    store.add_many([invoice("a", "05-03-2024", 100.0, 18.0)])
+    with pytest.raises(ValueError):
+        store.update("a", {"total": "NaN"})
+    assert totals(store, "032024") == (1, 100.0, 18.0)
+
+
+def test_find(store):
+    store.add_many([
+        invoice("a", "05-03-2024", 100.0, 18.0),
+        invoice("b", "20-03-2024", 100.0, 18.0, confidence=0.5),
+    ])
+    assert [i["id"] for i in store.find(gstin="29ABCDE1234F1Z5")] == ["a", "b"]
+    assert [i["id"] for i in store.find(band="low")] == ["b"]
+    assert [i["id"] for i in store.find(date_from="2024-03-10")] == ["b"]
+    assert store.find_same("29abcde1234f1z5", "A", 118.0) == "a"
+
+
+def test_validate_changes():
+    assert validate_changes({
+        "total": "1,234.567", "confidence": 1, "date": "29-02-2024", "vendor": "Shop", "id": "ignored",
+    }) == {"total": 1234.57, "confidence": 1.0, "date": "29-02-2024", "vendor": "Shop"}
+
+
+@pytest.mark.parametrize("changes, message", [
+    ({"total": "abc"}, "total"),
+    ({"cgst": True}, "cgst"),
+    ({"igst": None}, "igst"),
+    ({"sgst": float("inf")}, "sgst"),
+    ({"confidence": 1.5}, "confidence"),
+    ({"date": "31-02-2024"}, "date"),
+    ({"date": "2024-03-05"}, "date"),
+    ({"items": "rice"}, "items"),
+    ({"vendor": 5}, "vendor"),
+])
+def test_validate_changes_rejects(changes, message):
+    with pytest.raises(ValueError, match=message):
+        validate_changes(changes)
@@ -0,0 +1,84 @@
+import sqlite3
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from jobs import Job, JobStore, StoredJob
+
+
+@pytest.fixture
+def stores(tmp_path):
+    """Two job stores on one database, like two serve.py workers"""
+    path = str(tmp_path / "jobs.db")
+    first, second = JobStore(path=path), JobStore(path=path)
+    yield first, second
+    first.journal.close()
+    second.journal.close()
+
+
+def test_events_in_completion_order():
+    job = Job()
+    job.start()
+    job.add_result(1, {"invoiceNo": "B"})
+    job.add_result(0, {"invoiceNo": "A"})
+    assert job.set_total(2) is True
+    job.finish("2 invoices")
+    assert [(e["type"], e.get("index")) for e in job.events()] == [
+        ("invoice", 1), ("invoice", 0), ("done", None),
+    ]
+    assert [i["invoiceNo"] for i in job.snapshot()["invoices"]] == ["A", "B"]
+
+
+def test_job_of_another_worker(stores):
+    first, second = stores
+    job = first.create()
+    job.start()
+    job.add_result(1, {"invoiceNo": "B"})
+
+    stored = second.get(job.id)
+    assert isinstance(stored, StoredJob)
+    snapshot = stored.snapshot()
+    assert (snapshot["status"], snapshot["completed"], snapshot["invoices"]) == ("running", 1, [{"invoiceNo": "B"}])
+
+    job.add_result(0, {"invoiceNo": "A"})
+    job.set_total(2)
+    job.finish("2 invoices")
+    snapshot = stored.snapshot()
+    assert snapshot["status"] == "done"
+    assert [i["invoiceNo"] for i in snapshot["invoices"]] == ["A", "B"]
+    assert second.get("unknown") is None
+    assert first.get_stats() == second.get_stats()
+
+
+def test_stream_from_another_worker(stores):
+    first, second = stores
+    job = first.create()
+    job.start()
+    events = StoredJob(second.journal, job.id, poll=0.01).events()
+
+    job.add_result(0, {"invoiceNo": "A"})
+    assert next(events)["invoice"] == {"invoiceNo": "A"}
+
+    def finish():
+        job.add_result(1, {"invoiceNo": "B"})
+        job.set_total(2)
+        job.finish("2 invoices")
+
+    threading.Timer(0.05, finish).start()
+    assert [(e["type"], e.get("index")) for e in events] == [("invoice", 1), ("done", None)]
+
+
+def test_job_of_exited_worker_fails(stores, tmp_path):
+    first, second = stores
+    job = first.create()
+    job.start()
+    exited = subprocess.Popen([sys.executable, "-c", "pass"])
+    exited.wait()
+    with sqlite3.connect(str(tmp_path / "jobs.db")) as conn:
+        conn.execute("UPDATE jobs SET pid = ? WHERE id = ?", (exited.pid, job.id))
+
+    snapshot = second.get(job.id).snapshot()
+    assert snapshot["status"] == "failed"
+    assert "exited" in snapshot["error"]
@@ -0,0 +1,81 @@
+import random
+
+import pytest
+
+from benchmarks.corpus import LAYOUTS, layout_invoice, random_invoice
+from line_items import check_totals, extract_line_items
+
+
+def positioned_lines(ops, rng, jitter=0.8):
+    """Texts and boxes of layout_invoice text operations, positions jittered like a photo"""
+    texts, boxes = [], []
+    for op in ops:
+        if op[0] != "text":
+            continue
+        _, x, y, text, size, _ = op
+        x, y = x + rng.gauss(0, jitter), y + rng.gauss(0, jitter)
+        texts.append(text)
+        boxes.append([x, y, x + 0.5 * size * len(text), y + size])
+    return texts, boxes
+
+
+@pytest.mark.parametrize("layout", LAYOUTS)
+@pytest.mark.parametrize("size", [1, 8, 45])
+def test_items_of_synthetic_invoices(layout, size):
+    rng = random.Random(f"{layout}-{size}")
+    invoice = random_invoice(rng, item_count=size)
+    texts, boxes = positioned_lines(layout_invoice(invoice, layout, rng), rng)
+
+    items, total_row = extract_line_items(texts, boxes)
+    assert [(i["hsn"], i["qty"], i["gstRate"]) for i in items] == [
+        (i["hsn"], i["qty"], i["gstRate"]) for i in invoice["items"]
+    ]
+    assert [i["amount"] for i in items] == pytest.approx([i["amount"] for i in invoice["items"]], abs=0.01)
+    if total_row is not None:  # only the "Sub Total" label is a TOTAL row
+        assert total_row == pytest.approx(invoice["taxableAmount"], abs=0.01)
+
+    tax = invoice["cgst"] + invoice["sgst"] + invoice["igst"]
+    check = check_totals(items, invoice["taxableAmount"], tax, total_row)
+    assert check["lineItems"] == size
+    assert check["matchesTotals"] is True
+
+
+def test_no_table():
+    texts = ["ABC Traders", "GSTIN: 29ABCDE1234F1Z5", "Invoice No: 12", "Date: 01-04-2024",
+             "Total", "1,180.00"]
+    boxes = [[40, 40 + 20 * i, 200, 52 + 20 * i] for i in range(len(texts))]
+    assert extract_line_items(texts, boxes) == ([], None)
+    assert extract_line_items(texts[:3], boxes) == ([], None)
+
+
+def test_amount_from_qty_and_rate():
+    header = ["Item", "HSN", "Qty", "Rate", "Amount"]
+    rows = [
+        ["Rice", "1006", "2", "50.00", "100.00"],
+        ["Oil", "1512", "3", "120.50"],
+        ["Dal", "0713", "1", "90.00", "90.00"],
+    ]
+    texts, boxes = [], []
+    for y, row in enumerate([header] + rows):
+        for x, text in enumerate(row):
+            texts.append(text)
+            boxes.append([100 * x, 20 * y, 100 * x + 40, 20 * y + 10])
+    items, total_row = extract_line_items(texts, boxes)
+    # Oil has no amount cell
+    assert [(i["description"], i["amount"]) for i in items] == [("Rice", 100.0), ("Oil", 361.5), ("Dal", 90.0)]
+    assert total_row is None
+
+
+def test_check_totals():
+    items = [{"amount": 100.0, "gstRate": 18.0}, {"amount": 50.0, "gstRate": 5.0}]
+    assert check_totals(items, 150.0, 20.5) == {
+        "lineItems": 2, "itemsTaxable": 150.0, "itemsTax": 20.5, "matchesTotals": True,
+    }
+    # Per-line rounding is tolerated, a missing item is not
+    assert check_totals(items, 150.6, 20.9)["matchesTotals"] is True
+    assert check_totals(items[:1], 150.0, 20.5)["matchesTotals"] is False
+    assert check_totals(items, 150.0, 20.5, total_row=140.0)["matchesTotals"] is False
+    # Without a rate on every item the tax is not compared
+    unrated = [{"amount": 100.0}, {"amount": 50.0, "gstRate": 5.0}]
+    check = check_totals(unrated, 150.0, 99.0)
+    assert (check["itemsTax"], check["matchesTotals"]) == (2.5, True)
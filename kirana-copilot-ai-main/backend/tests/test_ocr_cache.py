@@ -0,0 +1,73 @@
+from concurrent.futures import Future
+
+from ocr_cache import OCRCache, completed_future, page_key
+
+
+def entry(size):
+    return {"full_text": "x" * size}
+
+
+def test_round_trip(tmp_path):
+    cache = OCRCache(str(tmp_path))
+    key = page_key("abc", 2, "v1")
+    assert cache.get(key) is None
+    cache.put(key, entry(10))
+    assert key in cache
+    assert cache.get(key) == entry(10)
+    # Another process (a new cache on the same directory) finds it too
+    assert OCRCache(str(tmp_path)).get(key) == entry(10)
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = OCRCache(str(tmp_path), max_bytes=250)
+    cache.put("a", entry(100))
+    cache.put("b", entry(100))
+    cache.get("a")  # b is now the least recently used
+    cache.put("c", entry(100))
+    assert cache.get("b") is None
+    assert cache.get("a") == entry(100)
+    assert cache.get("c") == entry(100)
+    stats = cache.get_stats()
+    assert stats["evictions"] == 1
+    assert stats["entries"] == 2
+    assert stats["bytes"] <= 250
+
+
+def test_half_written_entry_is_a_miss(tmp_path):
+    cache = OCRCache(str(tmp_path))
+    (tmp_path / "broken.json").write_text('{"full_text": ')
+    assert cache.get("broken") is None
+
+
+def test_concurrent_misses_share_one_run(tmp_path):
+    cache = OCRCache(str(tmp_path))
+    runs = []
+
+    def submit():
+        runs.append(Future())
+        return runs[-1]
+
+    first = cache.get_or_submit("page", submit)
+    second = cache.get_or_submit("page", submit)
+    assert second is first
+    assert len(runs) == 1
+
+    runs[0].set_result(entry(5))
+    assert first.result() == second.result() == entry(5)
+    assert cache.get_stats()["dedup_waits"] == 1
+    # Stored: the next caller is answered without running anything
+    assert cache.get_or_compute("page", lambda: entry(6)) == entry(5)
+    assert len(runs) == 1
+
+
+def test_failed_run_is_not_cached(tmp_path):
+    cache = OCRCache(str(tmp_path))
+
+    def fail():
+        raise RuntimeError("OCR failed")
+
+    future = cache.get_or_submit("page", lambda: completed_future(fail))
+    assert isinstance(future.exception(), RuntimeError)
+    assert cache.get("page") is None
+    assert cache.get_or_compute("page", lambda: entry(1)) == entry(1)
+
@@ -0,0 +1,38 @@
+import os
+import random
+
+import pytest
+
+pytest.importorskip("easyocr")
+pytest.importorskip("onnxruntime")
+
+from benchmarks.bench_batch import synthetic_page  # noqa: E402
+from benchmarks.parity_backends import FIELDS, run_backend  # noqa: E402
+
+MODEL_DIR = os.environ.get("OCR_MODEL_DIR") or os.path.join(os.path.expanduser("~"), ".EasyOCR", "model")
+# Detector and English recognizer weights; the ONNX exports are built from them
+MODEL_FILES = ("craft_mga.pth", "english_g2.pth")
+
+pytestmark = pytest.mark.skipif(
+    not all(os.path.exists(os.path.join(MODEL_DIR, name)) for name in MODEL_FILES),
+    reason=f"EasyOCR models not found in {MODEL_DIR} (see fetch_models.py)",
+)
+
+
+@pytest.fixture(scope="module")
+def pages():
+    rng = random.Random(0)
+    return [synthetic_page(rng) for _ in range(3)]
+
+
+@pytest.fixture(scope="module")
+def baseline(pages):
+    invoices, _ = run_backend("easyocr", pages, MODEL_DIR)
+    return invoices
+
+
+@pytest.mark.parametrize("backend", ["onnx", "onnx-int8"])
+def test_backend_extracts_same_fields(backend, pages, baseline):
+    invoices, _ = run_backend(backend, pages, MODEL_DIR)
+    for expected, got in zip(baseline, invoices):
+        assert {field: got[field] for field in FIELDS} == {field: expected[field] for field in FIELDS}
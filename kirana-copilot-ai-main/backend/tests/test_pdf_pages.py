@@ -0,0 +1,25 @@
+import pytest
+
+from pdf_pages import parse_page_range, select_pages
+
+
+@pytest.mark.parametrize("spec", [None, "", " all ", "ALL"])
+def test_all_pages(spec):
+    assert parse_page_range(spec) is None
+
+
+def test_ranges():
+    assert parse_page_range("1-3,5,8-") == [(1, 3), (5, 5), (8, None)]
+    assert parse_page_range(" 2 , -4 ") == [(2, 2), (1, 4)]
+    assert parse_page_range(7) == [(7, 7)]
+
+
+@pytest.mark.parametrize("spec", ["0", "3-1", "a", "1-b", ",", "1,,x"])
+def test_bad_ranges(spec):
+    with pytest.raises(ValueError):
+        parse_page_range(spec)
+
+
+def test_select_pages():
+    assert select_pages(None, 3) == [0, 1, 2]
+    assert select_pages(parse_page_range("5,1-2,2,9-"), 6) == [0, 1, 4]
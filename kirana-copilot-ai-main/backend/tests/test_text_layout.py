@@ -0,0 +1,72 @@
+import re
+
+import pytest
+
+from text_layout import TextLayout, parse_value
+
+CGST = re.compile(r"\bCGST\b")
+
+
+def layout(*lines):
+    """(text, x0, y0, x1, y1) per line"""
+    return TextLayout([line[0] for line in lines], [line[1:] for line in lines])
+
+
+def test_value_in_same_line():
+    page = layout(("CGST @9% 45.00", 0, 100, 200, 120))
+    assert page.value_after(CGST) == 45.0
+
+
+def test_value_to_the_right():
+    page = layout(
+        ("CGST 9%", 0, 100, 80, 120),
+        ("1,234.50", 300, 102, 380, 122),
+        ("Grand Total", 0, 140, 100, 160),
+    )
+    assert page.value_after(CGST) == 1234.5
+
+
+def test_value_below():
+    page = layout(
+        ("CGST", 0, 100, 60, 120),
+        ("90.00", 0, 125, 60, 145),
+    )
+    assert page.value_after(CGST) == 90.0
+
+
+def test_lowest_label_wins():
+    page = layout(
+        ("CGST", 0, 10, 60, 30),
+        ("Rate", 100, 10, 160, 30),
+        ("CGST", 0, 300, 60, 320),
+        ("12.00", 200, 300, 260, 320),
+    )
+    assert page.value_after(CGST) == 12.0
+
+
+def test_missing_label_or_value():
+    page = layout(("Total 100", 0, 0, 100, 20), ("CGST 18%", 0, 40, 80, 60))
+    assert page.value_after(re.compile(r"SGST")) is None
+    assert page.value_after(CGST) is None
+
+
+def test_from_ocr_needs_boxes():
+    lines = [("CGST 5.00", 0.9)]
+    assert TextLayout.from_ocr({"lines": lines}) is None
+    page = TextLayout.from_ocr({"lines": lines, "boxes": [[0, 0, 90, 20]]})
+    assert page.value_after(CGST) == 5.0
+
+
+def test_one_box_per_line():
+    with pytest.raises(ValueError):
+        TextLayout(["a", "b"], [[0, 0, 1, 1]])
+
+
+@pytest.mark.parametrize("text, value", [
+    ("Rs. 1,200.50", 1200.5),
+    ("18% 36.00", 36.0),
+    ("INV2023", None),
+    ("", None),
+])
+def test_parse_value(text, value):
+    assert parse_value(text) == value
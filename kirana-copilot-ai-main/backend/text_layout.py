@@ -0,0 +1,229 @@
+"""
+Text Layout - where each OCR line sits on the page
+Boxes are kept in one NumPy array and bucketed into rows, so questions like
+"the number to the right of CGST" are answered by looking at a few
+neighbouring rows instead of scanning the whole text
+"""
+
+import re
+
+import numpy as np
+
+# A number that is not part of a longer token and not a rate ("18%").
+# (?=(...))\1 takes the whole number without backtracking into it (an atomic
+# group; possessive quantifiers need Python 3.11)
+AMOUNT_VALUE = re.compile(r"(?<![\w,])(?<!\d\.)(?=(\d[\d,]*(?:\.\d+)?))\1(?![\w,]|\.\d|\s*%)")
+
+# How far below a label its value may be, in line heights
+BELOW_MAX_ROWS = 2
+
+# Line-item table detection for region-of-interest OCR: a table is a run of
+# at least ROI_TABLE_MIN_ROWS rows with ROI_TABLE_MIN_COLUMNS boxes or more
+ROI_TABLE_MIN_COLUMNS = 4
+ROI_TABLE_MIN_ROWS = 3
+# Without a table: share of the text height kept at the top and bottom
+ROI_HEADER_FRACTION = 0.3
+ROI_TOTALS_FRACTION = 0.35
+
+
+def boxes_array(boxes):
+    """
+    [x0, y0, x1, y1] per line as a float32 (N, 4) array
+    Accepts EasyOCR quadrilaterals ([[x, y] x 4]) or ready boxes
+    """
+    arr = np.asarray(boxes, dtype=np.float32)
+    if arr.size == 0:
+        return np.zeros((0, 4), dtype=np.float32)
+    if arr.ndim == 3:  # quadrilaterals -> axis-aligned boxes
+        arr = np.concatenate([arr.min(axis=1), arr.max(axis=1)], axis=1)
+    return arr.reshape(-1, 4)
+
+
+def row_height(boxes):
+    """Typical line height of an (N, 4) box array"""
+    if len(boxes) == 0:
+        return 1.0
+    return max(float(np.median(boxes[:, 3] - boxes[:, 1])), 1.0)
+
+
+def group_rows(boxes):
+    """
+    Split an (N, 4) box array into visual rows, top to bottom
+    Returns a list of index arrays; a new row starts wherever line centres
+    jump by more than half a line height
+    """
+    if len(boxes) == 0:
+        return []
+    centres = (boxes[:, 1] + boxes[:, 3]) / 2
+    order = np.argsort(centres, kind="stable")
+    breaks = np.flatnonzero(np.diff(centres[order]) > row_height(boxes) / 2) + 1
+    return np.split(order, breaks)
+
+
+def group_by_size(shapes, max_group, tolerance=0.1):
+    """
+    Group image indices whose shapes (height, width, ...) are within
+    `tolerance` of each other, at most max_group per group, so they can be
+    padded to one size for batched detection without much wasted area
+    """
+    order = sorted(range(len(shapes)), key=lambda i: (shapes[i][0], shapes[i][1]))
+    groups = []
+    for i in order:
+        height, width = shapes[i][:2]
+        if groups:
+            group = groups[-1]
+            first_h, first_w = shapes[group[0]][:2]
+            if (
+                len(group) < max_group
+                and height <= first_h * (1 + tolerance)
+                and abs(width - first_w) <= first_w * tolerance
+            ):
+                group.append(i)
+                continue
+        groups.append([i])
+    return groups
+
+
+def select_regions(boxes):
+    """
+    Indices of the detected boxes worth recognizing on an invoice page:
+    the header (vendor, GSTIN, invoice number, date) and the totals block.
+    The line-item table is found as the longest run of rows with many
+    columns; everything above it is header, its last row (usually TOTAL)
+    and everything below it is totals. Pages without such a table keep
+    the top and bottom parts of the text instead.
+    """
+    boxes = boxes_array(boxes)
+    rows = group_rows(boxes)
+    if not rows:
+        return []
+
+    best_start, best_len, start = 0, 0, None
+    for r, members in enumerate(rows + [()]):
+        if len(members) >= ROI_TABLE_MIN_COLUMNS:
+            start = r if start is None else start
+        elif start is not None:
+            if r - start > best_len:
+                best_start, best_len = start, r - start
+            start = None
+
+    if best_len >= ROI_TABLE_MIN_ROWS:
+        keep = rows[:best_start] + rows[best_start + best_len - 1 :]
+    else:
+        centres = (boxes[:, 1] + boxes[:, 3]) / 2
+        top, bottom = float(centres.min()), float(centres.max())
+        span = bottom - top
+        keep = [
+            members
+            for members in rows
+            if centres[members[0]] <= top + span * ROI_HEADER_FRACTION
+            or centres[members[0]] >= bottom - span * ROI_TOTALS_FRACTION
+        ]
+    return sorted(np.concatenate(keep).tolist())
+
+
+def parse_value(text):
+    """First amount in text as a float, or None"""
+    match = AMOUNT_VALUE.search(text)
+    if not match:
+        return None
+    try:
+        return float(match.group(1).replace(",", ""))
+    except ValueError:
+        return None
+
+
+class TextLayout:
+    """
+    Spatial index over the text lines of one page.
+    Lines are bucketed by the row (line-height band) their centre falls in;
+    neighbour queries only look at the buckets next to the label.
+    """
+
+    def __init__(self, texts, boxes):
+        self.texts = list(texts)
+        self.upper = [text.upper() for text in self.texts]
+        self.boxes = boxes_array(boxes)
+        if len(self.boxes) != len(self.texts):
+            raise ValueError("One box per text line is required")
+
+        self.row_height = row_height(self.boxes)
+        centres = (self.boxes[:, 1] + self.boxes[:, 3]) / 2
+        self.rows = np.floor(centres / self.row_height).astype(np.int64)
+
+        self._buckets = {}
+        for i, row in enumerate(self.rows.tolist()):
+            self._buckets.setdefault(row, []).append(i)
+
+    @classmethod
+    def from_ocr(cls, ocr_result):
+        """Layout for an extract_text / text-layer result, or None without boxes"""
+        boxes = ocr_result.get("boxes")
+        lines = ocr_result.get("lines") or []
+        if boxes is None or len(boxes) != len(lines) or not lines:
+            return None
+        return cls([text for text, _ in lines], boxes)
+
+    def __len__(self):
+        return len(self.texts)
+
+    def _near_rows(self, first, last):
+        for row in range(first, last + 1):
+            yield from self._buckets.get(row, ())
+
+    def find(self, pattern):
+        """Indices of lines matching a compiled pattern, bottom of the page first"""
+        found = [i for i, text in enumerate(self.upper) if pattern.search(text)]
+        found.sort(key=lambda i: (-self.boxes[i, 1], -self.boxes[i, 0]))
+        return found
+
+    def right_of(self, index):
+        """Lines on the same row as line `index` and to its right, nearest first"""
+        x0, y0, x1, y1 = self.boxes[index]
+        row = int(self.rows[index])
+        half = (y1 - y0) / 2
+        found = []
+        for i in self._near_rows(row - 1, row + 1):
+            bx0, by0, _, by1 = self.boxes[i]
+            overlap = min(y1, by1) - max(y0, by0)
+            if i != index and bx0 >= x1 - half and overlap >= min(y1 - y0, by1 - by0) / 2:
+                found.append(i)
+        found.sort(key=lambda i: self.boxes[i, 0])
+        return found
+
+    def below(self, index, max_rows=BELOW_MAX_ROWS):
+        """Lines under line `index` that overlap it horizontally, nearest first"""
+        x0, _, x1, y1 = self.boxes[index]
+        row = int(self.rows[index])
+        found = []
+        for i in self._near_rows(row + 1, row + max_rows):
+            bx0, by0, bx1, _ = self.boxes[i]
+            if by0 >= y1 - self.row_height / 2 and min(x1, bx1) > max(x0, bx0):
+                found.append(i)
+        found.sort(key=lambda i: self.boxes[i, 1])
+        return found
+
+    def value_after(self, pattern):
+        """
+        Amount next to a label like "CGST", starting from the lowest line that
+        has it: after the label in the same line, else the nearest line to
+        the right. Only the lowest label also looks at the line below it, so
+        a table header does not pick up the first item row.
+        Returns None if there is no such number.
+        """
+        labels = self.find(pattern)
+        for index in labels:
+            label = pattern.search(self.upper[index])
+            value = parse_value(self.upper[index][label.end():])
+            if value is not None:
+                return value
+            for neighbour in self.right_of(index):
+                value = parse_value(self.upper[neighbour])
+                if value is not None:
+                    return value
+        if labels:
+            for neighbour in self.below(labels[0]):
+                value = parse_value(self.upper[neighbour])
+                if value is not None:
+                    return value
+        return None
@@ -0,0 +1,106 @@
+"""
+Upload Handling - one buffer per invoice file
+Accepts multipart/form-data, raw application/octet-stream and the older
+base64-in-JSON format; every file is decoded at most once
+"""
+
+import base64
+import io
+import mmap
+import shutil
+import tempfile
+
+# Uploads up to this size are kept in memory; bigger ones are spooled to a
+# temp file and memory-mapped instead of being read into RAM
+UPLOAD_SPOOL_BYTES = 1024 * 1024
+
+
+class UploadedFile:
+    """
+    One uploaded invoice file.
+    data is bytes or a read-only mmap; both support slicing for type sniffing,
+    hashing, PIL decoding and PDF rasterization without another copy.
+    """
+
+    def __init__(self, data=None, filename=None, base64_text=None):
+        self.data = data
+        self.filename = filename
+        self._base64_text = base64_text
+
+    @classmethod
+    def from_base64(cls, text):
+        """Legacy JSON upload - decoded lazily so a bad string only fails its own file"""
+        return cls(base64_text=text)
+
+    def load(self):
+        """Return the file contents, decoding base64 uploads once"""
+        if self.data is None:
+            text = self._base64_text
+            # Remove data URL prefix if present
+            if "," in text:
+                text = text.split(",")[1]
+            self.data = base64.b64decode(text)
+            self._base64_text = None
+        return self.data
+
+    @property
+    def is_pdf(self):
+        """Check for the PDF signature"""
+        return self.load()[:4] == b"%PDF"
+
+    def open(self):
+        """File-like view over the buffer (for PIL.Image.open)"""
+        data = self.load()
+        if isinstance(data, mmap.mmap):
+            data.seek(0)
+            return data
+        return io.BytesIO(data)  # shares the bytes object, no copy
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.data = None
+
+
+def buffer_from_stream(stream):
+    """
+    Turn a spooled upload stream into a single buffer:
+    small files as bytes, large ones memory-mapped from their temp file
+    """
+    stream.seek(0, io.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+
+    if size <= UPLOAD_SPOOL_BYTES:
+        return stream.read()
+    try:
+        return mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return stream.read()
+
+
+def uploads_from_json(images):
+    """{ "images": ["base64...", ...] } - the original request format"""
+    return [UploadedFile.from_base64(text) for text in images]
+
+
+def uploads_from_multipart(files):
+    """
+    multipart/form-data - every file part, in form order
+    Werkzeug has already spooled each part to a SpooledTemporaryFile
+    """
+    uploads = []
+    for _, storage in files.items(multi=True):
+        if not storage.filename and not storage.content_length:
+            continue  # empty file input
+        uploads.append(UploadedFile(buffer_from_stream(storage.stream), storage.filename))
+    return uploads
+
+
+def upload_from_stream(stream, filename=None):
+    """Raw application/octet-stream body - one file per request"""
+    spool = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES)
+    shutil.copyfileobj(stream, spool, 1024 * 1024)
+    if spool.tell() == 0:
+        return None
+    return UploadedFile(buffer_from_stream(spool), filename)
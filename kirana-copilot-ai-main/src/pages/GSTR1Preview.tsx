@@ -18,6 +18,7 @@ const GSTR1Preview = () => {
       totalIGST: number;
       totalTax: number;
       totalAmount: number;
+      duplicateWarnings?: { invoiceId: string; invoiceNo: string; duplicateOf: string; match: string }[];
     };
     csvData: string;
   } | null>(null);
@@ -115,6 +116,16 @@ const GSTR1Preview = () => {
         </div>
       </div>
 
+      {/* Possible re-uploads: filed, but the user should check them */}
+      {summary.duplicateWarnings && summary.duplicateWarnings.length > 0 && (
+        <div className="bg-warning/10 border border-warning/30 rounded-xl p-4 mb-6">
+          <p className="text-xs text-foreground font-medium">
+            ⚠️ {summary.duplicateWarnings.length} invoice(s) look like ones uploaded earlier and are included in this
+            report: {summary.duplicateWarnings.map((w) => w.invoiceNo).join(", ")}. Remove any that were already filed.
+          </p>
+        </div>
+      )}
+
       {/* Disclaimer */}
       <div className="bg-warning/10 border border-warning/30 rounded-xl p-4 mb-6">
         <p className="text-xs text-foreground font-medium">
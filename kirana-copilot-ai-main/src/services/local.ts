@@ -16,6 +16,7 @@ export interface InvoiceData {
   igst: number;
   total: number;
   confidence: number;
+  source?: 'ocr' | 'textLayer';  // how the page was read
 }
 
 export interface AnalysisResult {
@@ -32,24 +33,13 @@ export interface GSTR1Data {
     totalIGST: number;
     totalTax: number;
     totalAmount: number;
+    duplicateWarnings?: { invoiceId: string; invoiceNo: string; duplicateOf: string; match: string }[];
   };
   csvData: string;
 }
 
 const BACKEND_URL = 'http://localhost:5000';
 
-/**
- * Convert file to base64
- */
-const fileToBase64 = (file: File): Promise<string> => {
-  return new Promise((resolve, reject) => {
-    const reader = new FileReader();
-    reader.readAsDataURL(file);
-    reader.onload = () => resolve(reader.result as string);
-    reader.onerror = reject;
-  });
-};
-
 /**
  * Check if backend is running
  */
@@ -81,21 +71,16 @@ export const analyzeInvoices = async (files: File[]): Promise<AnalysisResult> =>
       );
     }
 
-    // Convert all files to base64
-    console.log(`Converting ${files.length} files to base64...`);
-    const base64Images = await Promise.all(files.map(file => fileToBase64(file)));
+    // Send raw files as multipart/form-data (no base64 encoding)
+    const formData = new FormData();
+    files.forEach(file => formData.append('files', file, file.name));
     
-    console.log('Sending to Python backend...');
+    console.log(`Sending ${files.length} files to Python backend...`);
     
-    // Send to backend
+    // Send to backend (browser sets the multipart boundary header)
     const response = await fetch(`${BACKEND_URL}/analyze`, {
       method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-      },
-      body: JSON.stringify({
-        images: base64Images
-      }),
+      body: formData,
     });
 
     if (!response.ok) {